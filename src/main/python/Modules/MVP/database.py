@@ -1,11 +1,191 @@
 # -*- coding: utf-8 -*-
 
 import warnings
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from scipy import interpolate
 from ..cython import rpd_calc
 from ..process import deisotoping as diso
 
+# Rows of different lengths stored as concatenated values + per-row offsets (CSR layout): row i is values[offsets[i]:offsets[i + 1]].
+# Memory is proportional to the number of data points (no NaN / zero padding as in ndarray2d).
+class RaggedArray():
+    def __init__(self, values, offsets):
+        self.values = values
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+    @classmethod
+    def from_row_lengths(cls, values, row_lengths):
+        offsets = np.zeros(len(row_lengths) + 1, dtype=np.int64)
+        np.cumsum(row_lengths, out=offsets[1:])
+        return cls(values, offsets)
+    @property
+    def dtype(self):
+        return self.values.dtype
+    @property
+    def shape(self):    # shape of the corresponding ndarray2d
+        return (len(self), int(self.row_lengths().max(initial=0)))
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.offsets.nbytes
+    def __len__(self):
+        return len(self.offsets) - 1
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                raise Exception(f"unsupported slice step: {step}")
+            offsets = self.offsets[start:max(start, stop) + 1]
+            return RaggedArray(self.values[offsets[0]:offsets[-1]], offsets - offsets[0])
+        else:
+            if key < 0:
+                key += len(self)
+            return self.values[self.offsets[key]:self.offsets[key + 1]]
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+    @classmethod
+    def concatenate(cls, ragged_array_list):
+        offsets = [np.zeros(1, dtype=np.int64)]
+        for ragged_array in ragged_array_list:
+            offsets.append(ragged_array.offsets[1:] - ragged_array.offsets[0] + offsets[-1][-1])
+        return cls(np.concatenate([ragged_array.values[ragged_array.offsets[0]:ragged_array.offsets[-1]] for ragged_array in ragged_array_list]), np.concatenate(offsets))
+    def row_lengths(self):
+        return np.diff(self.offsets)
+    def row_sums(self):
+        cumsum = np.zeros(len(self.values) + 1, dtype=np.result_type(self.dtype, np.int64))
+        np.cumsum(self.values, out=cumsum[1:])
+        return cumsum[self.offsets[1:]] - cumsum[self.offsets[:-1]]
+    # columns col_btm <= j <= col_top of each row
+    def take_columns(self, col_btm, col_top):
+        starts = np.minimum(self.offsets[:-1] + col_btm, self.offsets[1:])
+        ends = np.minimum(self.offsets[:-1] + col_top + 1, self.offsets[1:])
+        row_lengths = np.maximum(ends - starts, 0)
+        new_starts = np.cumsum(row_lengths) - row_lengths
+        indices = np.arange(row_lengths.sum()) + np.repeat(starts - new_starts, row_lengths)
+        return RaggedArray.from_row_lengths(self.values[indices], row_lengths)
+    def to_ndarray2d(self, fill_value, columns=None):
+        if columns is None:
+            columns = self.shape[1]
+        array2d = np.full((len(self), columns), fill_value, dtype=self.dtype)
+        array2d[np.arange(columns) < self.row_lengths()[:, np.newaxis]] = self.values
+        return array2d
+
+# mz_set / inten_set stored in row blocks (RT blocks) that are decompressed on first access (see convert_open.load_3_0).
+# Each block is an ndarray2d (padded to the width of the whole array) or a RaggedArray (storage).
+# Decoded blocks are kept in an LRU cache of at most cache_bytes. Blocks modified in place (deisotoping) are pinned.
+# Missing blocks of a range are decoded concurrently by n_workers threads.
+class ChunkedArray():
+    def __init__(self, storage, dtype, row_lengths, chunk_row_starts, load_chunk, cache_bytes, n_workers=1):
+        self.storage = storage
+        self.dtype = np.dtype(dtype)
+        self.scan_lengths = np.asarray(row_lengths)
+        self.chunk_row_starts = np.asarray(chunk_row_starts, dtype=np.int64)  # (N_chunk + 1, )
+        self.load_chunk = load_chunk    # chunk_idx -> ndarray2d or RaggedArray
+        self.cache_bytes = cache_bytes
+        self.n_workers = n_workers
+        self.cache = OrderedDict()      # chunk_idx: ndarray2d or RaggedArray
+        self.pinned_chunk_idx_set = set()
+    @property
+    def shape(self):
+        return (len(self), int(self.scan_lengths.max(initial=0)))
+    @property
+    def nbytes(self):   # decoded blocks only
+        return sum(chunk.nbytes for chunk in self.cache.values())
+    @property
+    def N_chunk(self):
+        return len(self.chunk_row_starts) - 1
+    def __len__(self):
+        return len(self.scan_lengths)
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self[:], dtype=dtype)
+    def get_chunk(self, chunk_idx):
+        chunk = self.cache.get(chunk_idx)
+        if chunk is not None:
+            self.cache.move_to_end(chunk_idx)
+            return chunk
+        return self.put_chunk(chunk_idx, self.load_chunk(chunk_idx))
+    def put_chunk(self, chunk_idx, chunk):
+        self.cache[chunk_idx] = chunk
+        # evict least recently used blocks
+        cache_nbytes = self.nbytes
+        for old_chunk_idx in list(self.cache.keys()):
+            if cache_nbytes <= self.cache_bytes:
+                break
+            if (old_chunk_idx == chunk_idx) or (old_chunk_idx in self.pinned_chunk_idx_set):
+                continue
+            cache_nbytes -= self.cache.pop(old_chunk_idx).nbytes
+        return chunk
+    def get_chunk_idx(self, row):
+        return int(np.searchsorted(self.chunk_row_starts, row, side="right")) - 1
+    # blocks of rows row_btm <= i < row_top (each of them is a part of a single chunk)
+    def iter_blocks(self, row_btm, row_top):
+        if row_btm >= row_top:
+            return
+        chunk_idx_list = list(range(self.get_chunk_idx(row_btm), self.get_chunk_idx(row_top - 1) + 1))
+        missing_chunk_idx_list = [chunk_idx for chunk_idx in chunk_idx_list if chunk_idx not in self.cache]
+        if (self.n_workers > 1) and (len(missing_chunk_idx_list) > 1):
+            with ThreadPoolExecutor(max_workers=self.n_workers) as executor:
+                # decoded in batches of n_workers, so that no more than n_workers blocks are waiting for being used
+                for i in range(0, len(chunk_idx_list), self.n_workers):
+                    batch_chunk_idx_list = [chunk_idx for chunk_idx in chunk_idx_list[i:i + self.n_workers] if chunk_idx not in self.cache]
+                    for chunk_idx, chunk in zip(batch_chunk_idx_list, executor.map(self.load_chunk, batch_chunk_idx_list)):
+                        self.put_chunk(chunk_idx, chunk)
+                    yield from self.iter_blocks_in_chunks(row_btm, row_top, chunk_idx_list[i:i + self.n_workers])
+        else:
+            yield from self.iter_blocks_in_chunks(row_btm, row_top, chunk_idx_list)
+    def iter_blocks_in_chunks(self, row_btm, row_top, chunk_idx_list):
+        for chunk_idx in chunk_idx_list:
+            chunk_row_start = self.chunk_row_starts[chunk_idx]
+            local_btm = max(row_btm - chunk_row_start, 0)
+            local_top = min(row_top, self.chunk_row_starts[chunk_idx + 1]) - chunk_row_start
+            yield self.get_chunk(chunk_idx)[local_btm:local_top]
+    def concatenate(self, block_list):
+        if self.storage == "ndarray2d":
+            return np.concatenate(block_list) if len(block_list) > 0 else np.empty((0, self.shape[1]), dtype=self.dtype)
+        elif self.storage == "ragged":
+            return RaggedArray.concatenate(block_list) if len(block_list) > 0 else RaggedArray(np.empty(0, dtype=self.dtype), [0])
+        else:
+            raise Exception(f"unknown storage: {self.storage}")
+    def __getitem__(self, key):
+        if isinstance(key, tuple):  # ndarray2d only
+            if self.storage != "ndarray2d":
+                raise Exception(f"unsupported index for {self.storage}: {key}")
+            row_key, col_key = key
+            if isinstance(row_key, slice):
+                return self.concatenate([block[:, col_key] for block in self.iter_blocks(*self.get_row_range(row_key))])
+            else:
+                return self[row_key][col_key]
+        elif isinstance(key, slice):
+            return self.concatenate(list(self.iter_blocks(*self.get_row_range(key))))
+        else:
+            if key < 0:
+                key += len(self)
+            chunk_idx = self.get_chunk_idx(key)
+            return self.get_chunk(chunk_idx)[key - self.chunk_row_starts[chunk_idx]]
+    def get_row_range(self, key):
+        start, stop, step = key.indices(len(self))
+        if step != 1:
+            raise Exception(f"unsupported slice step: {step}")
+        return start, max(start, stop)
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+    # row view that remains valid after eviction of other blocks (in-place modification)
+    def get_row_for_update(self, row):
+        chunk_idx = self.get_chunk_idx(row)
+        self.pinned_chunk_idx_set.add(chunk_idx)
+        return self[row]
+    # operations on the whole array (ragged)
+    def row_lengths(self):
+        return self.scan_lengths.copy()
+    def row_sums(self):
+        return np.concatenate([block.row_sums() for block in self.iter_blocks(0, len(self))] + [np.empty(0, dtype=np.int64)])
+    def take_columns(self, col_btm, col_top):
+        return self.concatenate([block.take_columns(col_btm, col_top) for block in self.iter_blocks(0, len(self))])
+    def to_ndarray2d(self, fill_value, columns=None):
+        return self[:].to_ndarray2d(fill_value, columns)
+
 class RPD():
     def __init__(
         self, 
@@ -22,7 +202,11 @@ class RPD():
         analyzer_type, 
         # Info that is not set during the file conversion
         ref_row=None, 
-        mz_set_info_for_chromatogram_extraction=None
+        mz_set_info_for_chromatogram_extraction=None, 
+        scan_lengths=None, 
+        scan_summary=None, 
+        source_data_hash=None, 
+        source_message=None
         # **kwargs
     ):
         # info
@@ -31,9 +215,13 @@ class RPD():
         # data
         self.spectrum_type = spectrum_type
         assert self.spectrum_type in ("discrete", "continuous")
-        self.mz_set = mz_set        # shape: [N_RT, max_count_of_each_scan]
-        self.inten_set = inten_set  # shape: [N_RT, max_count_of_each_scan]
-        self.N_scan = len(self.mz_set)
+        self.mz_set = mz_set        # shape: [N_RT, max_count_of_each_scan] (or RaggedArray)
+        self.inten_set = inten_set  # shape: [N_RT, max_count_of_each_scan] (or RaggedArray)
+        if isinstance(mz_set, ChunkedArray):
+            self.storage = mz_set.storage
+        else:
+            self.storage = "ragged" if isinstance(mz_set, RaggedArray) else "ndarray2d"
+        self.N_scan = len(RT_list)
         # get RT info and etc.
         self.RT_list = RT_list
         self.RT_unit = RT_unit
@@ -44,32 +232,83 @@ class RPD():
         # Info that is not set during the file conversion
         self.ref_row = ref_row
         self.mz_set_info_for_chromatogram_extraction = mz_set_info_for_chromatogram_extraction # (2, N_scan)
+        self.scan_lengths = scan_lengths    # number of points of each scan (known during the file conversion)
+        self.scan_summary = scan_summary    # ScanSummary (saved in v3.1 file, or calculated on first use)
+        self.source_data_hash = source_data_hash    # data_hash of the original file, if upgraded from an older version
+        self.source_message = source_message        # message on opening the original file (e.g. v2.2), if upgraded from an older version
 
         #########################################
         # attributes that are totally unrelated #
         #########################################
         self.inten_info_set_list_subtracted_by_deisotoping = IntenInfoSetList(len(self.RT_list))
+        self.deisotoping_state = 0  # incremented whenever inten_set is modified by deisotoping
     def ref_mz_list(self):
         return self.mz_set[self.ref_row]
     # used when dumping rpd data (required for reversible data compression)
     def get_mz_set_nan_start_locs(self):
+        if self.scan_lengths is not None:
+            unique_row = np.nonzero(self.scan_lengths < self.mz_set.shape[1])[0]
+            return unique_row, self.scan_lengths[unique_row]
         row_info, col_info = np.where(np.isnan(self.mz_set))
         unique_row, r = np.unique(row_info, return_index=True)
         unique_col = col_info[r]
         return unique_row, unique_col
     # used to get information for faster calculation of chromatogram extraction
     def get_mz_set_info_for_chromatogram_extraction(self):
-        for ref_row, mz_list in enumerate(self.mz_set):
+        if self.storage == "ndarray2d":
+            mz_set = np.asarray(self.mz_set)    # ChunkedArray as well
+        elif self.storage == "ragged":
+            mz_set = self.mz_set.to_ndarray2d(np.nan)
+        else:
+            raise Exception(f"unknown storage: {self.storage}")
+        for ref_row, mz_list in enumerate(mz_set):
             if not np.isnan(mz_list).any():
                 break
         else:
             raise Exception("Critical Error!")
-        mz_set_info_for_chromatogram_extraction = self.get_mz_set_info_for_chromatogram_extraction_core(self.mz_set, ref_row)
+        mz_set_info_for_chromatogram_extraction = self.get_mz_set_info_for_chromatogram_extraction_core(mz_set, ref_row)
         return mz_set_info_for_chromatogram_extraction, ref_row
     @staticmethod
     def get_mz_set_info_for_chromatogram_extraction_core(mz_set, ref_row):
-        mz_set_info_for_chromatogram_extraction = np.empty((2, mz_set.shape[1]), dtype=int)
-        for i in range(mz_set.shape[1]):
+        # np.min/np.max propagate np.nan, so that columns including np.nan never bound the extraction range (same as the comparison with np.nan)
+        column_mz_min = mz_set.min(axis=0)
+        column_mz_max = mz_set.max(axis=0)
+        return RPD.get_mz_set_info_for_chromatogram_extraction_from_column_range(mz_set[ref_row], column_mz_min, column_mz_max)
+    # same result as the column-by-column search (get_mz_set_info_for_chromatogram_extraction_from_column_range_loop), from the m/z range of each column.
+    # column_mz_min/max must be np.nan for columns including np.nan (comparison with np.nan is always False as well).
+    @staticmethod
+    def get_mz_set_info_for_chromatogram_extraction_from_column_range(ref_mz_list, column_mz_min, column_mz_max):
+        ref_mz_list = np.asarray(ref_mz_list)
+        N_column = len(ref_mz_list)
+        # searchsorted requires sorted ref_mz_list without np.nan
+        if (N_column == 0) or np.isnan(ref_mz_list).any() or (np.diff(ref_mz_list) < 0).any():
+            return RPD.get_mz_set_info_for_chromatogram_extraction_from_column_range_loop(ref_mz_list, column_mz_min, column_mz_max)
+        idx_list = np.arange(N_column)
+        mz_set_info_for_chromatogram_extraction = np.empty((2, N_column), dtype=int)
+        # btm: 1 + the last column idx < i with column_mz_max[idx] < ref_mz_list[i] (0 if none)
+        # column idx qualifies for every i >= max(idx + 1, first i with ref_mz_list[i] > column_mz_max[idx])
+        i_from = np.searchsorted(ref_mz_list, column_mz_max, side="right")
+        i_from[np.isnan(column_mz_max)] = N_column
+        i_from = np.maximum(i_from, idx_list + 1)
+        is_valid = i_from < N_column
+        last_idx = np.full(N_column, -1, dtype=int)
+        np.maximum.at(last_idx, i_from[is_valid], idx_list[is_valid])
+        mz_set_info_for_chromatogram_extraction[0] = np.maximum.accumulate(last_idx) + 1
+        # top: the first column idx > i with ref_mz_list[i] < column_mz_min[idx], minus 1 (N_column - 1 if none)
+        # column idx qualifies for every i < min(idx, first i with ref_mz_list[i] >= column_mz_min[idx])
+        i_to = np.searchsorted(ref_mz_list, column_mz_min, side="left")
+        i_to[np.isnan(column_mz_min)] = 0
+        i_to = np.minimum(i_to, idx_list)
+        is_valid = i_to > 0
+        first_idx = np.full(N_column, N_column, dtype=int)
+        np.minimum.at(first_idx, i_to[is_valid] - 1, idx_list[is_valid])
+        mz_set_info_for_chromatogram_extraction[1] = np.minimum.accumulate(first_idx[::-1])[::-1] - 1
+        return mz_set_info_for_chromatogram_extraction
+    @staticmethod
+    def get_mz_set_info_for_chromatogram_extraction_from_column_range_loop(ref_mz_list, column_mz_min, column_mz_max):
+        N_column = len(ref_mz_list)
+        mz_set_info_for_chromatogram_extraction = np.empty((2, N_column), dtype=int)
+        for i in range(N_column):
             # btm
             j = 1
             while True:
@@ -77,7 +316,7 @@ class RPD():
                 if idx_btm < 0:
                     mz_set_info_for_chromatogram_extraction[0, i] = 0
                     break
-                if (mz_set[:, idx_btm] < mz_set[ref_row, i]).all():
+                if column_mz_max[idx_btm] < ref_mz_list[i]:
                     mz_set_info_for_chromatogram_extraction[0, i] = idx_btm + 1
                     break
                 else:
@@ -86,10 +325,10 @@ class RPD():
             j = 1
             while True:
                 idx_top = i + j
-                if idx_top > mz_set.shape[1] - 1:
-                    mz_set_info_for_chromatogram_extraction[1, i] = mz_set.shape[1] - 1
+                if idx_top > N_column - 1:
+                    mz_set_info_for_chromatogram_extraction[1, i] = N_column - 1
                     break
-                if (mz_set[ref_row, i] < mz_set[:, idx_top]).all():
+                if ref_mz_list[i] < column_mz_min[idx_top]:
                     mz_set_info_for_chromatogram_extraction[1, i] = idx_top - 1
                     break
                 else:
@@ -111,9 +350,14 @@ class RPD():
     # chromatgram extraction related functions
     def extract_chromatogram(self, mz_btm, mz_top):
         # inten_list = self.extract_chromatogram_core(mz_btm, mz_top, self.mz_set, self.inten_set)
-        inten_list = self.extract_chromatogram_core_with_cython(mz_btm, mz_top)
+        inten_list = self.get_precomputed_TIC(mz_btm, mz_top)
+        if inten_list is None:
+            inten_list = self.extract_chromatogram_core_with_cython(mz_btm, mz_top)
         return (self.RT_list, inten_list), self.calc_chromatogram_b4_deisotoping(mz_btm, mz_top, inten_list)
     def extract_chromatogram_fast(self, mz_btm, mz_top): # inaccurate, but ignorable for Q-TOF data
+        inten_list = self.get_precomputed_TIC(mz_btm, mz_top)
+        if inten_list is not None:
+            return (self.RT_list, inten_list), self.calc_chromatogram_b4_deisotoping(mz_btm, mz_top, inten_list)
         # self.ref_row において、基準となる idx を求める
         mz_btm_idx_on_ref_row = max(rpd_calc.index_greater_than(mz_btm, self.ref_mz_list()) - 1, 0)
         mz_top_idx_on_ref_row = min(rpd_calc.index_greater_than(mz_top, self.ref_mz_list())    , self.mz_set.shape[1] - 1)
@@ -121,9 +365,61 @@ class RPD():
         mz_btm_idx = self.mz_set_info_for_chromatogram_extraction[0, mz_btm_idx_on_ref_row]
         mz_top_idx = self.mz_set_info_for_chromatogram_extraction[1, mz_top_idx_on_ref_row]
         # extracted_mz_set = self.mz_set[:, mz_btm_idx:mz_top_idx + 1]
-        extracted_inten_set = self.inten_set[:, mz_btm_idx:mz_top_idx + 1]
-        inten_list = np.nansum(extracted_inten_set, axis=1)
+        if self.storage == "ndarray2d":
+            extracted_inten_set = self.inten_set[:, mz_btm_idx:mz_top_idx + 1]
+            inten_list = np.nansum(extracted_inten_set, axis=1, dtype=np.int64)  # signed even if inten_set is unsigned (e.g. uint16)
+        elif self.storage == "ragged":
+            inten_list = self.inten_set.take_columns(mz_btm_idx, mz_top_idx).row_sums()
+        else:
+            raise Exception(f"unknown storage: {self.storage}")
         return (self.RT_list, inten_list), self.calc_chromatogram_b4_deisotoping(mz_btm, mz_top, inten_list)
+    # TIC ((mz_btm, mz_top) = (0, np.inf)) from scan_summary, without mz_set / inten_set. None for other ranges, or after deisotoping (inten_set is modified).
+    def get_precomputed_TIC(self, mz_btm, mz_top):
+        if (mz_btm <= 0) and (mz_top == np.inf) and self.inten_info_set_list_subtracted_by_deisotoping.is_empty():
+            return self.get_scan_summary().TIC.copy()
+        return None
+    def extract_base_peak_chromatogram(self):
+        if self.inten_info_set_list_subtracted_by_deisotoping.is_empty():
+            scan_summary = self.get_scan_summary()
+        else:
+            scan_summary = self.calc_scan_summary()
+        return (self.RT_list, scan_summary.BPC.copy()), scan_summary.base_peak_mz.copy()
+    def get_scan_summary(self):
+        if self.scan_summary is None:
+            self.scan_summary = self.calc_scan_summary()
+        return self.scan_summary
+    def calc_scan_summary(self):
+        mz_top_idx = max(self.mz_set.shape[1] - 1, 0)
+        return ScanSummary.concatenate([
+            self.calc_scan_summary_of_block(mz_block, inten_block, mz_top_idx) for mz_block, inten_block in self.iter_row_blocks()
+        ])
+    def calc_scan_summary_of_block(self, mz_block, inten_block, mz_top_idx):
+        # TIC: same kernel as extract_chromatogram, so that the values are identical
+        TIC = self.extract_chromatogram_core_in_columns_of_block(0.0, np.inf, mz_block, inten_block, 0, mz_top_idx)
+        if self.storage == "ndarray2d":
+            pass
+        elif self.storage == "ragged":
+            mz_block, inten_block = mz_block.to_ndarray2d(np.nan), inten_block.to_ndarray2d(0)
+        else:
+            raise Exception(f"unknown storage: {self.storage}")
+        is_point = ~np.isnan(mz_block)
+        N_point = is_point.sum(axis=1)
+        BPC = np.full(len(mz_block), np.nan)
+        base_peak_mz = np.full(len(mz_block), np.nan)
+        if mz_block.shape[1] > 0:
+            masked_inten_block = np.where(is_point, inten_block, -np.inf)
+            base_peak_idx = masked_inten_block.argmax(axis=1)
+            row_idx = np.nonzero(N_point > 0)[0]
+            BPC[row_idx] = masked_inten_block[row_idx, base_peak_idx[row_idx]]
+            base_peak_mz[row_idx] = mz_block[row_idx, base_peak_idx[row_idx]]
+        return ScanSummary(TIC, BPC, base_peak_mz, N_point)
+    # (mz_block, inten_block) of block_size rows (or of each chunk), so that the whole mz_set / inten_set is never copied
+    def iter_row_blocks(self, block_size=256):
+        if isinstance(self.mz_set, ChunkedArray):
+            yield from zip(self.mz_set.iter_blocks(0, self.N_scan), self.inten_set.iter_blocks(0, self.N_scan))
+        else:
+            for row_btm in range(0, self.N_scan, block_size):
+                yield self.mz_set[row_btm:row_btm + block_size], self.inten_set[row_btm:row_btm + block_size]
     # @staticmethod
     # def extract_chromatogram_core(mz_btm, mz_top, mz_set, inten_set):
     #     # For TIC, pass (mz_btm, mz_top) = (0, np.inf) as args.
@@ -141,15 +437,45 @@ class RPD():
             # 基準となる idx を元に、（予め計算しておいた mz_ref_info_for... に基づいて）探索範囲の idx を取得する
             mz_btm_idx = self.mz_set_info_for_chromatogram_extraction[0, mz_btm_idx_on_ref_row]
             mz_top_idx = self.mz_set_info_for_chromatogram_extraction[1, mz_top_idx_on_ref_row]
-            extracted_mz_set = self.mz_set[:, mz_btm_idx:mz_top_idx + 1]
-            extracted_inten_set = self.inten_set[:, mz_btm_idx:mz_top_idx + 1]
         elif self.spectrum_type == "discrete":
-            extracted_mz_set = self.mz_set
-            extracted_inten_set = self.inten_set
+            mz_btm_idx = 0
+            mz_top_idx = self.mz_set.shape[1] - 1
         # 上記探索範囲の idx を元にデータをを切り出し -> 漸く chromatogram_extraction が行える
-        inten_list = rpd_calc.extract_chromatogram_core_float64int32(mz_btm, mz_top, extracted_mz_set, extracted_inten_set)
+        inten_list = self.extract_chromatogram_core_in_columns(mz_btm, mz_top, 0, self.N_scan, mz_btm_idx, mz_top_idx)
         # inten_list = self.extract_chromatogram_core(mz_btm, mz_top, extracted_mz_set, extracted_inten_set)
         return inten_list
+    # rows: RT_idx_btm <= i < RT_idx_top, columns: mz_btm_idx <= j <= mz_top_idx
+    def extract_chromatogram_core_in_columns(self, mz_btm, mz_top, RT_idx_btm, RT_idx_top, mz_btm_idx, mz_top_idx):
+        if isinstance(self.mz_set, ChunkedArray):
+            # block by block, so that the whole mz_set / inten_set is never concatenated
+            return np.concatenate([
+                self.extract_chromatogram_core_in_columns_of_block(mz_btm, mz_top, mz_block, inten_block, mz_btm_idx, mz_top_idx) 
+                for mz_block, inten_block in zip(self.mz_set.iter_blocks(RT_idx_btm, RT_idx_top), self.inten_set.iter_blocks(RT_idx_btm, RT_idx_top))
+            ] + [np.empty(0)])
+        return self.extract_chromatogram_core_in_columns_of_block(
+            mz_btm, mz_top, self.mz_set[RT_idx_btm:RT_idx_top], self.inten_set[RT_idx_btm:RT_idx_top], mz_btm_idx, mz_top_idx
+        )
+    def extract_chromatogram_core_in_columns_of_block(self, mz_btm, mz_top, mz_block, inten_block, mz_btm_idx, mz_top_idx):
+        if self.storage == "ndarray2d":
+            extracted_mz_set = mz_block[:, mz_btm_idx:mz_top_idx + 1]
+            extracted_inten_set = inten_block[:, mz_btm_idx:mz_top_idx + 1]
+            return rpd_calc.extract_chromatogram_core(mz_btm, mz_top, extracted_mz_set, extracted_inten_set)
+        elif self.storage == "ragged":
+            return rpd_calc.extract_chromatogram_core_csr(
+                mz_btm, mz_top, mz_block.values, inten_block.values, mz_block.offsets, mz_btm_idx, mz_top_idx
+            )
+        else:
+            raise Exception(f"unknown storage: {self.storage}")
+    # values of rows RT_idx_btm <= i < RT_idx_top and columns mz_btm_idx <= j <= mz_top_idx, flattened.
+    # The extracted window of RaggedArray is padded as ndarray2d (np.nan for mz, 0 for inten), since calc_mz_inten_list_average assumes aligned columns.
+    def flatten_in_columns(self, array_set, RT_idx_btm, RT_idx_top, mz_btm_idx, mz_top_idx):
+        if self.storage == "ndarray2d":
+            return array_set[RT_idx_btm:RT_idx_top, mz_btm_idx:mz_top_idx + 1].reshape(-1)
+        elif self.storage == "ragged":
+            fill_value = np.nan if array_set is self.mz_set else 0
+            return array_set[RT_idx_btm:RT_idx_top].take_columns(mz_btm_idx, mz_top_idx).to_ndarray2d(fill_value, columns=mz_top_idx - mz_btm_idx + 1).reshape(-1)
+        else:
+            raise Exception(f"unknown storage: {self.storage}")
     def calc_chromatogram_b4_deisotoping(self, mz_btm, mz_top, inten_list_after_subtraction):
         return self.inten_info_set_list_subtracted_by_deisotoping.extract_chromatogram_b4_subtraction(mz_btm, mz_top, inten_list_after_subtraction)
     def extract_spectrum(self, RT_btm, RT_top):
@@ -160,17 +486,24 @@ class RPD():
     def extract_spectrum_fast(self, RT_btm, RT_top):
         RT_idx_btm = max(rpd_calc.index_greater_than(threshold=RT_btm, array1d=self.RT_list) - 1, 0)
         RT_idx_top = min(rpd_calc.index_greater_than(threshold=RT_top, array1d=self.RT_list)    , len(self.RT_list) - 1)
-        inten_set = self.inten_set[RT_idx_btm:RT_idx_top]
-        mz_set = self.mz_set[RT_idx_btm:RT_idx_top]
+        if self.storage == "ndarray2d":
+            inten_set = self.inten_set[RT_idx_btm:RT_idx_top]
+            mz_set = self.mz_set[RT_idx_btm:RT_idx_top]
+        elif self.storage == "ragged":
+            inten_set = self.inten_set[RT_idx_btm:RT_idx_top].to_ndarray2d(0, columns=self.inten_set.shape[1])
+            mz_set = self.mz_set[RT_idx_btm:RT_idx_top].to_ndarray2d(np.nan, columns=self.mz_set.shape[1])
+        else:
+            raise Exception(f"unknown storage: {self.storage}")
         mz_list = mz_set.mean(axis=0)
         inten_list = inten_set.mean(axis=0)
         return (mz_list, inten_list), self.extract_spectrum_b4_deisotoping_fast(RT_idx_btm, RT_idx_top, mz_list, inten_list)
     def extract_spectrum_default(self, RT_idx_btm, RT_idx_top):
         # extract data
-        inten_set = self.inten_set[RT_idx_btm:RT_idx_top]
-        mz_set = self.mz_set[RT_idx_btm:RT_idx_top]
+        N_column = self.mz_set.shape[1]
+        mz_list = self.flatten_in_columns(self.mz_set, RT_idx_btm, RT_idx_top, 0, N_column - 1)
+        inten_list = self.flatten_in_columns(self.inten_set, RT_idx_btm, RT_idx_top, 0, N_column - 1)
         # get target data, calc average
-        return self.calc_mz_inten_list_average(mz_set.reshape(-1), inten_set.reshape(-1), RT_idx_top - RT_idx_btm)
+        return self.calc_mz_inten_list_average(mz_list, inten_list, RT_idx_top - RT_idx_btm)
     def extract_spectrum_b4_deisotoping(self, RT_idx_btm, RT_idx_top, mz_list, inten_list):
         subtracted_mz_list, subtracted_inten_list = self.inten_info_set_list_subtracted_by_deisotoping.extract_as_spectrum(RT_idx_btm, RT_idx_top)
         return subtracted_mz_list, subtracted_inten_list + np.interp(subtracted_mz_list, mz_list, inten_list)
@@ -201,15 +534,109 @@ class RPD():
         RT_top, 
         calc_minimum_info, 
     ):
-        RT_idx_btm = rpd_calc.index_greater_than(threshold=RT_btm, array1d=self.RT_list)
-        RT_idx_top = rpd_calc.index_greater_than(threshold=RT_top, array1d=self.RT_list)
-        if RT_idx_top - RT_idx_btm < 2:
-            return None
+        return self.calc_chromatogram_auc_list([(mz_btm, mz_top, RT_btm, RT_top)], calc_minimum_info)[0]
+    # calc_chromatogram_auc for each window of window_array ((N_window, 4) of mz_btm, mz_top, RT_btm, RT_top).
+    # Chromatograms of all windows are extracted in a single pass over the rows (cf. extract_chromatograms_core_in_windows).
+    def calc_chromatogram_auc_list(self, window_array, calc_minimum_info, num_threads=1):
+        window_array = np.asarray(window_array, dtype=np.float64).reshape(-1, 4)
+        RT_idx_btm_list = rpd_calc.index_greater_than_array(threshold_list=window_array[:, 2], array1d=self.RT_list)
+        RT_idx_top_list = rpd_calc.index_greater_than_array(threshold_list=window_array[:, 3], array1d=self.RT_list)
+        is_valid = RT_idx_top_list - RT_idx_btm_list >= 2
+        # columns of the m/z profile used for "mz peaktop" (continuous only)
+        if (not calc_minimum_info) and (self.spectrum_type == "continuous"):
+            mz_btm_idx_list, mz_top_idx_list = self.get_mz_idx_range_list(window_array[is_valid, 0], window_array[is_valid, 1])
+        else:
+            mz_btm_idx_list = np.zeros(is_valid.sum(), dtype=np.int64)
+            mz_top_idx_list = mz_btm_idx_list - 1
+        extracted = self.extract_chromatograms_core_in_windows(
+            window_array[is_valid, 0], window_array[is_valid, 1], RT_idx_btm_list[is_valid], RT_idx_top_list[is_valid], mz_btm_idx_list, mz_top_idx_list, num_threads
+        )
+        result_values, result_peak_inten, result_peak_mz, result_offsets, profile_mz_sum, profile_mz_count, profile_inten_sum, profile_offsets = extracted
+        is_deisotoped = not self.inten_info_set_list_subtracted_by_deisotoping.is_empty()
+        r_list = []
+        for (mz_btm, mz_top), RT_idx_btm, RT_idx_top, w in zip(window_array[:, :2].tolist(), RT_idx_btm_list.tolist(), RT_idx_top_list.tolist(), np.cumsum(is_valid) - 1):
+            if RT_idx_top - RT_idx_btm < 2:
+                r_list.append(None)
+                continue
+            result_slice = slice(result_offsets[w], result_offsets[w + 1])
+            profile_slice = slice(profile_offsets[w], profile_offsets[w + 1])
+            r_list.append(self.calc_chromatogram_auc_from_chromatogram(
+                RT_idx_btm, RT_idx_top, 
+                result_values[result_slice], result_peak_inten[result_slice], result_peak_mz[result_slice], 
+                profile_mz_sum[profile_slice], profile_mz_count[profile_slice], profile_inten_sum[profile_slice], 
+                calc_minimum_info, is_deisotoped
+            ))
+        return r_list
+    # columns (mz_btm_idx <= j <= mz_top_idx) that include mz_btm <= mz <= mz_top in every row (continuous only, cf. extract_chromatogram_fast)
+    def get_mz_idx_range_list(self, mz_btm_list, mz_top_list):
+        ref_mz_list = self.ref_mz_list()
+        # self.ref_row において、基準となる idx を求める
+        mz_btm_idx_on_ref_row = np.maximum(rpd_calc.index_greater_than_array(threshold_list=mz_btm_list, array1d=ref_mz_list) - 1, 0)
+        mz_top_idx_on_ref_row = np.minimum(rpd_calc.index_greater_than_array(threshold_list=mz_top_list, array1d=ref_mz_list)    , self.mz_set.shape[1] - 1)
+        # 基準となる idx を元に、（予め計算しておいた mz_ref_info_for... に基づいて）探索範囲の idx を取得する
+        mz_btm_idx_list = self.mz_set_info_for_chromatogram_extraction[0, mz_btm_idx_on_ref_row].astype(np.int64)
+        mz_top_idx_list = self.mz_set_info_for_chromatogram_extraction[1, mz_top_idx_on_ref_row].astype(np.int64)
+        return mz_btm_idx_list, mz_top_idx_list
+    # chromatograms of windows w (mz_btm_list[w] <= mz <= mz_top_list[w], RT_idx_btm_list[w] <= i < RT_idx_top_list[w]) over the whole columns, in a single pass over the rows.
+    # The chromatogram of window w is result_values[result_offsets[w]:result_offsets[w + 1]] (same as extract_chromatogram_core_in_columns),
+    # and the intensity / m/z of the most intense point of each row in the window are result_peak_inten / result_peak_mz (np.nan for rows without points).
+    # The m/z profile of columns mz_btm_idx_list[w] <= j <= mz_top_idx_list[w] is profile_*[profile_offsets[w]:profile_offsets[w + 1]] (cf. rpd_calc.accumulate_mz_profiles).
+    # Each block of rows is read once for all windows.
+    def extract_chromatograms_core_in_windows(self, mz_btm_list, mz_top_list, RT_idx_btm_list, RT_idx_top_list, mz_btm_idx_list, mz_top_idx_list, num_threads=1):
+        mz_btm_list = np.ascontiguousarray(mz_btm_list, dtype=np.float64)
+        mz_top_list = np.ascontiguousarray(mz_top_list, dtype=np.float64)
+        RT_idx_btm_list = np.ascontiguousarray(RT_idx_btm_list, dtype=np.int64)
+        RT_idx_top_list = np.maximum(RT_idx_top_list, RT_idx_btm_list).astype(np.int64)
+        mz_btm_idx_list = np.ascontiguousarray(mz_btm_idx_list, dtype=np.int64)
+        mz_top_idx_list = np.maximum(mz_top_idx_list, mz_btm_idx_list - 1).astype(np.int64)
+        result_offsets = np.zeros(len(mz_btm_list) + 1, dtype=np.int64)
+        np.cumsum(RT_idx_top_list - RT_idx_btm_list, out=result_offsets[1:])
+        profile_offsets = np.zeros(len(mz_btm_list) + 1, dtype=np.int64)
+        np.cumsum(mz_top_idx_list - mz_btm_idx_list + 1, out=profile_offsets[1:])
+        result_values = np.empty(result_offsets[-1], dtype=np.float64)
+        result_peak_inten = np.empty(result_offsets[-1], dtype=np.float64)
+        result_peak_mz = np.empty(result_offsets[-1], dtype=np.float64)
+        profile_mz_sum = np.zeros(profile_offsets[-1], dtype=np.float64)
+        profile_mz_count = np.zeros(profile_offsets[-1], dtype=np.int64)
+        profile_inten_sum = np.zeros(profile_offsets[-1], dtype=np.float64)
+        extracted = (result_values, result_peak_inten, result_peak_mz, result_offsets, profile_mz_sum, profile_mz_count, profile_inten_sum, profile_offsets)
+        if result_offsets[-1] == 0:
+            return extracted
+        window_order = np.argsort(mz_btm_list, kind="stable").astype(np.int64)
+        window_args = (mz_btm_list, mz_top_list, RT_idx_btm_list, RT_idx_top_list, window_order, result_offsets)
+        result_args = (result_values, result_peak_inten, result_peak_mz, num_threads)
+        # only the windows with columns for the m/z profile
+        is_profile = mz_top_idx_list >= mz_btm_idx_list
+        profile_window_args = (RT_idx_btm_list[is_profile], RT_idx_top_list[is_profile], mz_btm_idx_list[is_profile], mz_top_idx_list[is_profile], profile_offsets[:-1][is_profile])
+        profile_result_args = (profile_mz_sum, profile_mz_count, profile_inten_sum, num_threads)
+        # rows used by any of the windows
+        row_btm = int(RT_idx_btm_list.min())
+        row_top = int(RT_idx_top_list.max())
+        if isinstance(self.mz_set, ChunkedArray):
+            block_list = zip(self.mz_set.iter_blocks(row_btm, row_top), self.inten_set.iter_blocks(row_btm, row_top))
+        else:
+            block_list = [(self.mz_set[row_btm:row_top], self.inten_set[row_btm:row_top])]
+        row_offset = row_btm
+        for mz_block, inten_block in block_list:
+            if self.storage == "ndarray2d":
+                rpd_calc.extract_chromatograms_core(*window_args, mz_block, inten_block, row_offset, *result_args)
+                if is_profile.any():
+                    rpd_calc.accumulate_mz_profiles(*profile_window_args, mz_block, inten_block, row_offset, *profile_result_args)
+            elif self.storage == "ragged":
+                rpd_calc.extract_chromatograms_core_csr(*window_args, mz_block.values, inten_block.values, mz_block.offsets, row_offset, *result_args)
+                if is_profile.any():
+                    rpd_calc.accumulate_mz_profiles_csr(*profile_window_args, mz_block.values, inten_block.values, mz_block.offsets, row_offset, *profile_result_args)
+            else:
+                raise Exception(f"unknown storage: {self.storage}")
+            row_offset += len(mz_block)
+        return extracted
+    def calc_chromatogram_auc_from_chromatogram(
+        self, RT_idx_btm, RT_idx_top, 
+        extracted_inten_list_RT, extracted_peak_inten_list, extracted_peak_mz_list, 
+        profile_mz_sum, profile_mz_count, profile_inten_sum, 
+        calc_minimum_info, is_deisotoped
+    ):
         extracted_RT_list = self.RT_list[RT_idx_btm:RT_idx_top]
-        extracted_mz_set = self.mz_set[RT_idx_btm:RT_idx_top, :]
-        extracted_inten_set = self.inten_set[RT_idx_btm:RT_idx_top, :]
-        extracted_inten_list_RT = rpd_calc.extract_chromatogram_core_float64int32(mz_btm, mz_top, extracted_mz_set, extracted_inten_set)
-        # extracted_inten_list_RT = self.extract_chromatogram_core(mz_btm, mz_top, extracted_mz_set, extracted_inten_set)
         auc = self.calc_auc_core(extracted_RT_list, extracted_inten_list_RT)
         # generate result
         r = {"area":auc}
@@ -217,23 +644,22 @@ class RPD():
             BG = extracted_inten_list_RT.min() * (extracted_RT_list[-1] - extracted_RT_list[0])
 
             if self.spectrum_type == "continuous":
-                # self.ref_row において、基準となる idx を求める
-                mz_btm_idx_on_ref_row = max(rpd_calc.index_greater_than(mz_btm, self.ref_mz_list()) - 1, 0)
-                mz_top_idx_on_ref_row = min(rpd_calc.index_greater_than(mz_top, self.ref_mz_list())    , self.mz_set.shape[1] - 1)
-                # 基準となる idx を元に、（予め計算しておいた mz_ref_info_for... に基づいて）探索範囲の idx を取得する
-                mz_btm_idx = self.mz_set_info_for_chromatogram_extraction[0, mz_btm_idx_on_ref_row]
-                mz_top_idx = self.mz_set_info_for_chromatogram_extraction[1, mz_top_idx_on_ref_row]
-                # extracted_mz_set = self.mz_set[:, mz_btm_idx:mz_top_idx + 1]
-                extracted_inten_set2 = extracted_inten_set[:, mz_btm_idx:mz_top_idx + 1]
-                extracted_mz_set2 = extracted_mz_set[:, mz_btm_idx:mz_top_idx + 1]
+                # m/z of the maximum of the spectrum averaged over the RT range, in the columns around the window
+                if len(profile_inten_sum) == 0:
+                    peaktop_mz = np.nan
+                else:
+                    profile_argmax = np.argmax(profile_inten_sum)
+                    peaktop_mz = profile_mz_sum[profile_argmax] / profile_mz_count[profile_argmax] if profile_mz_count[profile_argmax] > 0 else np.nan
             elif self.spectrum_type == "discrete":
-                extracted_inten_set2 = extracted_inten_set
-                extracted_mz_set2 = extracted_mz_set
-            extracted_mz_list, extracted_inten_list_mz = self.calc_mz_inten_list_average(extracted_mz_set2.reshape(-1), extracted_inten_set2.reshape(-1), RT_idx_top - RT_idx_btm)
+                # m/z of the most intense peak in the window
+                if np.isnan(extracted_peak_inten_list).all():
+                    peaktop_mz = np.nan
+                else:
+                    peaktop_mz = extracted_peak_mz_list[np.nanargmax(extracted_peak_inten_list)]
+            else:
+                raise Exception(f"unknown spectrum type: {self.spectrum_type}")
             extracted_RT_argmax = np.argmax(extracted_inten_list_RT)
-            extracted_mz_argmax = np.argmax(extracted_inten_list_mz)
             peaktop_RT = extracted_RT_list[extracted_RT_argmax]
-            peaktop_mz = extracted_mz_list[extracted_mz_argmax]
             r["area (baseline adjusted)"] = auc - BG
             r["height"] = extracted_inten_list_RT[extracted_RT_argmax]
             r["baseline_height"] = extracted_inten_list_RT.min()
@@ -241,7 +667,7 @@ class RPD():
             r["RT_top (value used for calculation)"] = extracted_RT_list[-1]
             r["RT peaktop"] =peaktop_RT
             r["mz peaktop"] =peaktop_mz
-            r["is deisotoped"] = not self.inten_info_set_list_subtracted_by_deisotoping.is_empty()
+            r["is deisotoped"] = is_deisotoped
         return r
     def calc_spectrum_auc(self, RT_btm, RT_top):
         pass
@@ -249,6 +675,7 @@ class RPD():
     def calc_auc_core(x_list, y_list):
         return ((y_list[1:] + y_list[:-1]) * np.diff(x_list)).sum() / 2
     def set_deisotoping(self, deisotoping):
+        self.deisotoping_state += 1
         # clear previous deisotoping
         if not self.inten_info_set_list_subtracted_by_deisotoping.is_empty():
             self.clear_deisotoping()
@@ -261,22 +688,71 @@ class RPD():
             mz_top = relative_atomic_mass_list[-1] + data_item.mz_range
             # RT で回す
             for RT_idx in range(RT_idx_btm, RT_idx_top):
-                mz_idx_btm = rpd_calc.index_greater_than(threshold=mz_btm, array1d=self.mz_set[RT_idx, :])
-                mz_idx_top = rpd_calc.index_greater_than(threshold=mz_top, array1d=self.mz_set[RT_idx, :])
-                target_mz_list = self.mz_set[RT_idx, mz_idx_btm:mz_idx_top]
-                target_inten_list = self.inten_set[RT_idx, mz_idx_btm:mz_idx_top]
+                mz_idx_btm, mz_idx_top = rpd_calc.index_greater_than_array(threshold_list=(mz_btm, mz_top), array1d=self.mz_set[RT_idx]).tolist()
+                target_mz_list = self.mz_set[RT_idx][mz_idx_btm:mz_idx_top]
+                target_inten_list = self.get_inten_list_for_update(RT_idx)[mz_idx_btm:mz_idx_top]   # view
                 # execute deisotoping
                 subtracted_inten_list = diso.deisotope_core(target_mz_list, target_inten_list, relative_atomic_mass_list, isotopic_composition_list)
                 # store subtracted values
                 self.inten_info_set_list_subtracted_by_deisotoping.update_data(RT_idx, self.RT_list[RT_idx], mz_idx_btm, mz_idx_top, target_mz_list, subtracted_inten_list)
         # set mz_idx_blocks: deisotoping 前の図を表示する際、スペクトルが途切れるべき部分がつながってしまうことを防止する。
         self.inten_info_set_list_subtracted_by_deisotoping.update_mz_idx_blocks()
+    def get_inten_list_for_update(self, RT_idx):
+        if isinstance(self.inten_set, ChunkedArray):
+            return self.inten_set.get_row_for_update(RT_idx)
+        return self.inten_set[RT_idx]
     def clear_deisotoping(self):
         raise Exception("Clearing of deisotoping is not implemented yet!")
 
         self.inten_set[~np.isnan(self.inten_info_set_list_subtracted_by_deisotoping)] = self.inten_info_set_list_subtracted_by_deisotoping[~np.isnan(self.inten_info_set_list_subtracted_by_deisotoping)].astype(self.inten_set.dtype)
         self.inten_info_set_list_subtracted_by_deisotoping = IntenInfoSetList(len(self.RT_list))
 
+# RPD opened from the header and the small sections only (see convert_open.load_lazy).
+# mz_set and inten_set are read and decompressed on first access (load_arrays: () -> (mz_set, inten_set)),
+# so that RT_list, settings, etc. are available without decompressing the whole file.
+class LazyRPD(RPD):
+    def __init__(self, load_arrays, storage, **kwargs):
+        self.load_arrays = load_arrays
+        super().__init__(mz_set=None, inten_set=None, **kwargs)
+        self.storage = storage
+    def is_loaded(self):
+        return self.load_arrays is None
+    def load(self):
+        if self.load_arrays is not None:
+            self.loaded_mz_set, self.loaded_inten_set = self.load_arrays()
+            self.load_arrays = None
+    @property
+    def mz_set(self):
+        self.load()
+        return self.loaded_mz_set
+    @mz_set.setter
+    def mz_set(self, mz_set):
+        self.loaded_mz_set = mz_set
+    @property
+    def inten_set(self):
+        self.load()
+        return self.loaded_inten_set
+    @inten_set.setter
+    def inten_set(self, inten_set):
+        self.loaded_inten_set = inten_set
+
+# Values of each scan: TIC (same as extract_chromatogram(0, np.inf)), BPC (base peak intensity), m/z of the base peak, and number of points.
+# np.nan (except N_point) for scans without points. Calculated during the file conversion and saved as a section of the rpd file.
+class ScanSummary():
+    keys = ("TIC", "BPC", "base_peak_mz", "N_point")
+    def __init__(self, TIC, BPC, base_peak_mz, N_point):
+        self.TIC = np.asarray(TIC, dtype=np.float64)
+        self.BPC = np.asarray(BPC, dtype=np.float64)
+        self.base_peak_mz = np.asarray(base_peak_mz, dtype=np.float64)
+        self.N_point = np.asarray(N_point, dtype=np.int64)
+    def __len__(self):
+        return len(self.TIC)
+    @classmethod
+    def concatenate(cls, scan_summary_list):
+        return cls(**{key:np.concatenate([getattr(scan_summary, key) for scan_summary in scan_summary_list] + [np.empty(0)]) for key in cls.keys})
+    def to_dict(self):
+        return {key:getattr(self, key) for key in self.keys}
+
 class IntenInfoSetList(list):
     def __init__(self, N_RT):
         super().__init__([None for i in range(N_RT)])
@@ -1,13 +1,56 @@
 # -*- coding: utf-8 -*-
 
+import os
 import numpy as np
 import pandas as pd
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from ..widgets import popups
 from PyQt6.QtCore import (
     QCoreApplication, 
 )
 
+extraction_cache_bytes = 256 * 1024 ** 2  # extracted chromatograms / spectra kept in memory
+
+# Extracted chromatograms / spectra, with least recently used entries removed above max_bytes.
+class ExtractionCache():
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.cache = OrderedDict()  # key: (value, nbytes)
+        self.nbytes = 0
+        self.N_hit = 0
+        self.N_miss = 0
+    def get(self, key, calc_value):
+        value_nbytes = self.cache.get(key)
+        if value_nbytes is not None:
+            self.cache.move_to_end(key)
+            self.N_hit += 1
+            return value_nbytes[0]
+        self.N_miss += 1
+        value = calc_value()
+        nbytes = self.calc_nbytes(value)
+        if nbytes <= self.max_bytes:
+            self.cache[key] = (value, nbytes)
+            self.nbytes += nbytes
+            # evict least recently used entries
+            while self.nbytes > self.max_bytes:
+                self.nbytes -= self.cache.popitem(last=False)[1][1]
+        return value
+    def clear(self):
+        self.cache.clear()
+        self.nbytes = 0
+    def stats(self):
+        return dict(N_entry=len(self.cache), nbytes=self.nbytes, N_hit=self.N_hit, N_miss=self.N_miss)
+    # arrays shared with RPD (e.g. RT_list) are counted as well
+    @classmethod
+    def calc_nbytes(cls, value):
+        if isinstance(value, np.ndarray):
+            return value.nbytes
+        elif isinstance(value, (tuple, list)):
+            return sum(cls.calc_nbytes(v) for v in value)
+        else:
+            return 0
+
 class Model():
     def __init__(self, main_window, fast_display):
         self.main_window = main_window
@@ -15,6 +58,7 @@ class Model():
         self.data_hash_list = []
         self.rpd_list = []
         self.fast_display = fast_display
+        self.extraction_cache = ExtractionCache(extraction_cache_bytes)
     def database(self):
         return self.main_window.database
     # you can specify what kind of data you want by *key, **kwargs in the future.
@@ -31,35 +75,40 @@ class Model():
         self.pbar.show()
         chromatograms = []
         for rpd in self.rpd_list:
-            if self.fast_display:
-                chromatograms.append(rpd.extract_chromatogram_fast(mz_btm, mz_top))
-            else:
-                chromatograms.append(rpd.extract_chromatogram(mz_btm, mz_top))
+            chromatograms.append(self.extract_chromatogram_of_rpd(rpd, mz_btm, mz_top))
             self.pbar.add()
             QCoreApplication.processEvents()
         return chromatograms
     def extract_chromatogram(self, mz_btm, mz_top, index):
+        return self.extract_chromatogram_of_rpd(self.rpd_list[index], mz_btm, mz_top)
+    def extract_chromatogram_of_rpd(self, rpd, mz_btm, mz_top):
+        key = ("chromatogram", ) + self.get_cache_key_of_rpd(rpd) + (float(mz_btm), float(mz_top), self.fast_display)
         if self.fast_display:
-            return self.rpd_list[index].extract_chromatogram_fast(mz_btm, mz_top)
+            return self.extraction_cache.get(key, lambda: rpd.extract_chromatogram_fast(mz_btm, mz_top))
         else:
-            return self.rpd_list[index].extract_chromatogram(mz_btm, mz_top)
+            return self.extraction_cache.get(key, lambda: rpd.extract_chromatogram(mz_btm, mz_top))
     def extract_spectra(self, RT_btm, RT_top):
         self.pbar = popups.ProgressBar(N_max=len(self.rpd_list), message="Extracting Spectra")
         self.pbar.show()
         spectra = []
         for rpd in self.rpd_list:
-            if self.fast_display:
-                spectra.append(rpd.extract_spectrum_fast(RT_btm, RT_top))
-            else:
-                spectra.append(rpd.extract_spectrum(RT_btm, RT_top))
+            spectra.append(self.extract_spectrum_of_rpd(rpd, RT_btm, RT_top))
             self.pbar.add()
             QCoreApplication.processEvents()
         return spectra
     def extract_spectrum(self, RT_btm, RT_top, index):
+        return self.extract_spectrum_of_rpd(self.rpd_list[index], RT_btm, RT_top)
+    def extract_spectrum_of_rpd(self, rpd, RT_btm, RT_top):
+        key = ("spectrum", ) + self.get_cache_key_of_rpd(rpd) + (float(RT_btm), float(RT_top), self.fast_display)
         if self.fast_display:
-            return self.rpd_list[index].extract_spectrum_fast(RT_btm, RT_top)
+            return self.extraction_cache.get(key, lambda: rpd.extract_spectrum_fast(RT_btm, RT_top))
         else:
-            return self.rpd_list[index].extract_spectrum(RT_btm, RT_top)
+            return self.extraction_cache.get(key, lambda: rpd.extract_spectrum(RT_btm, RT_top))
+    # The same file may be opened more than once, and files opened after deisotoping are not deisotoped:
+    # extracted data depend on the RPD object and its deisotoping state, not only on data_hash.
+    @staticmethod
+    def get_cache_key_of_rpd(rpd):
+        return (rpd.data_hash, id(rpd), rpd.deisotoping_state)
     def extract_info_all(self):
         return [rpd.extract_info() for rpd in self.rpd_list]
     def extract_info(self, index):
@@ -67,9 +116,8 @@ class Model():
     def export_auc_data(self, data_items):
         self.pbar = popups.ProgressBar(N_max=len(data_items) * len(self.rpd_list), message="Exporting Results")
         self.pbar.show()
-        auc_data_list = []
+        window_list = []
         for data_item in data_items:
-            print(data_item.compound_name)
             # view_range_s_x
             # view_range_c_x
             RT_btm = data_item.RT - data_item.RT_range
@@ -80,15 +128,23 @@ class Model():
             else:
                 mz_btm = data_item.mz - data_item.mz_range
                 mz_top = data_item.mz + data_item.mz_range
-            # calc values
-            for rpd in self.rpd_list:
-                r = rpd.calc_chromatogram_auc(
-                    mz_btm, 
-                    mz_top, 
-                    RT_btm, 
-                    RT_top, 
-                    calc_minimum_info = False
-                )
+            window_list.append((mz_btm, mz_top, RT_btm, RT_top))
+        # calc values: all windows of a file in a single pass, files in parallel
+        n_workers = max(min(os.cpu_count() or 1, len(self.rpd_list)), 1)
+        num_threads = max((os.cpu_count() or 1) // n_workers, 1)
+        r_list_list = [None] * len(self.rpd_list)
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            future_dict = {
+                executor.submit(rpd.calc_chromatogram_auc_list, window_list, False, num_threads):rpd_idx for rpd_idx, rpd in enumerate(self.rpd_list)
+            }
+            for future in as_completed(future_dict):
+                r_list_list[future_dict[future]] = future.result()
+                self.pbar.add(len(data_items))
+                QCoreApplication.processEvents()
+        auc_data_list = []
+        for data_item, (mz_btm, mz_top, RT_btm, RT_top), r_list in zip(data_items, window_list, zip(*r_list_list)):
+            print(data_item.compound_name)
+            for rpd, r in zip(self.rpd_list, r_list):
                 if r is None:
                     r = defaultdict(lambda: np.nan)
                 new_data_item = data_item.copy()
@@ -118,8 +174,6 @@ class Model():
                     new_data_item["mz_range"] = -1
                 # append
                 auc_data_list.append(new_data_item)
-                self.pbar.add()
-                QCoreApplication.processEvents()
         df = pd.DataFrame.from_records(auc_data_list)
         column_order = [
             'compound_name', 
@@ -159,6 +213,8 @@ class Model():
         })
     # deisotoping
     def set_deisotoping(self, deisotoping):
+        # intensities are modified: extracted data are no longer valid (cf. RPD.deisotoping_state)
+        self.extraction_cache.clear()
         self.pbar = popups.ProgressBar(N_max=len(self.rpd_list), message="Executing Deisotoping")
         self.pbar.show()
         QCoreApplication.processEvents()
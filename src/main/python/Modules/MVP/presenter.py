@@ -18,6 +18,7 @@ from ..widgets import mz_RT_image2d as mri
 from ..widgets import adduct_ion_syntax as ais
 from ..widgets import data_window as dw
 from ..process import convert_open as co
+from ..process import workers
 from ..process import deisotoping as diso
 
 class Presenter():
@@ -72,15 +73,13 @@ class Presenter():
     # methods free from complicated events
     def convert_files_clicked(self, file_path_list=None):
         if file_path_list is None:
-            file_path_list, file_type = QFileDialog.getOpenFileNames(self.central_widget(), 'Select mzdata file', str(gf.settings.last_opened_dir), filter="xml files (*.xml)")
+            file_path_list, file_type = QFileDialog.getOpenFileNames(self.central_widget(), 'Select mzdata/mzML file', str(gf.settings.last_opened_dir), filter="spectrum files (*.xml *.mzML)")
         if not len(file_path_list):
             return
         # file name check
         overlaped_rpd_path = []
         for file_path in file_path_list:
-            rpd_path = co.get_rpd_path(Path(file_path), return_rpd=False)
-            if rpd_path.exists():
-                overlaped_rpd_path.append(str(rpd_path))
+            overlaped_rpd_path.extend(map(str, co.get_existing_rpd_path_list(Path(file_path))))
         if len(overlaped_rpd_path) != 0:
             wp = popups.overwrite_warning()
             wp.setInformativeText("\n\n".join(overlaped_rpd_path))
@@ -96,7 +95,7 @@ class Presenter():
         self.pbar.show()
         for file_path in file_path_list:
             gf.settings.set_val_and_save("last_opened_dir", Path(file_path).parent)
-            worker = co.Worker(co.convert_file, Path(file_path))
+            worker = workers.Worker(co.convert_file, Path(file_path))
             worker.signals.finished.connect(lambda:self.pbar.add())
             self.thread_pool.start(worker)
     def export_targets_clicked(self):
@@ -196,7 +195,7 @@ class Presenter():
             return
         # prepare everything
         self.warning_messages = []
-        worker_results_processor = co.WorkerResultsProcessor()
+        worker_results_processor = workers.WorkerResultsProcessor()
         self.pbar = popups.ProgressBar(N_max=len(file_path_list), message="Opening Files")
         self.pbar.finished.connect(partial(worker_results_processor.thread_pool_finished, self.welcome_new_rpd))
         self.pbar.finished.connect(self.show_warning_message_for_opening_file)
@@ -204,7 +203,7 @@ class Presenter():
         # open loop
         for i, file_path in enumerate(file_path_list):
             gf.settings.set_val_and_save("last_opened_dir", Path(file_path).parent)
-            worker = co.Worker(co.open_file, Path(file_path))
+            worker = workers.Worker(co.open_file, Path(file_path))
             worker.signals.result.connect(partial(worker_results_processor.append_worker_produced_results, i)) # return: rpd, message
             worker.signals.finished.connect(self.pbar.add)
             self.thread_pool.start(worker)
@@ -213,12 +212,23 @@ class Presenter():
             wp = popups.WarningPopup("Warnings when opening files!")
             wp.setInformativeText("\n\n".join(self.warning_messages))
             wp.exec()
+    # the whole file is verified in background (chunks being decoded are verified in co.load_3_0)
+    def start_file_verification(self, file_path):
+        worker = workers.Worker(co.verify_file, file_path)
+        worker.signals.error.connect(self.file_verification_failed)
+        self.thread_pool.start(worker)
+    def file_verification_failed(self, error):
+        exctype, value, traceback_text = error
+        wp = popups.WarningPopup(f"File verification failed!\n{value}")
+        wp.exec()
     @event_process_deco
     def welcome_new_rpd(self, rpd, message):
         if message is not None:
             self.warning_messages.append(message)
         if rpd is None:
             return
+        if co.verify_checksums:
+            self.start_file_verification(rpd.file_path)
         self.database().add_rpd(rpd)
         self.model().set_rpd_data_from_database(-1) # set last added
         # add data based on the information on the navigation_bar
@@ -4,6 +4,7 @@
 cimport cython
 from cython.parallel cimport prange
 # from libc.math cimport sqrt
+from libc.math cimport NAN
 import numpy as np
 cimport numpy as np
 # from scipy.stats import norm
@@ -15,6 +16,14 @@ DTYPEfloat64 = np.float64
 ctypedef np.int32_t DTYPEint32_t
 ctypedef np.int64_t DTYPEint64_t
 ctypedef np.float64_t DTYPEfloat64_t
+# dtypes of mz_set / inten_set chosen by the converter (cf. convert_open.compact_inten_dtype_list, convert_open.mz_float32)
+ctypedef fused DTYPEmz_t:
+    np.float32_t
+    np.float64_t
+ctypedef fused DTYPEinten_t:
+    np.uint16_t
+    np.int32_t
+    np.int64_t
 
 
 ################
@@ -74,23 +83,142 @@ def cumsum_2d_axis1_int32(
 # JUNC ここまで#
 ################
 
+# convert_open.deep_diff(array2d, axis_list=[1, 1, 0]) / convert_open.revert_deep_diff(..., axis_list=[1, 1, 0]) without
+# intermediate arrays (np.diff / np.vstack / np.hstack / np.cumsum). Operations are done in the same order as numpy, so that
+# the results are bit-identical. Parallelized with OpenMP (see rpd_calc_setup.py; serial if compiled without OpenMP).
+@cython.boundscheck(False) # turn off bounds-checking for entire function
+@cython.wraparound(False)  # turn off negative index wrapping for entire function
+@cython.nonecheck(False)
+cdef inline DTYPEfloat64_t second_diff(const DTYPEfloat64_t[:, :] array2d, Py_ssize_t i, Py_ssize_t j) nogil:
+    return (array2d[i, j + 2] - array2d[i, j + 1]) - (array2d[i, j + 1] - array2d[i, j])
+@cython.boundscheck(False) # turn off bounds-checking for entire function
+@cython.wraparound(False)  # turn off negative index wrapping for entire function
+@cython.nonecheck(False)
+def deep_diff_axis110_float64(
+        const DTYPEfloat64_t[:, :] array2d,     # (N_row, N_col), N_row >= 1, N_col >= 2
+        DTYPEfloat64_t[:] initial_array0,       # (N_row, )
+        DTYPEfloat64_t[:] initial_array1,       # (N_row, )
+        DTYPEfloat64_t[:] initial_array2,       # (N_col - 2, )
+        DTYPEfloat64_t[:, :] diff_array2d,      # (N_row - 1, N_col - 2)
+        int num_threads=1, 
+    ):
+    cdef Py_ssize_t N_row = array2d.shape[0]
+    cdef Py_ssize_t N_col = array2d.shape[1]
+    cdef Py_ssize_t i, j
+    assert (N_row >= 1) and (N_col >= 2)
+    assert (initial_array0.shape[0] == N_row) and (initial_array1.shape[0] == N_row) and (initial_array2.shape[0] == N_col - 2)
+    assert (diff_array2d.shape[0] == N_row - 1) and (diff_array2d.shape[1] == N_col - 2)
+    for j in range(N_col - 2):
+        initial_array2[j] = second_diff(array2d, 0, j)
+    # rows are independent (second-order differences of the previous row are calculated again)
+    for i in prange(N_row, nogil=True, schedule="static", num_threads=num_threads):
+        initial_array0[i] = array2d[i, 0]
+        initial_array1[i] = array2d[i, 1] - array2d[i, 0]
+        if i > 0:
+            for j in range(N_col - 2):
+                diff_array2d[i - 1, j] = second_diff(array2d, i, j) - second_diff(array2d, i - 1, j)
+@cython.boundscheck(False) # turn off bounds-checking for entire function
+@cython.wraparound(False)  # turn off negative index wrapping for entire function
+@cython.nonecheck(False)
+def revert_deep_diff_axis110_float64(
+        const DTYPEfloat64_t[:, :] diff_array2d,    # (N_row - 1, N_col - 2)
+        const DTYPEfloat64_t[:] initial_array0,     # (N_row, )
+        const DTYPEfloat64_t[:] initial_array1,     # (N_row, )
+        const DTYPEfloat64_t[:] initial_array2,     # (N_col - 2, )
+        DTYPEfloat64_t[:, :] array2d,               # (N_row, N_col): output
+        int num_threads=1, 
+    ):
+    cdef Py_ssize_t N_row = array2d.shape[0]
+    cdef Py_ssize_t N_col = array2d.shape[1]
+    cdef Py_ssize_t block_size = 512
+    cdef Py_ssize_t N_block = (N_col - 2 + block_size - 1) // block_size
+    cdef Py_ssize_t i, j, k, j_btm, j_top
+    cdef DTYPEfloat64_t mz, mz_diff
+    assert (N_row >= 1) and (N_col >= 2)
+    assert (initial_array0.shape[0] == N_row) and (initial_array1.shape[0] == N_row) and (initial_array2.shape[0] == N_col - 2)
+    assert (diff_array2d.shape[0] == N_row - 1) and (diff_array2d.shape[1] == N_col - 2)
+    # cumsum along axis 0: second-order differences are stored in array2d[:, 2:]
+    # columns are independent (blocks of columns, so that rows are read continuously)
+    for k in prange(N_block, nogil=True, schedule="static", num_threads=num_threads):
+        j_btm = k * block_size
+        j_top = min(j_btm + block_size, N_col - 2)
+        for j in range(j_btm, j_top):
+            array2d[0, j + 2] = initial_array2[j]
+        for i in range(1, N_row):
+            for j in range(j_btm, j_top):
+                array2d[i, j + 2] = array2d[i - 1, j + 2] + diff_array2d[i - 1, j]
+    # cumsum along axis 1 (twice) in place: array2d[i, j + 1] (second-order difference) is read before array2d[i, j + 1] is overwritten
+    for i in prange(N_row, nogil=True, schedule="static", num_threads=num_threads):
+        mz = initial_array0[i]
+        mz_diff = initial_array1[i]
+        array2d[i, 0] = mz
+        for j in range(1, N_col):
+            mz = mz + mz_diff
+            if j + 1 < N_col:
+                mz_diff = mz_diff + array2d[i, j + 1]
+            array2d[i, j] = mz
+
 
 
+# index_greater_than(threshold, array1d) returns the first i with threshold < array1d[i] (len(array1d) if none).
+# array1d must be sorted in ascending order except for the np.nan tail (RT_list, ref_mz_list, rows of mz_set),
+# so that the index is found by binary search. Comparison with np.nan is False, so that thresholds
+# beyond the last value (or np.nan threshold) give len(array1d), not the length without the np.nan tail.
+@cython.boundscheck(False) # turn off bounds-checking for entire function
+@cython.wraparound(False)  # turn off negative index wrapping for entire function
+@cython.nonecheck(False)
+cdef inline Py_ssize_t len_without_nan_tail(const DTYPEmz_t[:] array1d) nogil:
+    cdef Py_ssize_t idx_btm = 0
+    cdef Py_ssize_t idx_top = array1d.shape[0]
+    cdef Py_ssize_t idx_mid
+    while idx_btm < idx_top:
+        idx_mid = (idx_btm + idx_top) >> 1
+        if array1d[idx_mid] != array1d[idx_mid]:   # np.nan
+            idx_top = idx_mid
+        else:
+            idx_btm = idx_mid + 1
+    return idx_btm
+@cython.boundscheck(False) # turn off bounds-checking for entire function
+@cython.wraparound(False)  # turn off negative index wrapping for entire function
+@cython.nonecheck(False)
+cdef inline Py_ssize_t bisect_greater_than(DTYPEfloat64_t threshold, const DTYPEmz_t[:] array1d, Py_ssize_t N_valid) nogil:
+    cdef Py_ssize_t idx_btm = 0
+    cdef Py_ssize_t idx_top = N_valid
+    cdef Py_ssize_t idx_mid
+    while idx_btm < idx_top:
+        idx_mid = (idx_btm + idx_top) >> 1
+        if threshold < array1d[idx_mid]:
+            idx_top = idx_mid
+        else:
+            idx_btm = idx_mid + 1
+    if idx_btm < N_valid:
+        return idx_btm
+    else:
+        return array1d.shape[0]
 @cython.boundscheck(False) # turn off bounds-checking for entire function
 @cython.wraparound(False)  # turn off negative index wrapping for entire function
 @cython.nonecheck(False)
 def index_greater_than(
         DTYPEfloat64_t threshold, 
-        np.ndarray[DTYPEfloat64_t, ndim=1] array1d, 
+        const DTYPEmz_t[:] array1d, 
     ):
     assert type(threshold) == float
-    assert array1d.dtype == DTYPEfloat64
-    cdef int i
-    for i in range(len(array1d)):
-        if threshold < array1d[i]:
-            return i
-    else:
-        return i + 1
+    return bisect_greater_than(threshold, array1d, len_without_nan_tail(array1d))
+# index_greater_than for each threshold of threshold_list (any order), against the same array1d
+@cython.boundscheck(False) # turn off bounds-checking for entire function
+@cython.wraparound(False)  # turn off negative index wrapping for entire function
+@cython.nonecheck(False)
+def index_greater_than_array(
+        threshold_list, 
+        const DTYPEmz_t[:] array1d, 
+    ):
+    cdef const DTYPEfloat64_t[:] threshold_view = np.ascontiguousarray(threshold_list, dtype=np.float64).reshape(-1)
+    cdef np.ndarray[DTYPEint64_t, ndim=1] idx_list = np.empty(threshold_view.shape[0], dtype=np.int64)
+    cdef Py_ssize_t N_valid = len_without_nan_tail(array1d)
+    cdef Py_ssize_t i
+    for i in range(threshold_view.shape[0]):
+        idx_list[i] = bisect_greater_than(threshold_view[i], array1d, N_valid)
+    return idx_list
 
 #####################
 # equivalent method #
@@ -149,6 +277,313 @@ def extract_chromatogram_core_float64int32( # float64 for mz_set, int32 for inte
     # inten_list[np.isnan(inten_list_pre).all(axis=1)] = np.nan
     # return inten_list
 
+# Same as extract_chromatogram_core_float64int32, for any dtypes of DTYPEmz_t / DTYPEinten_t.
+# Each row is searched by bisection (np.nan padding on the right behaves as +inf), so that it is also valid for discrete data.
+@cython.boundscheck(False) # turn off bounds-checking for entire function
+@cython.wraparound(False)  # turn off negative index wrapping for entire function
+@cython.nonecheck(False)
+def extract_chromatogram_core(
+        DTYPEfloat64_t mz_btm, 
+        DTYPEfloat64_t mz_top, 
+        const DTYPEmz_t[:, :] mz_set,       # (len(RT_list), spectrum_number)
+        const DTYPEinten_t[:, :] inten_set, # (len(RT_list), spectrum_number)
+    ):
+    assert type(mz_btm) == float
+    assert type(mz_top) == float
+    cdef Py_ssize_t N_row = mz_set.shape[0]
+    cdef Py_ssize_t N_col = mz_set.shape[1]
+    cdef np.ndarray[DTYPEfloat64_t, ndim=1] result_inten_list = np.zeros(N_row, dtype=np.float64)
+    cdef Py_ssize_t i, j, lo, hi, mid, left_idx, right_idx
+    cdef DTYPEfloat64_t inten_sum
+    for i in range(N_row):
+        # mz_set[i, left_idx - 1] < mz_btm <= mz_set[i, left_idx]
+        lo = 0
+        hi = N_col
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            if mz_set[i, mid] < mz_btm:
+                lo = mid + 1
+            else:
+                hi = mid
+        left_idx = lo
+        # mz_set[i, right_idx - 1] <= mz_top < mz_set[i, right_idx]
+        hi = N_col
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            if mz_set[i, mid] <= mz_top:
+                lo = mid + 1
+            else:
+                hi = mid
+        right_idx = lo
+        if not left_idx < right_idx:
+            result_inten_list[i] = NAN
+            continue
+        inten_sum = 0
+        for j in range(left_idx, right_idx):
+            inten_sum += inten_set[i, j]
+        result_inten_list[i] = inten_sum
+    return result_inten_list
+
+# CSR (ragged) layout: row i is mz_values[offsets[i]:offsets[i + 1]] (no np.nan padding).
+# Only the columns col_btm <= j <= col_top of each row are searched (cf. mz_set[:, col_btm:col_top + 1] of ndarray2d).
+@cython.boundscheck(False) # turn off bounds-checking for entire function
+@cython.wraparound(False)  # turn off negative index wrapping for entire function
+@cython.nonecheck(False)
+def extract_chromatogram_core_csr(
+        DTYPEfloat64_t mz_btm, 
+        DTYPEfloat64_t mz_top, 
+        const DTYPEmz_t[:] mz_values,       # (N_point, )
+        const DTYPEinten_t[:] inten_values, # (N_point, )
+        const DTYPEint64_t[:] offsets,      # (len(RT_list) + 1, )
+        Py_ssize_t col_btm, 
+        Py_ssize_t col_top, 
+    ):
+    assert type(mz_btm) == float
+    assert type(mz_top) == float
+    cdef Py_ssize_t N_row = offsets.shape[0] - 1
+    cdef np.ndarray[DTYPEfloat64_t, ndim=1] result_inten_list = np.zeros(N_row, dtype=np.float64)
+    cdef Py_ssize_t i, j, lo, hi, mid, left_idx, right_idx
+    cdef DTYPEfloat64_t inten_sum
+    for i in range(N_row):
+        hi = offsets[i] + col_top + 1
+        if hi > offsets[i + 1]:
+            hi = offsets[i + 1]
+        lo = offsets[i] + col_btm
+        if lo > hi:
+            lo = hi
+        # mz_values[left_idx - 1] < mz_btm <= mz_values[left_idx]
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            if mz_values[mid] < mz_btm:
+                lo = mid + 1
+            else:
+                hi = mid
+        left_idx = lo
+        # mz_values[right_idx - 1] <= mz_top < mz_values[right_idx]
+        hi = offsets[i] + col_top + 1
+        if hi > offsets[i + 1]:
+            hi = offsets[i + 1]
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            if mz_values[mid] <= mz_top:
+                lo = mid + 1
+            else:
+                hi = mid
+        right_idx = lo
+        if not left_idx < right_idx:
+            result_inten_list[i] = NAN
+            continue
+        inten_sum = 0
+        for j in range(left_idx, right_idx):
+            inten_sum += inten_values[j]
+        result_inten_list[i] = inten_sum
+    return result_inten_list
+
+# extract_chromatogram_core / extract_chromatogram_core_csr (whole rows) for many windows in a single pass over the rows.
+# Window w covers mz_btm_list[w] <= mz <= mz_top_list[w] and rows row_btm_list[w] <= i < row_top_list[w] of the whole RT_list,
+# and its chromatogram is written to result_values[result_offsets[w]:result_offsets[w + 1]] (its rows in mz_set / inten_set only,
+# which is the block of rows row_offset <= i < row_offset + N_row). Windows are visited in order of window_order (ascending mz_btm),
+# so that each row is searched from left to right. The sums are the same as extract_chromatogram_core (bit-identical).
+# The most intense point of each row in the window (first one if tied) is written to result_peak_inten / result_peak_mz (same layout).
+@cython.boundscheck(False) # turn off bounds-checking for entire function
+@cython.wraparound(False)  # turn off negative index wrapping for entire function
+@cython.nonecheck(False)
+def extract_chromatograms_core(
+        const DTYPEfloat64_t[:] mz_btm_list,    # (N_window, )
+        const DTYPEfloat64_t[:] mz_top_list,    # (N_window, )
+        const DTYPEint64_t[:] row_btm_list,     # (N_window, )
+        const DTYPEint64_t[:] row_top_list,     # (N_window, )
+        const DTYPEint64_t[:] window_order,     # (N_window, ) argsort of mz_btm_list
+        const DTYPEint64_t[:] result_offsets,   # (N_window + 1, )
+        const DTYPEmz_t[:, :] mz_set,           # (N_row, spectrum_number)
+        const DTYPEinten_t[:, :] inten_set,     # (N_row, spectrum_number)
+        Py_ssize_t row_offset, 
+        DTYPEfloat64_t[:] result_values,        # (result_offsets[-1], )
+        DTYPEfloat64_t[:] result_peak_inten,    # (result_offsets[-1], )
+        DTYPEfloat64_t[:] result_peak_mz,       # (result_offsets[-1], )
+        int num_threads=1, 
+    ):
+    cdef Py_ssize_t N_row = mz_set.shape[0]
+    cdef Py_ssize_t N_col = mz_set.shape[1]
+    cdef Py_ssize_t N_window = window_order.shape[0]
+    cdef Py_ssize_t i, k, w, j, row, lo, hi, mid, left_idx, right_idx, search_start_idx, result_idx, peak_idx
+    cdef DTYPEfloat64_t inten_sum
+    for i in prange(N_row, nogil=True, schedule="dynamic", num_threads=num_threads):
+        row = row_offset + i
+        search_start_idx = 0
+        for k in range(N_window):
+            w = window_order[k]
+            if not (row_btm_list[w] <= row < row_top_list[w]):
+                continue
+            # mz_set[i, left_idx - 1] < mz_btm <= mz_set[i, left_idx] (mz_btm is not less than that of the previous window)
+            lo = search_start_idx
+            hi = N_col
+            while lo < hi:
+                mid = (lo + hi) >> 1
+                if mz_set[i, mid] < mz_btm_list[w]:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            left_idx = lo
+            search_start_idx = left_idx
+            # mz_set[i, right_idx - 1] <= mz_top < mz_set[i, right_idx]
+            hi = N_col
+            while lo < hi:
+                mid = (lo + hi) >> 1
+                if mz_set[i, mid] <= mz_top_list[w]:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            right_idx = lo
+            result_idx = result_offsets[w] + row - row_btm_list[w]
+            if not left_idx < right_idx:
+                result_values[result_idx] = NAN
+                result_peak_inten[result_idx] = NAN
+                result_peak_mz[result_idx] = NAN
+                continue
+            inten_sum = 0
+            peak_idx = left_idx
+            for j in range(left_idx, right_idx):
+                inten_sum = inten_sum + inten_set[i, j]
+                if inten_set[i, j] > inten_set[i, peak_idx]:
+                    peak_idx = j
+            result_values[result_idx] = inten_sum
+            result_peak_inten[result_idx] = inten_set[i, peak_idx]
+            result_peak_mz[result_idx] = mz_set[i, peak_idx]
+@cython.boundscheck(False) # turn off bounds-checking for entire function
+@cython.wraparound(False)  # turn off negative index wrapping for entire function
+@cython.nonecheck(False)
+def extract_chromatograms_core_csr(
+        const DTYPEfloat64_t[:] mz_btm_list,    # (N_window, )
+        const DTYPEfloat64_t[:] mz_top_list,    # (N_window, )
+        const DTYPEint64_t[:] row_btm_list,     # (N_window, )
+        const DTYPEint64_t[:] row_top_list,     # (N_window, )
+        const DTYPEint64_t[:] window_order,     # (N_window, ) argsort of mz_btm_list
+        const DTYPEint64_t[:] result_offsets,   # (N_window + 1, )
+        const DTYPEmz_t[:] mz_values,           # (N_point, )
+        const DTYPEinten_t[:] inten_values,     # (N_point, )
+        const DTYPEint64_t[:] offsets,          # (N_row + 1, )
+        Py_ssize_t row_offset, 
+        DTYPEfloat64_t[:] result_values,        # (result_offsets[-1], )
+        DTYPEfloat64_t[:] result_peak_inten,    # (result_offsets[-1], )
+        DTYPEfloat64_t[:] result_peak_mz,       # (result_offsets[-1], )
+        int num_threads=1, 
+    ):
+    cdef Py_ssize_t N_row = offsets.shape[0] - 1
+    cdef Py_ssize_t N_window = window_order.shape[0]
+    cdef Py_ssize_t i, k, w, j, row, lo, hi, mid, left_idx, right_idx, search_start_idx, result_idx, peak_idx
+    cdef DTYPEfloat64_t inten_sum
+    for i in prange(N_row, nogil=True, schedule="dynamic", num_threads=num_threads):
+        row = row_offset + i
+        search_start_idx = offsets[i]
+        for k in range(N_window):
+            w = window_order[k]
+            if not (row_btm_list[w] <= row < row_top_list[w]):
+                continue
+            # mz_values[left_idx - 1] < mz_btm <= mz_values[left_idx]
+            lo = search_start_idx
+            hi = offsets[i + 1]
+            while lo < hi:
+                mid = (lo + hi) >> 1
+                if mz_values[mid] < mz_btm_list[w]:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            left_idx = lo
+            search_start_idx = left_idx
+            # mz_values[right_idx - 1] <= mz_top < mz_values[right_idx]
+            hi = offsets[i + 1]
+            while lo < hi:
+                mid = (lo + hi) >> 1
+                if mz_values[mid] <= mz_top_list[w]:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            right_idx = lo
+            result_idx = result_offsets[w] + row - row_btm_list[w]
+            if not left_idx < right_idx:
+                result_values[result_idx] = NAN
+                result_peak_inten[result_idx] = NAN
+                result_peak_mz[result_idx] = NAN
+                continue
+            inten_sum = 0
+            peak_idx = left_idx
+            for j in range(left_idx, right_idx):
+                inten_sum = inten_sum + inten_values[j]
+                if inten_values[j] > inten_values[peak_idx]:
+                    peak_idx = j
+            result_values[result_idx] = inten_sum
+            result_peak_inten[result_idx] = inten_values[peak_idx]
+            result_peak_mz[result_idx] = mz_values[peak_idx]
+
+# m/z profiles (spectra summed over the rows) of the windows of extract_chromatograms_core, for the same block of rows:
+# columns col_btm_list[w] <= j <= col_top_list[w] of rows row_btm_list[w] <= i < row_top_list[w] are added to
+# profile_*[profile_offsets[w] + j - col_btm_list[w]] (sum of m/z except np.nan, number of them, and sum of intensities).
+# Windows are processed in parallel (each window by a single thread), so that the sums do not depend on num_threads.
+@cython.boundscheck(False) # turn off bounds-checking for entire function
+@cython.wraparound(False)  # turn off negative index wrapping for entire function
+@cython.nonecheck(False)
+def accumulate_mz_profiles(
+        const DTYPEint64_t[:] row_btm_list,     # (N_window, )
+        const DTYPEint64_t[:] row_top_list,     # (N_window, )
+        const DTYPEint64_t[:] col_btm_list,     # (N_window, )
+        const DTYPEint64_t[:] col_top_list,     # (N_window, )
+        const DTYPEint64_t[:] profile_offsets,  # (N_window + 1, )
+        const DTYPEmz_t[:, :] mz_set,           # (N_row, spectrum_number)
+        const DTYPEinten_t[:, :] inten_set,     # (N_row, spectrum_number)
+        Py_ssize_t row_offset, 
+        DTYPEfloat64_t[:] profile_mz_sum,       # (profile_offsets[-1], )
+        DTYPEint64_t[:] profile_mz_count,       # (profile_offsets[-1], )
+        DTYPEfloat64_t[:] profile_inten_sum,    # (profile_offsets[-1], )
+        int num_threads=1, 
+    ):
+    cdef Py_ssize_t N_row = mz_set.shape[0]
+    cdef Py_ssize_t N_col = mz_set.shape[1]
+    cdef Py_ssize_t N_window = row_btm_list.shape[0]
+    cdef Py_ssize_t w, i, j, row, col_top, profile_idx
+    for w in prange(N_window, nogil=True, schedule="dynamic", num_threads=num_threads):
+        col_top = min(col_top_list[w] + 1, N_col)
+        for row in range(max(row_btm_list[w], row_offset), min(row_top_list[w], row_offset + N_row)):
+            i = row - row_offset
+            for j in range(col_btm_list[w], col_top):
+                profile_idx = profile_offsets[w] + j - col_btm_list[w]
+                if mz_set[i, j] == mz_set[i, j]:    # not np.nan
+                    profile_mz_sum[profile_idx] += mz_set[i, j]
+                    profile_mz_count[profile_idx] += 1
+                profile_inten_sum[profile_idx] += inten_set[i, j]
+@cython.boundscheck(False) # turn off bounds-checking for entire function
+@cython.wraparound(False)  # turn off negative index wrapping for entire function
+@cython.nonecheck(False)
+def accumulate_mz_profiles_csr(
+        const DTYPEint64_t[:] row_btm_list,     # (N_window, )
+        const DTYPEint64_t[:] row_top_list,     # (N_window, )
+        const DTYPEint64_t[:] col_btm_list,     # (N_window, )
+        const DTYPEint64_t[:] col_top_list,     # (N_window, )
+        const DTYPEint64_t[:] profile_offsets,  # (N_window + 1, )
+        const DTYPEmz_t[:] mz_values,           # (N_point, )
+        const DTYPEinten_t[:] inten_values,     # (N_point, )
+        const DTYPEint64_t[:] offsets,          # (N_row + 1, )
+        Py_ssize_t row_offset, 
+        DTYPEfloat64_t[:] profile_mz_sum,       # (profile_offsets[-1], )
+        DTYPEint64_t[:] profile_mz_count,       # (profile_offsets[-1], )
+        DTYPEfloat64_t[:] profile_inten_sum,    # (profile_offsets[-1], )
+        int num_threads=1, 
+    ):
+    cdef Py_ssize_t N_row = offsets.shape[0] - 1
+    cdef Py_ssize_t N_window = row_btm_list.shape[0]
+    cdef Py_ssize_t w, i, j, row, col_top, profile_idx
+    for w in prange(N_window, nogil=True, schedule="dynamic", num_threads=num_threads):
+        for row in range(max(row_btm_list[w], row_offset), min(row_top_list[w], row_offset + N_row)):
+            i = row - row_offset
+            # columns beyond the row length are np.nan / 0 (cf. RaggedArray.to_ndarray2d)
+            col_top = min(col_top_list[w] + 1, offsets[i + 1] - offsets[i])
+            for j in range(col_btm_list[w], col_top):
+                profile_idx = profile_offsets[w] + j - col_btm_list[w]
+                if mz_values[offsets[i] + j] == mz_values[offsets[i] + j]:  # not np.nan
+                    profile_mz_sum[profile_idx] += mz_values[offsets[i] + j]
+                    profile_mz_count[profile_idx] += 1
+                profile_inten_sum[profile_idx] += inten_values[offsets[i] + j]
+
 @cython.boundscheck(False) # turn off bounds-checking for entire function
 @cython.wraparound(False)  # turn off negative index wrapping for entire function
 @cython.nonecheck(False)
@@ -1,15 +1,23 @@
 # ビルド
 # python rpd_setup.py build_ext --inplace
 
+import sys
 from distutils.core import setup
 from distutils.extension import Extension
 from Cython.Distutils import build_ext
 
 import numpy as np
+
+# OpenMP for prange (Apple clang has no OpenMP: prange runs serially)
+if sys.platform == "darwin":
+    openmp_compile_args, openmp_link_args = [], []
+elif sys.platform == "win32":
+    openmp_compile_args, openmp_link_args = ["/openmp"], []
+else:
+    openmp_compile_args, openmp_link_args = ["-fopenmp"], ["-fopenmp"]
+
 setup(
     cmdclass = {'build_ext': build_ext},
-    ext_modules = [Extension("rpd_calc", ["rpd_calc.pyx"])],
+    ext_modules = [Extension("rpd_calc", ["rpd_calc.pyx"], extra_compile_args=openmp_compile_args, extra_link_args=openmp_link_args)],
     include_dirs=[np.get_include()] # gcc (C言語のコンパイラ) に numpy にまつわるヘッダファイルの所在を教えてあげなければいけない
 )
-
-
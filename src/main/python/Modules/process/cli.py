@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+
+# Headless (Qt-free) command line tools.
+# Run from src/main/python:
+#   python -m Modules.process.cli convert DIR_OR_FILE [DIR_OR_FILE ...] --workers 8
+#   python -m Modules.process.cli benchmark-codecs FILE.rpd --repeat 3
+#   python -m Modules.process.cli info DIR_OR_FILE [DIR_OR_FILE ...]
+#   python -m Modules.process.cli verify DIR_OR_FILE [DIR_OR_FILE ...]
+#   python -m Modules.process.cli upgrade DIR_OR_FILE [DIR_OR_FILE ...] --in-place --workers 8
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import traceback
+import contextlib
+import multiprocessing
+from io import StringIO
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from . import convert_open as co
+from ..MVP import database as db
+
+###########
+# convert #
+###########
+def is_convertible_file(file_path):
+    try:
+        co.get_rpd_path(file_path, return_rpd=False)
+    except Exception:
+        return False
+    return True
+def collect_files_to_convert(path_list):
+    file_path_list = []
+    for path in map(Path, path_list):
+        if path.is_dir():
+            file_path_list.extend(sorted(p for p in path.rglob("*") if p.is_file() and is_convertible_file(p)))
+        elif path.is_file():
+            file_path_list.append(path)
+        else:
+            raise Exception(f"no such file or directory: {path}")
+    return file_path_list
+
+# executed in the worker processes
+def convert_task(file_path, n_workers, split_segments, section_codec, byte_shuffle):
+    co.split_segments = split_segments
+    co.section_codec = section_codec
+    co.byte_shuffle = byte_shuffle
+    t0 = time.perf_counter()
+    rpd_path_list, N_scan = co.convert_file(file_path, n_workers=n_workers)
+    return rpd_path_list, N_scan, time.perf_counter() - t0
+
+def convert(args):
+    split_segments = not args.no_split
+    file_path_list = collect_files_to_convert(args.paths)
+    skipped_file_path_list = []
+    if not args.overwrite:
+        skipped_file_path_list = [file_path for file_path in file_path_list if len(co.get_existing_rpd_path_list(file_path)) > 0]
+        file_path_list = [file_path for file_path in file_path_list if file_path not in skipped_file_path_list]
+    for file_path in skipped_file_path_list:
+        print(f"skipped (rpd file exists): {file_path}")
+    print(f"converting {len(file_path_list)} file(s) with {args.workers} process(es)...")
+
+    N_done = 0
+    N_scan_total = 0
+    size_total = 0
+    failed_list = []
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = {executor.submit(convert_task, file_path, args.scan_workers, split_segments, args.codec, not args.no_shuffle): file_path for file_path in file_path_list}
+        for future in as_completed(futures):
+            file_path = futures[future]
+            N_done += 1
+            size = file_path.stat().st_size
+            try:
+                rpd_path_list, N_scan, elapsed = future.result()
+            except Exception:
+                failed_list.append(file_path)
+                print(f"[{N_done}/{len(file_path_list)}] FAILED: {file_path}\n{traceback.format_exc()}")
+                continue
+            N_scan_total += N_scan
+            size_total += size
+            print(
+                f"[{N_done}/{len(file_path_list)}] {file_path.name}: {N_scan} scans, {size / 1e6:.1f} MB, {elapsed:.1f} s "
+                f"({N_scan / elapsed:.1f} scans/s, {size / 1e6 / elapsed:.1f} MB/s) -> {', '.join(map(str, rpd_path_list))}"
+            )
+    elapsed_total = time.perf_counter() - t0
+
+    # summary
+    print()
+    print(f"converted: {len(file_path_list) - len(failed_list)}, failed: {len(failed_list)}, skipped: {len(skipped_file_path_list)}")
+    if elapsed_total > 0:
+        print(
+            f"total: {N_scan_total} scans, {size_total / 1e6:.1f} MB in {elapsed_total:.1f} s "
+            f"({N_scan_total / elapsed_total:.1f} scans/s, {size_total / 1e6 / elapsed_total:.1f} MB/s)"
+        )
+    for file_path in failed_list:
+        print(f"FAILED: {file_path}")
+    return 1 if len(failed_list) > 0 else 0
+
+####################
+# benchmark-codecs #
+####################
+# The same data is saved with every codec (with and without byte shuffle) and opened again (all chunks decoded).
+# Times are medians of --repeat runs.
+def measure(func, repeat):
+    elapsed_list = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(StringIO()):
+            result = func()
+        elapsed_list.append(time.perf_counter() - t0)
+    return statistics.median(elapsed_list), result
+def open_all(rpd_path):
+    rpd, message = co.load_3_0(rpd_path)
+    return rpd.mz_set[:], rpd.inten_set[:]
+def benchmark_codecs(args):
+    co.n_workers_section_codec = args.threads
+    with contextlib.redirect_stdout(StringIO()):
+        rpd, message = co.load_3_0(Path(args.file))
+    rpd.mz_set, rpd.inten_set = rpd.mz_set[:], rpd.inten_set[:]    # decoded once (not included in the time to save)
+    print(f"{args.file}: {rpd.N_scan} scans, {rpd.storage}, {rpd.mz_set.nbytes / 1e6 + rpd.inten_set.nbytes / 1e6:.1f} MB decoded, {args.threads} thread(s)")
+    print(f"{'codec':<10}{'shuffle':>8}{'size (MB)':>12}{'ratio':>8}{'save (s)':>10}{'open (s)':>10}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for section_codec in args.codecs:
+            for byte_shuffle in (False, True):
+                co.section_codec, co.byte_shuffle = section_codec, byte_shuffle
+                rpd_path = Path(tmp_dir) / f"{section_codec}_{byte_shuffle}.rpd"
+                save_time, _ = measure(lambda: co.dump_3_0(rpd, rpd_path), args.repeat)
+                open_time, _ = measure(lambda: open_all(rpd_path), args.repeat)
+                size = rpd_path.stat().st_size
+                print(
+                    f"{section_codec:<10}{'on' if byte_shuffle else 'off':>8}{size / 1e6:12.2f}"
+                    f"{(rpd.mz_set.nbytes + rpd.inten_set.nbytes) / size:8.1f}{save_time:10.3f}{open_time:10.3f}"
+                )
+    return 0
+
+########
+# info #
+########
+# Files are opened lazily: only the header and the small sections are read (mz_set / inten_set are not decompressed).
+def collect_rpd_files(path_list):
+    rpd_path_list = []
+    for path in map(Path, path_list):
+        if path.is_dir():
+            rpd_path_list.extend(sorted(path.rglob("*.rpd")))
+        elif path.is_file():
+            rpd_path_list.append(path)
+        else:
+            raise Exception(f"no such file or directory: {path}")
+    return rpd_path_list
+def info(args):
+    rpd_path_list = collect_rpd_files(args.paths)
+    failed_list = []
+    t0 = time.perf_counter()
+    for rpd_path in rpd_path_list:
+        try:
+            with contextlib.redirect_stdout(StringIO()):
+                rpd, message = co.open_file(rpd_path, lazy=True)
+            text = (
+                f"{rpd_path}: {db.Info(rpd).get_scan_settings_text()}, {rpd.spectrum_type}, {rpd.N_scan} scans, "
+                f"RT {rpd.RT_list[0]:.2f}-{rpd.RT_list[-1]:.2f} {rpd.RT_unit}"
+                + (f" (upgraded from data hash {rpd.source_data_hash.decode()})" if getattr(rpd, "source_data_hash", None) is not None else "")
+            )
+            # e.g. possible loss of information of v2.2 (kept in the upgraded file)
+            if message is not None:
+                text += "\n" + indent_message(message)
+        except Exception:
+            failed_list.append(rpd_path)
+            print(f"FAILED: {rpd_path}\n{traceback.format_exc()}")
+            continue
+        print(text)
+    elapsed = time.perf_counter() - t0
+    print()
+    print(f"{len(rpd_path_list) - len(failed_list)} file(s) in {elapsed:.2f} s ({elapsed / max(len(rpd_path_list), 1) * 1e3:.1f} ms/file)")
+    return 1 if len(failed_list) > 0 else 0
+
+###########
+# upgrade #
+###########
+def format_seconds(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+def indent_message(message):
+    return "\n".join(f"    {line}" for line in message.splitlines())
+def get_upgraded_rpd_path(rpd_path, in_place, suffix):
+    if in_place:
+        return rpd_path
+    return rpd_path.with_name(f"{rpd_path.stem}{suffix}{rpd_path.suffix}")
+
+# executed in the worker processes
+def upgrade_task(rpd_path, upgraded_rpd_path, section_codec, byte_shuffle):
+    co.section_codec = section_codec
+    co.byte_shuffle = byte_shuffle
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(StringIO()):
+        source_data_hash, data_hash, message = co.upgrade_file(rpd_path, upgraded_rpd_path)
+    return source_data_hash, data_hash, message, time.perf_counter() - t0
+
+def upgrade(args):
+    current_version = (co.Header().major_ver, co.Header().minor_ver)
+    rpd_path_list = collect_rpd_files(args.paths)
+    # files of the current version (including outputs of previous runs) are skipped
+    version_dict = {rpd_path:co.read_version(rpd_path) for rpd_path in rpd_path_list}
+    rpd_path_list = [rpd_path for rpd_path in rpd_path_list if version_dict[rpd_path] < current_version]
+    if args.only_2_2:
+        rpd_path_list = [rpd_path for rpd_path in rpd_path_list if version_dict[rpd_path] == (2, 2)]
+    skipped_rpd_path_list = []
+    if not (args.in_place or args.overwrite):
+        skipped_rpd_path_list = [rpd_path for rpd_path in rpd_path_list if get_upgraded_rpd_path(rpd_path, False, args.suffix).exists()]
+        rpd_path_list = [rpd_path for rpd_path in rpd_path_list if rpd_path not in skipped_rpd_path_list]
+    for rpd_path in skipped_rpd_path_list:
+        print(f"skipped (upgraded file exists): {rpd_path}")
+    print(f"upgrading {len(rpd_path_list)} file(s) to v{current_version[0]}.{current_version[1]} with {args.workers} process(es)...")
+
+    # progress / ETA based on the size of the files
+    size_dict = {rpd_path:rpd_path.stat().st_size for rpd_path in rpd_path_list}
+    size_remaining = sum(size_dict.values())
+    size_done = 0
+    N_done = 0
+    failed_list = []
+    message_dict = {}   # message on opening the original file (e.g. v2.2), also kept in the upgraded file
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = {
+            executor.submit(upgrade_task, rpd_path, get_upgraded_rpd_path(rpd_path, args.in_place, args.suffix), args.codec, not args.no_shuffle):rpd_path 
+            for rpd_path in rpd_path_list
+        }
+        for future in as_completed(futures):
+            rpd_path = futures[future]
+            N_done += 1
+            size_done += size_dict[rpd_path]
+            size_remaining -= size_dict[rpd_path]
+            elapsed_total = time.perf_counter() - t0
+            eta = format_seconds(elapsed_total / size_done * size_remaining) if size_done > 0 else "-"
+            major_ver, minor_ver = version_dict[rpd_path]
+            try:
+                source_data_hash, data_hash, message, elapsed = future.result()
+            except Exception:
+                failed_list.append(rpd_path)
+                print(f"[{N_done}/{len(rpd_path_list)}] FAILED: {rpd_path}\n{traceback.format_exc()}")
+                continue
+            print(
+                f"[{N_done}/{len(rpd_path_list)}] {rpd_path.name}: v{major_ver}.{minor_ver}, {size_dict[rpd_path] / 1e6:.1f} MB, {elapsed:.1f} s, "
+                f"data hash {source_data_hash.decode()} -> {data_hash.decode()} ({get_upgraded_rpd_path(rpd_path, args.in_place, args.suffix)}), "
+                f"elapsed {format_seconds(elapsed_total)}, ETA {eta}"
+                + (f"\n{indent_message(message)}" if message is not None else "")
+            )
+            if message is not None:
+                message_dict[rpd_path] = message
+    elapsed_total = time.perf_counter() - t0
+
+    # summary
+    print()
+    print(f"upgraded: {len(rpd_path_list) - len(failed_list)}, failed: {len(failed_list)}, skipped: {len(skipped_rpd_path_list)} ({format_seconds(elapsed_total)})")
+    for rpd_path in failed_list:
+        print(f"FAILED: {rpd_path}")
+    for rpd_path, message in message_dict.items():
+        print(f"MESSAGE: {rpd_path}\n{indent_message(message)}")
+    return 1 if len(failed_list) > 0 else 0
+
+##########
+# verify #
+##########
+def verify(args):
+    co.n_workers_section_codec = args.threads
+    rpd_path_list = collect_rpd_files(args.paths)
+    failed_list = []
+    t0 = time.perf_counter()
+    for rpd_path in rpd_path_list:
+        try:
+            co.verify_file(rpd_path)
+        except Exception as e:
+            failed_list.append(rpd_path)
+            print(f"FAILED: {e}")
+            continue
+        print(f"OK: {rpd_path}")
+    elapsed = time.perf_counter() - t0
+    print()
+    print(f"verified: {len(rpd_path_list) - len(failed_list)}, failed: {len(failed_list)} ({elapsed:.1f} s)")
+    return 1 if len(failed_list) > 0 else 0
+
+########
+# MAIN #
+########
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m Modules.process.cli", description="RAPID command line tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    # convert
+    parser_convert = subparsers.add_parser("convert", help="convert spectrum files (*.mzdata.xml, *.mzML) into *.rpd files")
+    parser_convert.add_argument("paths", nargs="+", help="files and/or directories (searched recursively)")
+    parser_convert.add_argument("-j", "--workers", type=int, default=max(os.cpu_count() * 2 // 3, 1), help="number of files converted in parallel")
+    parser_convert.add_argument("--scan-workers", type=int, default=1, help="number of processes used to decode the scans of each file")
+    parser_convert.add_argument("--overwrite", action="store_true", help="overwrite existing *.rpd files (skipped by default)")
+    parser_convert.add_argument("--no-split", action="store_true", help="do not split scans with different settings (e.g. polarity) into separate *.rpd files")
+    parser_convert.add_argument("--codec", choices=list(co.codec_dict.keys()), default=co.section_codec, help="compression of the sections ('none': fast open, 'lzma': small files)")
+    parser_convert.add_argument("--no-shuffle", action="store_true", help="do not byte-shuffle integer arrays before compression")
+    parser_convert.set_defaults(func=convert)
+    # benchmark-codecs
+    parser_benchmark = subparsers.add_parser("benchmark-codecs", help="compare size and speed of the compression codecs on a *.rpd file")
+    parser_benchmark.add_argument("file", help="*.rpd file")
+    parser_benchmark.add_argument("--codecs", nargs="+", choices=list(co.codec_dict.keys()), default=list(co.codec_dict.keys()), help="codecs to compare (default: all)")
+    parser_benchmark.add_argument("--repeat", type=int, default=3, help="number of runs of each measurement (median is reported)")
+    parser_benchmark.add_argument("--threads", type=int, default=co.n_workers_section_codec, help="number of threads used to (de)compress the sections")
+    parser_benchmark.set_defaults(func=benchmark_codecs)
+    # info
+    parser_info = subparsers.add_parser("info", help="show the settings, number of scans and RT range of *.rpd files (without decompressing the spectra)")
+    parser_info.add_argument("paths", nargs="+", help="*.rpd files and/or directories (searched recursively)")
+    parser_info.set_defaults(func=info)
+    # verify
+    parser_verify = subparsers.add_parser("verify", help="verify checksums (v3.2 or later) or data hash of *.rpd files")
+    parser_verify.add_argument("paths", nargs="+", help="*.rpd files and/or directories (searched recursively)")
+    parser_verify.add_argument("--threads", type=int, default=co.n_workers_section_codec, help="number of threads used to verify the chunks of each file")
+    parser_verify.set_defaults(func=verify)
+    # upgrade
+    parser_upgrade = subparsers.add_parser("upgrade", help="rewrite *.rpd files of older versions in the current format")
+    parser_upgrade.add_argument("paths", nargs="+", help="*.rpd files and/or directories (searched recursively)")
+    parser_upgrade.add_argument("-j", "--workers", type=int, default=max(os.cpu_count() * 2 // 3, 1), help="number of files upgraded in parallel")
+    parser_upgrade.add_argument("--in-place", action="store_true", help="replace the original files (the original data hash is kept in the upgraded files)")
+    parser_upgrade.add_argument("--suffix", default="_upgraded", help="suffix of the upgraded files saved side by side (without --in-place)")
+    parser_upgrade.add_argument("--overwrite", action="store_true", help="overwrite existing upgraded files (skipped by default)")
+    parser_upgrade.add_argument("--only-2-2", action="store_true", help="upgrade v2.2 files only (m/z info for chromatogram extraction is recalculated on every open)")
+    parser_upgrade.add_argument("--codec", choices=list(co.codec_dict.keys()), default=co.section_codec, help="compression of the sections")
+    parser_upgrade.add_argument("--no-shuffle", action="store_true", help="do not byte-shuffle integer arrays before compression")
+    parser_upgrade.set_defaults(func=upgrade)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
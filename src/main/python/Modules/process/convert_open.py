@@ -1,6 +1,13 @@
 # -*- coding: utf-8 -*-
 
+import os
 import sys
+import time
+import multiprocessing
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 import numpy as np
 import pickle
@@ -9,28 +16,307 @@ import xml.etree.cElementTree as ET
 import hashlib
 import base64
 import struct
+import zlib
+import re
+import glob
+import shutil
+import bz2
+import lzma
+from functools import partial
 import pickle
 import traceback
 from pathlib import Path
 
-from PyQt6.QtCore import (
-    Qt, 
-    QThread, 
-    QRunnable, 
-    pyqtSignal, 
-    pyqtSlot, 
-    QObject, 
-)
 from ..MVP import database as db
-from ..widgets import popups
 
 cvParam_assertion = True
+# conversion of a single file: scans are decoded in blocks by a process pool when n_workers > 1
+n_workers_conversion = max(os.cpu_count() * 2 // 3, 1)
+scans_per_block = 64
+min_scans_for_process_pool = 1000  # starting worker processes does not pay off for small files
+# in-memory layout of mz_set/inten_set: "ndarray2d" (padded to the longest scan) or "ragged" (db.RaggedArray)
+storage_dict = {"continuous":"ndarray2d", "discrete":"ragged"}
+# scans with different settings (e.g. polarity switching) are converted into separate rpd files (one per segment)
+split_segments = True
+# inten_set is stored in the narrowest of these dtypes that holds all values (e.g. uint16 for detectors up to 65535 counts)
+compact_inten_dtype = True
+compact_inten_dtype_list = [np.uint16, np.int32, np.int64]
+# opt-in: mz_set is stored as float32 if the rounding error is below mz_float32_max_ppm_error for all points
+mz_float32 = False
+mz_float32_max_ppm_error = 0.1
+# mz_set of continuous data (ndarray2d) is saved as a calibration model of each scan + residual (see encode_mz_set_tof_model)
+mz_set_encoding_continuous = "tof_model"   # or "deep_diff"
+tof_model_degree = 3
+# v3.0 file: consecutive scans (RT blocks) are compressed in separate chunks, which are decompressed on first access
+scans_per_chunk = 256
+max_chunks = 1024                       # chunk index is saved in the header (header size < 64 KB)
+chunk_cache_bytes = 256 * 1024 ** 2     # decoded chunks kept in memory (for each of mz_set and inten_set)
+# sections of a file (m/z, intensity, additional info) and chunks of v3.0 are (de)compressed concurrently by this number of
+# threads (zlib and numpy release the GIL)
+n_workers_section_codec = 3
+# threads of the deep_diff kernels for whole arrays (chunks of v3.0 are processed by 1 thread each, in parallel)
+n_threads_deep_diff = os.cpu_count() or 1
+# codecs of the sections of v3.0 files: name -> (compress, decompress). The codec of each section is saved in the header.
+codec_dict = {
+    "none":     (bytes, bytes),     # fast open
+    "zlib-1":   (partial(zlib.compress, level=1), zlib.decompress), 
+    "zlib-6":   (partial(zlib.compress, level=6), zlib.decompress), 
+    "zlib-9":   (partial(zlib.compress, level=9), zlib.decompress), 
+    "bz2":      (partial(bz2.compress, compresslevel=9), bz2.decompress), 
+    "lzma":     (partial(lzma.compress, preset=6), lzma.decompress), # small files (archive)
+}
+section_codec = "zlib-6"
+# bytes of integer arrays (intensity, differences, residuals) are regrouped by significance before compression
+byte_shuffle = True
+# opt-in: decoded data of opened rpd files is cached on disk, and mapped into memory when the file is opened again
+decoded_cache = False
+decoded_cache_dir = Path.home() / ".RAPID" / "decoded_cache"
+decoded_cache_max_bytes = 8 * 1024 ** 3 # least recently used entries are removed above this size
+# opt-in: checksums (crc32, v3.2) of the sections and of the chunks being decoded are verified when a file is opened.
+# The whole file can be verified by verify_file (e.g. in background).
+verify_checksums = False
+
+# Reads *.mzdata.xml incrementally: each <spectrum> is yielded as soon as it is parsed, and released (together with
+# its base64 text) before the next one is read, so that the whole xml tree is never held in memory.
+class MzDataReader():
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.N_scan = None
+        self.ionization_type = None
+        self.analyzer_type = None
+    def iter_spectra(self):
+        spectrum_list = None
+        for event, elem in ET.iterparse(self.file_path, events=("start", "end")):
+            if event == "start":
+                if elem.tag == "spectrumList":
+                    spectrum_list = elem
+                    self.N_scan = int(elem.get("count"))
+            elif elem.tag == "spectrum":
+                yield elem
+                elem.clear()
+                spectrum_list.remove(elem)
+            elif elem.tag == "description":
+                self.read_description(elem)
+    def read_description(self, description):
+        self.ionization_type = description.find("instrument/source/cvParam").get("value")                # Esi
+        self.analyzer_type = description.find("instrument/analyzerList/analyzer/cvParam").get("value")   # TimeOfFlight
+        description.clear()
+    # for worker processes: the description is read, and byte offsets of <spectrum> elements are searched in the raw bytes
+    # (as for mzML without index), so that each worker can read its own range of spectra
+    def read_header(self):
+        with open(self.file_path, "rb") as f:
+            for event, elem in ET.iterparse(f, events=("start", "end")):
+                if event == "start":
+                    if elem.tag == "spectrumList":
+                        self.N_scan = int(elem.get("count"))
+                        break
+                elif elem.tag == "description":
+                    self.read_description(elem)
+    def read_offset_list(self):
+        with open(self.file_path, "rb") as f:
+            return MzMLReader.search_offset_list(f)
+
+# Growable buffers in which decoded scans are concatenated (values + per-scan offsets).
+# Memory is proportional to the number of data points, not to the size of the xml file.
+# With column_stats=True, m/z min/max of each column (j-th point of every scan) are collected while appending,
+# which is what the writer needs for mz_set_info_for_chromatogram_extraction (no pass over the full matrix).
+class ScanArrayBuilder():
+    def __init__(self, mz_dtype, inten_dtype, N_point_hint=0, column_stats=False):
+        self.mz_dtype = mz_dtype
+        self.inten_dtype = inten_dtype
+        capacity = max(N_point_hint, 1)
+        self.mz_values = np.empty(capacity, dtype=mz_dtype)
+        self.inten_values = np.empty(capacity, dtype=inten_dtype)
+        self.offsets = [0]
+        self.N_point = 0
+        # column statistics
+        self.column_stats = column_stats
+        self.column_mz_min = np.empty(0, dtype=float)
+        self.column_mz_max = np.empty(0, dtype=float)
+        self.column_count = np.empty(0, dtype=np.int64)    # number of scans that have the column
+    @property
+    def N_scan(self):
+        return len(self.offsets) - 1
+    def reserve(self, N_point):
+        capacity = len(self.mz_values)
+        if N_point <= capacity:
+            return
+        while capacity < N_point:
+            capacity *= 2
+        self.mz_values = np.resize(self.mz_values, capacity)
+        self.inten_values = np.resize(self.inten_values, capacity)
+    def append(self, mz_data, inten_data):
+        s = self.N_point
+        e = s + len(mz_data)
+        self.reserve(e)
+        self.mz_values[s:e] = mz_data
+        self.inten_values[s:e] = inten_data
+        self.offsets.append(e)
+        self.N_point = e
+        if self.column_stats:
+            self.update_column_stats(self.mz_values[s:e])
+    def append_block(self, mz_values, inten_values, scan_lengths):
+        s = self.N_point
+        e = s + len(mz_values)
+        self.reserve(e)
+        self.mz_values[s:e] = mz_values
+        self.inten_values[s:e] = inten_values
+        N_scan_before = self.N_scan
+        self.offsets.extend((s + np.cumsum(scan_lengths)).tolist())
+        self.N_point = e
+        if self.column_stats:
+            for scan_s, scan_e in zip(self.offsets[N_scan_before:-1], self.offsets[N_scan_before + 1:]):
+                self.update_column_stats(self.mz_values[scan_s:scan_e])
+    def update_column_stats(self, mz_data):
+        length = len(mz_data)
+        if length > len(self.column_count):
+            N_new = length - len(self.column_count)
+            self.column_mz_min = np.append(self.column_mz_min, np.full(N_new, np.inf))
+            self.column_mz_max = np.append(self.column_mz_max, np.full(N_new, -np.inf))
+            self.column_count = np.append(self.column_count, np.zeros(N_new, dtype=np.int64))
+        np.minimum(self.column_mz_min[:length], mz_data, out=self.column_mz_min[:length])
+        np.maximum(self.column_mz_max[:length], mz_data, out=self.column_mz_max[:length])
+        self.column_count[:length] += 1
+    # np.nan for columns that are missing in some scans (i.e. columns including np.nan padding in the ndarray2d)
+    def column_mz_range(self):
+        is_complete = self.column_count == self.N_scan
+        return np.where(is_complete, self.column_mz_min, np.nan), np.where(is_complete, self.column_mz_max, np.nan)
+    def scan_lengths(self):
+        return np.diff(self.offsets)
+    # narrowest dtype in compact_inten_dtype_list that holds all intensity values
+    def get_compact_inten_dtype(self):
+        inten_values = self.inten_values[:self.N_point]
+        if len(inten_values) == 0:
+            return self.inten_dtype
+        inten_min = inten_values.min()
+        inten_max = inten_values.max()
+        for inten_dtype in compact_inten_dtype_list:
+            if np.iinfo(inten_dtype).min <= inten_min and inten_max <= np.iinfo(inten_dtype).max:
+                return inten_dtype
+        return self.inten_dtype
+    # maximum relative error (ppm) when mz values are rounded to float32
+    def get_mz_float32_ppm_error(self):
+        mz_values = self.mz_values[:self.N_point]
+        if len(mz_values) == 0:
+            return 0.
+        mz_values_float32 = mz_values.astype(np.float32)
+        return np.max(np.abs(mz_values_float32 - mz_values) / np.abs(mz_values), initial=0, where=(mz_values != 0)) * 1e6
+    def to_ndarray2d(self, mz_dtype=None, inten_dtype=None):
+        columns = self.scan_lengths().max()
+        mz_set = np.full((self.N_scan, columns), np.nan, dtype=self.mz_dtype if mz_dtype is None else mz_dtype)
+        inten_set = np.zeros((self.N_scan, columns), dtype=self.inten_dtype if inten_dtype is None else inten_dtype)
+        # fill values
+        for r, (s, e) in enumerate(zip(self.offsets[:-1], self.offsets[1:])):
+            mz_set[r, :e - s] = self.mz_values[s:e]
+            inten_set[r, :e - s] = self.inten_values[s:e]
+        return mz_set, inten_set
+    def to_ragged(self, mz_dtype=None, inten_dtype=None):
+        offsets = np.array(self.offsets, dtype=np.int64)
+        mz_set = db.RaggedArray(self.mz_values[:self.N_point].astype(self.mz_dtype if mz_dtype is None else mz_dtype), offsets)
+        inten_set = db.RaggedArray(self.inten_values[:self.N_point].astype(self.inten_dtype if inten_dtype is None else inten_dtype), offsets)
+        return mz_set, inten_set
+
+# Routes decoded scans to one ScanArrayBuilder per acquisition segment (scans sharing the same spectrum settings except
+# RT, e.g. positive/negative scans of a polarity switching run) while the file is parsed, so that every segment gets
+# dense arrays (and column statistics) of its own. With split=False, all scans go to a single builder.
+class SegmentRouter():
+    def __init__(self, mz_dtype, inten_dtype, N_point_hint=0, column_stats=False, split=True):
+        self.mz_dtype = mz_dtype
+        self.inten_dtype = inten_dtype
+        self.N_point_hint = N_point_hint
+        self.column_stats = column_stats
+        self.split = split
+        self.builder_list = []
+        self.spectrum_settings_list_list = []   # spectrum settings of the scans of each segment
+        self.segment_idx_dict = {}              # fingerprint: segment_idx
+        self.raw_segment_idx_dict = {}          # cvParam list without RT (in the original order): segment_idx
+    @property
+    def N_scan(self):
+        return sum(builder.N_scan for builder in self.builder_list)
+    def get_segment_idx(self, spectrum_settings):
+        if not self.split:
+            raw_key = fingerprint = ()
+        else:
+            RT_value, raw_key = split_RT(spectrum_settings)
+        segment_idx = self.raw_segment_idx_dict.get(raw_key)
+        if segment_idx is None:
+            if self.split:
+                fingerprint = tuple(sorted(raw_key))
+            segment_idx = self.segment_idx_dict.get(fingerprint)
+            if segment_idx is None:
+                # buffers of the first segment are sized for the whole file, later ones grow as needed
+                segment_idx = self.segment_idx_dict[fingerprint] = len(self.builder_list)
+                self.builder_list.append(ScanArrayBuilder(
+                    self.mz_dtype, 
+                    self.inten_dtype, 
+                    N_point_hint=self.N_point_hint if segment_idx == 0 else 0, 
+                    column_stats=self.column_stats
+                ))
+                self.spectrum_settings_list_list.append([])
+            self.raw_segment_idx_dict[raw_key] = segment_idx
+        return segment_idx
+    def append(self, mz_data, inten_data, spectrum_settings):
+        segment_idx = self.get_segment_idx(spectrum_settings)
+        self.builder_list[segment_idx].append(mz_data, inten_data)
+        self.spectrum_settings_list_list[segment_idx].append(spectrum_settings)
+    def append_block(self, mz_values, inten_values, scan_lengths, spectrum_settings_list):
+        segment_idx_list = [self.get_segment_idx(spectrum_settings) for spectrum_settings in spectrum_settings_list]
+        # usually, the whole block belongs to a single segment
+        if all(segment_idx == segment_idx_list[0] for segment_idx in segment_idx_list):
+            self.builder_list[segment_idx_list[0]].append_block(mz_values, inten_values, scan_lengths)
+            self.spectrum_settings_list_list[segment_idx_list[0]].extend(spectrum_settings_list)
+            return
+        e_list = np.cumsum(scan_lengths)
+        for segment_idx, spectrum_settings, s, e in zip(segment_idx_list, spectrum_settings_list, e_list - scan_lengths, e_list):
+            self.builder_list[segment_idx].append(mz_values[s:e], inten_values[s:e])
+            self.spectrum_settings_list_list[segment_idx].append(spectrum_settings)
+
+# Accumulates elapsed time per processing stage (e.g. per-scan decoding steps).
+class StageTimer():
+    def __init__(self):
+        self.elapsed_dict = defaultdict(float)
+        self.t_start = time.perf_counter()
+    @contextmanager
+    def measure(self, stage):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - t0)
+    # e.g. executor.submit(timer.timed, stage, func, *args)
+    def timed(self, stage, func, *args):
+        with self.measure(stage):
+            return func(*args)
+    def add(self, stage, elapsed):
+        self.elapsed_dict[stage] += elapsed
+    def total(self):
+        return sum(self.elapsed_dict.values())
+    def summary(self, title, N_scan=None, concurrent=False):
+        if concurrent:  # stages overlap: elapsed time since the timer was created
+            lines = [f"{title}: {time.perf_counter() - self.t_start:.3f} s (sum of stages: {self.total():.3f} s)"]
+        else:
+            lines = [f"{title}: {self.total():.3f} s"]
+        for stage, elapsed in self.elapsed_dict.items():
+            line = f"    {stage:<24}{elapsed:10.3f} s"
+            if N_scan:
+                line += f"{elapsed / N_scan * 1e6:12.1f} us/scan"
+            lines.append(line)
+        return "\n".join(lines)
+
+# decode_method
+#   "numpy":  bytes are viewed as a typed array (no python float objects are created).
+#   "struct": previous implementation (tuple of python floats). Kept for comparison of speed.
+def decode_binary_array(binary, length, e, p, decode_method="numpy"):
+    if decode_method == "numpy":
+        return np.frombuffer(binary, dtype=np.dtype(f"{e}{p}"), count=length)
+    elif decode_method == "struct":
+        return struct.unpack(f"{e}{length}{p}", binary)
+    else:
+        raise Exception(f"unknown decode method: {decode_method}")
 
-def mzdata2rpd(file_path, option):
-    root = ET.ElementTree(file=file_path).getroot()
-    # read first spectrum   ("discrete" or "continuous")
-    spectrum = root.find("spectrumList")[0]
-    spectrum_type = spectrum.find("spectrumDesc/spectrumSettings/acqSpecification").get("spectrumType")
+# binary format of the first spectrum: spectrum_type, (endian, precision) and dtype of mz and inten
+def parse_mzdata_format(spectrum):
+    spectrum_type = spectrum.find("spectrumDesc/spectrumSettings/acqSpecification").get("spectrumType")  # "discrete" or "continuous"
     # mz
     mz_binary = spectrum.find("mzArrayBinary/data")
     mz_precision = mz_binary.get("precision")
@@ -52,25 +338,178 @@ def mzdata2rpd(file_path, option):
     if inten_precision == "32":     inten_p, inten_dtype = "f", np.int32
     elif inten_precision == "64":   inten_p, inten_dtype = "d", np.int64
     else:                           raise Exception(f"unsupported inten precision:{inten_precision}")
+    return spectrum_type, (mz_e, mz_p), mz_dtype, (inten_e, inten_p), inten_dtype, int(mz_binary.get("length"))
+
+# spectrum description (RT etc.) and binary arrays: [(name, value), ...], (text, length), (text, length)
+def parse_mzdata_spectrum(spectrum):
+    spectrum_settings = [
+        (cvParam.get("name"), cvParam.get("value")) for cvParam in spectrum.find("spectrumDesc/spectrumSettings/spectrumInstrument")
+    ]
+    mz_binary = spectrum.find("mzArrayBinary/data")
+    inten_binary = spectrum.find("intenArrayBinary/data")
+    return spectrum_settings, (mz_binary.text, int(mz_binary.get("length"))), (inten_binary.text, int(inten_binary.get("length")))
+
+# executed in the worker processes: spectra are read by seeking to their offsets (parsed and decoded in the worker)
+def decode_mzdata_spectrum_range(file_path, offset_list, mz_format, inten_format, mz_dtype, inten_dtype, decode_method):
+    timer = StageTimer()
+    builder = None
+    spectrum_settings_list = []
+    with open(file_path, "rb") as f:
+        for offset in offset_list:
+            with timer.measure("parse xml"):
+                spectrum_settings, (mz_text, mz_length), (inten_text, inten_length) = parse_mzdata_spectrum(read_mzml_spectrum(f, offset))
+            if builder is None:
+                builder = ScanArrayBuilder(mz_dtype, inten_dtype, N_point_hint=len(offset_list) * mz_length)
+            with timer.measure("decode base64"):
+                mz_bytes = base64.b64decode(mz_text)
+                inten_bytes = base64.b64decode(inten_text)
+            with timer.measure(f"decode binary ({decode_method})"):
+                mz_data = decode_binary_array(mz_bytes, mz_length, *mz_format, decode_method)
+                inten_data = decode_binary_array(inten_bytes, inten_length, *inten_format, decode_method)
+            with timer.measure("copy to buffer"):
+                builder.append(mz_data, inten_data)
+            spectrum_settings_list.append(spectrum_settings)
+    return builder.mz_values[:builder.N_point], builder.inten_values[:builder.N_point], builder.scan_lengths(), spectrum_settings_list, dict(timer.elapsed_dict)
+
+def mzdata2rpd(file_path, option, decode_method="numpy", n_workers=None):
+    if n_workers is None:
+        n_workers = n_workers_conversion
+    mzdata_reader = MzDataReader(file_path)
+    timer = StageTimer()
+    # ranges of consecutive scans (RT blocks): each worker process opens the file and seeks to its own range
+    use_process_pool = False
+    if n_workers > 1:
+        with timer.measure("search spectra"):
+            mzdata_reader.read_header()
+            offset_list = mzdata_reader.read_offset_list()
+        use_process_pool = len(offset_list) >= min_scans_for_process_pool
+    if use_process_pool:
+        # read first spectrum
+        with open(file_path, "rb") as f:
+            spectrum_type, mz_format, mz_dtype, inten_format, inten_dtype, length = parse_mzdata_format(read_mzml_spectrum(f, offset_list[0]))
+        router = SegmentRouter(
+            mz_dtype, 
+            inten_dtype, 
+            N_point_hint=len(offset_list) * length, 
+            column_stats=(spectrum_type == "continuous"), 
+            split=split_segments
+        )
+        range_size = max(-(-len(offset_list) // (4 * n_workers)), scans_per_block)
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = [
+                executor.submit(decode_mzdata_spectrum_range, file_path, offset_list[i:i + range_size], mz_format, inten_format, mz_dtype, inten_dtype, decode_method)
+                for i in range(0, len(offset_list), range_size)
+            ]
+            try:
+                with timer.measure("wait for workers"):
+                    for future in futures:
+                        mz_values, inten_values, scan_lengths, range_spectrum_settings_list, elapsed_dict = future.result()
+                        router.append_block(mz_values, inten_values, scan_lengths, range_spectrum_settings_list)
+                        for stage, elapsed in elapsed_dict.items():
+                            timer.add(stage, elapsed)
+            finally:
+                executor.shutdown(cancel_futures=True)
+    else:
+        router = None
+        t0 = time.perf_counter()
+        for spectrum in mzdata_reader.iter_spectra():
+            timer.add("parse xml", time.perf_counter() - t0)
+            if router is None:
+                # read first spectrum
+                spectrum_type, (mz_e, mz_p), mz_dtype, (inten_e, inten_p), inten_dtype, length = parse_mzdata_format(spectrum)
+                # prepare buffers: assume that all scans are about as long as the first one
+                router = SegmentRouter(
+                    mz_dtype, 
+                    inten_dtype, 
+                    N_point_hint=mzdata_reader.N_scan * length, 
+                    column_stats=(spectrum_type == "continuous"), 
+                    split=split_segments
+                )
+            spectrum_settings, (mz_text, mz_length), (inten_text, inten_length) = parse_mzdata_spectrum(spectrum)
+            with timer.measure("decode base64"):
+                mz_bytes = base64.b64decode(mz_text)
+                inten_bytes = base64.b64decode(inten_text)
+            with timer.measure(f"decode binary ({decode_method})"):
+                mz_data = decode_binary_array(mz_bytes, mz_length, mz_e, mz_p, decode_method)
+                inten_data = decode_binary_array(inten_bytes, inten_length, inten_e, inten_p, decode_method)
+            with timer.measure("copy to buffer"):
+                router.append(mz_data, inten_data, spectrum_settings)
+            t0 = time.perf_counter()
+    rpd_list = build_rpd_list(
+        file_path, 
+        router, 
+        spectrum_type, 
+        ionization_type = mzdata_reader.ionization_type,    # Esi
+        analyzer_type = mzdata_reader.analyzer_type,        # TimeOfFlight
+        timer = timer, 
+        title = f"parsed {router.N_scan} scans" + (f" ({n_workers} processes)" if use_process_pool else "")
+    )
+
+    # RAPID 処理
+    if option != "skip RAPID":
+        raise Exception("not yet!")
 
-    # read all data
-    N_scan = int(root.find("spectrumList").get("count"))
-    mz_set_pre = [None for i in range(N_scan)]
-    inten_set_pre = [None for i in range(N_scan)]
-    spectrum_settings_list = [None for i in range(N_scan)]
-    for i, spectrum in enumerate(root.find("spectrumList")):
-        # spectrum description (RT etc.)
-        spectrum_settings_list[i] = spectrum.find("spectrumDesc/spectrumSettings/spectrumInstrument")
-        # mz
-        mz_binary = spectrum.find("mzArrayBinary/data")
-        mz_set_pre[i] = struct.unpack(f"{mz_e}{mz_binary.get('length')}{mz_p}", base64.b64decode(mz_binary.text))
-        # inten
-        inten_binary = spectrum.find("intenArrayBinary/data")
-        inten_set_pre[i] = struct.unpack(f"{inten_e}{inten_binary.get('length')}{inten_p}", base64.b64decode(inten_binary.text))
-    mz_set, inten_set = convert_2_ndarray2d(mz_set_pre, inten_set_pre, mz_dtype, inten_dtype)
-    RT_list, RT_unit, spectrum_settings_dict = parse_spectrum_settings(spectrum_settings_list)
+    return rpd_list
+# common to all input formats: decoded scans (router) -> [db.RPD, ...] (one RPD per segment)
+def build_rpd_list(file_path, router, spectrum_type, ionization_type, analyzer_type, timer, title):
+    rpd_list = [
+        build_rpd(file_path, builder, spectrum_type, spectrum_settings_list, ionization_type, analyzer_type, timer)
+        for builder, spectrum_settings_list in zip(router.builder_list, router.spectrum_settings_list_list)
+    ]
+    print(timer.summary(title, N_scan=router.N_scan))
+    if len(rpd_list) > 1:
+        print(f"split into {len(rpd_list)} segments")
+        print(get_spectrum_settings_report([rpd.spectrum_settings_dict for rpd in rpd_list], [rpd.N_scan for rpd in rpd_list]))
+    return rpd_list
+def build_rpd(file_path, builder, spectrum_type, spectrum_settings_list, ionization_type, analyzer_type, timer):
+    # dtypes
+    with timer.measure("select dtypes"):
+        inten_dtype = builder.get_compact_inten_dtype() if compact_inten_dtype else builder.inten_dtype
+        mz_dtype = builder.mz_dtype
+        if mz_float32 and (mz_dtype != np.float32):
+            ppm_error = builder.get_mz_float32_ppm_error()
+            if ppm_error <= mz_float32_max_ppm_error:
+                mz_dtype = np.float32
+            else:
+                print(f"m/z is stored as {np.dtype(mz_dtype).name}: rounding error of float32 is {ppm_error:.3g} ppm (> {mz_float32_max_ppm_error} ppm)")
+    storage = storage_dict[spectrum_type]
+    with timer.measure(f"layout ({storage})"):
+        if storage == "ndarray2d":
+            mz_set, inten_set = builder.to_ndarray2d(mz_dtype, inten_dtype)
+        elif storage == "ragged":
+            mz_set, inten_set = builder.to_ragged(mz_dtype, inten_dtype)
+        else:
+            raise Exception(f"unknown storage: {storage}")
+    # side indexes for the writer, from the statistics collected while decoding
+    with timer.measure("side indexes"):
+        scan_lengths = builder.scan_lengths()
+        if spectrum_type == "continuous":
+            ref_row = int(np.argmax(scan_lengths))  # first scan without np.nan padding
+            # rounding to mz_dtype is monotonic, so that min/max of the rounded values are the rounded min/max
+            column_mz_min, column_mz_max = (column_mz.astype(mz_dtype) for column_mz in builder.column_mz_range())
+            mz_set_info_for_chromatogram_extraction = db.RPD.get_mz_set_info_for_chromatogram_extraction_from_column_range(
+                mz_set[ref_row], 
+                column_mz_min, 
+                column_mz_max
+            )
+        elif spectrum_type == "discrete":
+            ref_row = 0
+            mz_set_info_for_chromatogram_extraction = None
+        else:
+            raise Exception(f"unknown spectrum type: {spectrum_type}")
+    with timer.measure("parse settings"):
+        RT_list, RT_unit, spectrum_settings_dict_list, group_idx_list = parse_spectrum_settings(spectrum_settings_list)
+    if len(spectrum_settings_dict_list) > 1:
+        report = get_spectrum_settings_report(
+            spectrum_settings_dict_list, 
+            np.bincount(group_idx_list, minlength=len(spectrum_settings_dict_list))
+        )
+        if cvParam_assertion:
+            raise Exception(f"scans with different settings were found in\n{file_path}\n{report}")
+        print(report)
+    spectrum_settings_dict = spectrum_settings_dict_list[0]
     # RPD
-    rpd = db.RPD(
+    return db.RPD(
         data_hash = None,  # will be generated when saving file
         file_path = file_path, 
         spectrum_type = spectrum_type, 
@@ -80,59 +519,359 @@ def mzdata2rpd(file_path, option):
         RT_unit = RT_unit, 
         spectrum_settings_dict = spectrum_settings_dict, 
         # general_info
-        ionization_type = root.find("description/instrument/source/cvParam").get("value"),      # Esi
-        analyzer_type = root.find("description/instrument/analyzerList/analyzer/cvParam").get("value")   # TimeOfFlight
+        ionization_type = ionization_type, 
+        analyzer_type = analyzer_type, 
+        ref_row = ref_row, 
+        mz_set_info_for_chromatogram_extraction = mz_set_info_for_chromatogram_extraction, 
+        scan_lengths = scan_lengths
+    )
+# Settings of each scan are fingerprinted (sorted (name, value) tuples except RT) and scans are grouped by the
+# fingerprint. Fingerprints are computed only once per distinct cvParam list (RT is usually the last cvParam), and RT
+# values are converted at once.
+# spectrum_settings_dict_list: settings of each group (in order of appearance), group_idx_list: group of each scan
+def parse_spectrum_settings(spectrum_settings_list, RT_unit="TimeInMinutes"):
+    RT_value_list = []
+    group_idx_list = []
+    group_idx_dict = {}     # fingerprint: group_idx
+    raw_group_idx_dict = {} # cvParam list without RT (in the original order): group_idx
+    spectrum_settings_dict_list = []
+    for cvParam_list in spectrum_settings_list:
+        RT_value, raw_key = split_RT(cvParam_list, RT_unit)
+        RT_value_list.append(RT_value)
+        group_idx = raw_group_idx_dict.get(raw_key)
+        if group_idx is None:
+            fingerprint = tuple(sorted(raw_key))
+            group_idx = group_idx_dict.get(fingerprint)
+            if group_idx is None:
+                group_idx = group_idx_dict[fingerprint] = len(spectrum_settings_dict_list)
+                spectrum_settings_dict_list.append(dict(raw_key))
+            raw_group_idx_dict[raw_key] = group_idx
+        group_idx_list.append(group_idx)
+    if None in RT_value_list:
+        raise Exception(f"{RT_unit} is missing in scan {RT_value_list.index(None)}")
+    RT_list = np.array(RT_value_list, dtype=float)
+    return RT_list, RT_unit, spectrum_settings_dict_list, np.array(group_idx_list, dtype=np.int64)
+# returns RT value (None if missing) and the cvParam list without RT (in the original order)
+def split_RT(cvParam_list, RT_unit="TimeInMinutes"):
+    # RT is usually the last cvParam
+    if cvParam_list[-1][0] == RT_unit:
+        return cvParam_list[-1][1], tuple(cvParam_list[:-1])
+    else:
+        return dict(cvParam_list).get(RT_unit), tuple(cvParam for cvParam in cvParam_list if cvParam[0] != RT_unit)
+def get_spectrum_settings_report(spectrum_settings_dict_list, N_scan_list):
+    lines = [f"{len(spectrum_settings_dict_list)} group(s) of spectrum settings:"]
+    for group_idx, (spectrum_settings_dict, N_scan) in enumerate(zip(spectrum_settings_dict_list, N_scan_list)):
+        settings_text = ", ".join(f"{name}={value}" for name, value in spectrum_settings_dict.items())
+        lines.append(f"    group {group_idx}: {N_scan} scans ({settings_text})")
+    return "\n".join(lines)
+
+########
+# mzML #
+########
+# accession numbers of the PSI-MS controlled vocabulary used for conversion
+mzML_spectrum_type_dict = {"MS:1000127":"discrete", "MS:1000128":"continuous"}     # centroid / profile spectrum
+mzML_polarity_dict = {"MS:1000130":"Positive", "MS:1000129":"Negative"}
+mzML_scan_mode_dict = {"MS:1000579":"MassScan", "MS:1000580":"ProductIonScan", "MS:1000582":"SelectedIonDetection"}    # MS1 / MSn / SIM spectrum
+mzML_ionization_type_dict = {"MS:1000073":"Esi", "MS:1000070":"Apci", "MS:1000075":"Maldi"}
+mzML_analyzer_type_dict = {"MS:1000084":"TimeOfFlight", "MS:1000081":"Quadrupole", "MS:1000484":"Orbitrap", "MS:1000082":"IonTrap"}
+mzML_precision_dict = {"MS:1000521":"f4", "MS:1000523":"f8", "MS:1000519":"i4", "MS:1000522":"i8"}   # binary data is always little endian
+mzML_compression_list = ["MS:1000574", "MS:1000576"]    # zlib / no compression
+mzML_array_type_dict = {"MS:1000514":"mz", "MS:1000515":"inten"}
+mzML_RT_accession = "MS:1000016"                        # scan start time
+mzML_RT_unit_dict = {"UO:0000031":1, "UO:0000010":1 / 60, None:1}  # minute / second -> minute
+
+def local_tag(tag):
+    return tag.rsplit("}", 1)[-1]
+def strip_namespace(elem):
+    for e in elem.iter():
+        e.tag = local_tag(e.tag)
+    return elem
+# cvParam: (accession, name, value, unitAccession); cvParams in referenceableParamGroups are expanded
+def iter_cvParams(elem, param_group_dict):
+    for child in elem:
+        tag = local_tag(child.tag)
+        if tag == "cvParam":
+            yield child.get("accession"), child.get("name"), child.get("value"), child.get("unitAccession")
+        elif tag == "referenceableParamGroupRef":
+            yield from param_group_dict[child.get("ref")]
+
+# Reads indexed *.mzML: byte offsets of <spectrum> elements are taken from the trailing <indexList>, so that any range
+# of spectra can be read (also in worker processes) by seeking directly to it.
+# For mzML without index (or with a broken one), offsets are searched in the raw bytes instead.
+class MzMLReader():
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.param_group_dict = {}  # referenceableParamGroup id: [cvParam, ...]
+        self.ionization_type = "Unknown"
+        self.analyzer_type = "Unknown"
+        self.read_header()
+        self.offset_list = self.read_offset_list()
+    @property
+    def N_scan(self):
+        return len(self.offset_list)
+    def read_header(self):
+        with open(self.file_path, "rb") as f:
+            for event, elem in ET.iterparse(f, events=("start", "end")):
+                tag = local_tag(elem.tag)
+                if event == "start":
+                    if tag == "run":
+                        break
+                elif tag == "referenceableParamGroup":
+                    self.param_group_dict[elem.get("id")] = list(iter_cvParams(elem, self.param_group_dict))
+                elif tag == "instrumentConfiguration":
+                    for component in elem.iter():
+                        component_tag = local_tag(component.tag)
+                        if component_tag not in ("source", "analyzer"):
+                            continue
+                        for accession, name, value, unit in iter_cvParams(component, self.param_group_dict):
+                            if (component_tag == "source") and (accession in mzML_ionization_type_dict):
+                                self.ionization_type = mzML_ionization_type_dict[accession]
+                            elif (component_tag == "analyzer") and (accession in mzML_analyzer_type_dict):
+                                self.analyzer_type = mzML_analyzer_type_dict[accession]
+                    elem.clear()
+    def read_offset_list(self):
+        with open(self.file_path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(f.tell() - 4096, 0))
+            m = re.search(rb"<indexListOffset>\s*(\d+)\s*</indexListOffset>", f.read())
+            if m is not None:
+                f.seek(int(m.group(1)))
+                index_list_bytes = f.read()
+                index_list_bytes = index_list_bytes[:index_list_bytes.find(b"</indexList>") + len(b"</indexList>")]
+                try:
+                    index_list = strip_namespace(ET.fromstring(index_list_bytes))
+                except ET.ParseError:
+                    index_list = None
+                if (index_list is not None) and (local_tag(index_list.tag) == "indexList"):
+                    for index in index_list.iter("index"):
+                        if index.get("name") == "spectrum":
+                            offset_list = [int(offset.text) for offset in index.iter("offset")]
+                            # validation
+                            if all(self.is_spectrum_offset(f, offset) for offset in offset_list[:1] + offset_list[-1:]):
+                                return offset_list
+            print(f"mzML index is not available, searching spectra...\n{self.file_path}")
+            return self.search_offset_list(f)
+    @staticmethod
+    def is_spectrum_offset(f, offset):
+        f.seek(offset)
+        return re.match(rb"<spectrum[\s>]", f.read(10)) is not None
+    @staticmethod
+    def search_offset_list(f, chunk_size=1 << 24):
+        offset_list = []
+        pattern = re.compile(rb"<spectrum[\s>]")
+        overlap = 9
+        f.seek(0)
+        chunk_start = 0
+        chunk = f.read(chunk_size)
+        while len(chunk) > overlap:
+            offset_list.extend(chunk_start + m.start() for m in pattern.finditer(chunk))
+            chunk_start += len(chunk) - overlap
+            chunk = chunk[-overlap:] + f.read(chunk_size)
+        return offset_list
+
+def read_mzml_spectrum(f, offset, read_size=1 << 16):
+    end_tag = b"</spectrum>"
+    f.seek(offset)
+    buf = bytearray()
+    while True:
+        chunk = f.read(read_size)
+        if not chunk:
+            raise Exception(f"unexpected end of file: no {end_tag.decode()} after {offset}")
+        search_start = max(len(buf) - len(end_tag), 0)
+        buf += chunk
+        i = buf.find(end_tag, search_start)
+        if i >= 0:
+            return strip_namespace(ET.fromstring(bytes(buf[:i + len(end_tag)])))
+
+# returns spectrum_type, spectrum settings [(name, value), ...] (mzData compatible names) and binary arrays
+def parse_mzml_spectrum(spectrum, param_group_dict):
+    spectrum_type = None
+    # optional in mzML (db.Info requires both of them)
+    scan_mode = "Unknown"
+    polarity = "Unknown"
+    for accession, name, value, unit in iter_cvParams(spectrum, param_group_dict):
+        if accession in mzML_spectrum_type_dict:
+            spectrum_type = mzML_spectrum_type_dict[accession]
+        elif accession in mzML_scan_mode_dict:
+            scan_mode = mzML_scan_mode_dict[accession]
+        elif accession in mzML_polarity_dict:
+            polarity = mzML_polarity_dict[accession]
+    if spectrum_type is None:
+        raise Exception(f"spectrum type (centroid/profile) is not specified: {spectrum.get('id')}")
+    spectrum_settings = [("ScanMode", scan_mode), ("Polarity", polarity)]
+    scan = spectrum.find("scanList/scan")
+    for accession, name, value, unit in iter_cvParams(scan, param_group_dict):
+        if accession == mzML_RT_accession:
+            if unit not in mzML_RT_unit_dict:
+                raise Exception(f"unsupported unit of scan start time: {unit}")
+            spectrum_settings.append(("TimeInMinutes", float(value) * mzML_RT_unit_dict[unit]))
+            break
+    else:
+        raise Exception(f"scan start time is not specified: {spectrum.get('id')}")
+    # binary arrays
+    binary_dict = {}
+    for binary_data_array in spectrum.iter("binaryDataArray"):
+        array_type = precision = compression = None
+        for accession, name, value, unit in iter_cvParams(binary_data_array, param_group_dict):
+            if accession in mzML_array_type_dict:
+                array_type = mzML_array_type_dict[accession]
+            elif accession in mzML_precision_dict:
+                precision = mzML_precision_dict[accession]
+            elif accession in mzML_compression_list:
+                compression = accession
+            elif "compression" in name:
+                raise Exception(f"unsupported compression: {name}")
+        if array_type is None:
+            continue
+        if (precision is None) or (compression is None):
+            raise Exception(f"precision or compression is not specified: {spectrum.get('id')}")
+        binary_dict[array_type] = (binary_data_array.find("binary").text or "", precision, compression)
+    length = int(spectrum.get("defaultArrayLength"))
+    return spectrum_type, spectrum_settings, length, binary_dict["mz"], binary_dict["inten"]
+
+def decode_mzml_binary_array(text, length, precision, compression, timer):
+    with timer.measure("decode base64"):
+        binary = base64.b64decode(text)
+    if compression == "MS:1000574":
+        with timer.measure("decompress zlib"):
+            binary = zlib.decompress(binary)
+    with timer.measure("decode binary (numpy)"):
+        return np.frombuffer(binary, dtype=np.dtype(f"<{precision}"), count=length)
+
+# executed in the worker processes: spectra are read by seeking to their offsets
+def decode_mzml_spectrum_range(file_path, offset_list, param_group_dict, mz_dtype, inten_dtype):
+    timer = StageTimer()
+    builder = None
+    spectrum_type_set = set()
+    spectrum_settings_list = []
+    with open(file_path, "rb") as f:
+        for offset in offset_list:
+            with timer.measure("parse xml"):
+                spectrum = read_mzml_spectrum(f, offset)
+                spectrum_type, spectrum_settings, length, mz_binary, inten_binary = parse_mzml_spectrum(spectrum, param_group_dict)
+            if builder is None:
+                builder = ScanArrayBuilder(mz_dtype, inten_dtype, N_point_hint=len(offset_list) * length)
+            mz_data = decode_mzml_binary_array(mz_binary[0], length, *mz_binary[1:], timer)
+            inten_data = decode_mzml_binary_array(inten_binary[0], length, *inten_binary[1:], timer)
+            with timer.measure("copy to buffer"):
+                builder.append(mz_data, inten_data)
+            spectrum_type_set.add(spectrum_type)
+            spectrum_settings_list.append(spectrum_settings)
+    return (
+        builder.mz_values[:builder.N_point], builder.inten_values[:builder.N_point], builder.scan_lengths(), 
+        spectrum_type_set, spectrum_settings_list, dict(timer.elapsed_dict)
+    )
+
+def mzml2rpd(file_path, option, n_workers=None):
+    if n_workers is None:
+        n_workers = n_workers_conversion
+    timer = StageTimer()
+    with timer.measure("read index"):
+        mzml_reader = MzMLReader(file_path)
+    if mzml_reader.N_scan == 0:
+        raise Exception(f"no spectrum was found\n{file_path}")
+    # read first spectrum
+    with open(file_path, "rb") as f:
+        spectrum_type, spectrum_settings, length, mz_binary, inten_binary = parse_mzml_spectrum(
+            read_mzml_spectrum(f, mzml_reader.offset_list[0]), 
+            mzml_reader.param_group_dict
+        )
+    mz_precision = mz_binary[1]
+    inten_precision = inten_binary[1]
+    if mz_precision == "f4":        mz_dtype = np.float32
+    elif mz_precision == "f8":      mz_dtype = np.float64
+    else:                           raise Exception(f"unsupported mz precision:{mz_precision}")
+    if inten_precision in ("f4", "i4"):     inten_dtype = np.int32
+    elif inten_precision in ("f8", "i8"):   inten_dtype = np.int64
+    else:                                   raise Exception(f"unsupported inten precision:{inten_precision}")
+    router = SegmentRouter(
+        mz_dtype, 
+        inten_dtype, 
+        N_point_hint=mzml_reader.N_scan * length, 
+        column_stats=(spectrum_type == "continuous"), 
+        split=split_segments
+    )
+    # ranges of consecutive scans (RT blocks): each worker process opens the file and seeks to its own range
+    use_process_pool = (n_workers > 1) and (mzml_reader.N_scan >= min_scans_for_process_pool)
+    if use_process_pool:
+        range_size = max(-(-mzml_reader.N_scan // (4 * n_workers)), scans_per_block)
+    else:
+        range_size = scans_per_block
+    range_args_list = [
+        (file_path, mzml_reader.offset_list[i:i + range_size], mzml_reader.param_group_dict, mz_dtype, inten_dtype)
+        for i in range(0, mzml_reader.N_scan, range_size)
+    ]
+    spectrum_type_set = set()
+    def add_range(mz_values, inten_values, scan_lengths, range_spectrum_type_set, range_spectrum_settings_list, elapsed_dict):
+        router.append_block(mz_values, inten_values, scan_lengths, range_spectrum_settings_list)
+        spectrum_type_set.update(range_spectrum_type_set)
+        for stage, elapsed in elapsed_dict.items():
+            timer.add(stage, elapsed)
+    if use_process_pool:
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = [executor.submit(decode_mzml_spectrum_range, *range_args) for range_args in range_args_list]
+            try:
+                with timer.measure("wait for workers"):
+                    for future in futures:
+                        add_range(*future.result())
+            finally:
+                executor.shutdown(cancel_futures=True)
+    else:
+        for range_args in range_args_list:
+            add_range(*decode_mzml_spectrum_range(*range_args))
+    if len(spectrum_type_set) != 1:
+        raise Exception(f"centroid and profile spectra are mixed\n{file_path}")
+    rpd_list = build_rpd_list(
+        file_path, 
+        router, 
+        spectrum_type, 
+        ionization_type = mzml_reader.ionization_type, 
+        analyzer_type = mzml_reader.analyzer_type, 
+        timer = timer, 
+        title = f"parsed {router.N_scan} scans" + (f" ({n_workers} processes)" if use_process_pool else "")
     )
 
     # RAPID 処理
     if option != "skip RAPID":
         raise Exception("not yet!")
 
-    return rpd
-def convert_2_ndarray2d(mz_set_pre, inten_set_pre, mz_dtype, inten_dtype):
-    # prepare
-    columns = max(map(lambda x: len(x), mz_set_pre))
-    N_scan = len(mz_set_pre)
-    mz_set = np.full((N_scan, columns), np.nan, dtype=mz_dtype)
-    inten_set = np.zeros((N_scan, columns), dtype=inten_dtype)
-    # fill values
-    for r, (mz_data, inten_data) in enumerate(zip(mz_set_pre, inten_set_pre)):
-        e = len(mz_data)
-        mz_set[r, :e] = mz_data
-        inten_set[r, :e] = inten_data
-    return mz_set, inten_set
-def parse_spectrum_settings(spectrum_settings_list):
-    # read first scan
-    spectrum_settings_dict = {cvParam.get("name"):cvParam.get("value") for cvParam in spectrum_settings_list[0]}
-    RT_list = np.empty(len(spectrum_settings_list), dtype=float)
-    RT_unit = "TimeInMinutes"
-    del spectrum_settings_dict[RT_unit]
-    # read all data
-    for i, cvParam_list in enumerate(spectrum_settings_list):
-        for cvParam in cvParam_list:
-            if cvParam.get("name") == RT_unit:
-                RT_list[i] = cvParam.get("value")
-            else:
-                if cvParam_assertion:
-                   assert cvParam.get("value") == spectrum_settings_dict[cvParam.get("name")] 
-    return RT_list, RT_unit, spectrum_settings_dict
+    return rpd_list
 
-def get_rpd_path(file_path, return_rpd):
+# rpd_path of the file converted without splitting (see get_segment_rpd_path for segments)
+def get_rpd_path(file_path, return_rpd, n_workers=None):
     if (file_path.suffix == ".xml") and (file_path.with_suffix("").suffix == ".mzdata"):
         if return_rpd:
-            rpd = mzdata2rpd(file_path, option="skip RAPID")
+            rpd_list = mzdata2rpd(file_path, option="skip RAPID", n_workers=n_workers)
         rpd_path = file_path.with_suffix("").with_suffix(".rpd")
+    elif file_path.suffix.lower() == ".mzml":
+        if return_rpd:
+            rpd_list = mzml2rpd(file_path, option="skip RAPID", n_workers=n_workers)
+        rpd_path = file_path.with_suffix(".rpd")
     else:
         raise Exception(f"unsupported file type\n{file_path}")
     # return
     if return_rpd:
-        return rpd_path, rpd
+        return rpd_path, rpd_list
     else:
         return rpd_path
-
-def convert_file(file_path):
+# e.g. sample_seg0_Positive.rpd, sample_seg1_Negative.rpd
+def get_segment_rpd_path(rpd_path, segment_idx, rpd):
+    polarity = rpd.spectrum_settings_dict.get("Polarity", "Unknown")
+    return rpd_path.with_name(f"{rpd_path.stem}_seg{segment_idx}_{polarity}{rpd_path.suffix}")
+# rpd files that conversion of file_path would overwrite (including segments of previous conversion)
+def get_existing_rpd_path_list(file_path):
+    rpd_path = get_rpd_path(file_path, return_rpd=False)
+    segment_rpd_path_list = sorted(rpd_path.parent.glob(f"{glob.escape(rpd_path.stem)}_seg*{rpd_path.suffix}"))
+    return [p for p in [rpd_path] + segment_rpd_path_list if p.exists()]
+
+# returns paths of the saved rpd files (one per segment) and the total number of scans
+def convert_file(file_path, n_workers=None):
     print("converting into rpd format...")
-    rpd_path, rpd = get_rpd_path(file_path, return_rpd=True)
+    rpd_path, rpd_list = get_rpd_path(file_path, return_rpd=True, n_workers=n_workers)
+    if len(rpd_list) == 1:
+        rpd_path_list = [rpd_path]
+    else:
+        rpd_path_list = [get_segment_rpd_path(rpd_path, segment_idx, rpd) for segment_idx, rpd in enumerate(rpd_list)]
     # compress_test(rpd, file_path)
     # joblib.dump(rpd, rpd_path, compress=("lzma", 1))
     ######################
@@ -140,7 +879,10 @@ def convert_file(file_path):
     ######################
     # dump_2_2(rpd, rpd_path)
     # dump_2_3(rpd, rpd_path)
-    dump_2_3_1(rpd, rpd_path)
+    # dump_2_3_1(rpd, rpd_path)
+    for rpd, rpd_path in zip(rpd_list, rpd_path_list):
+        dump_3_0(rpd, rpd_path)
+    return rpd_path_list, sum(rpd.N_scan for rpd in rpd_list)
 
 def compress_test(rpd, file_path):
     import bz2
@@ -250,48 +992,25 @@ def compress_test(rpd, file_path):
     t4 = time.time()# 40.0 MB
     print(t4 - t3)  # 29.979784965515137
 
-class WorkerSignals(QObject):
-    finished = pyqtSignal()
-    error = pyqtSignal(tuple)
-    result = pyqtSignal(object)
-    progress = pyqtSignal(int)
-class Worker(QRunnable):
-    def __init__(self, fn, *args, **kwargs):
-        super().__init__()
-        self.fn = fn
-        self.args = args
-        self.kwargs = kwargs
-        self.signals = WorkerSignals()
-    @pyqtSlot()
-    def run(self):
-        try:
-            result = self.fn(*self.args, **self.kwargs)
-        except:
-            traceback.print_exc()
-            exctype, value = sys.exc_info()[:2]
-            self.signals.error.emit((exctype, value, traceback.format_exc()))
-        else:
-            self.signals.result.emit(result)  # Return the result of the processing
-        finally:
-            self.signals.finished.emit()  # Done
-# use this class when the order of Worker, QThreadpook is important.
-class WorkerResultsProcessor():
-    def __init__(self):
-        self.worker_produced_results = []
-    def append_worker_produced_results(self, order, results):
-        self.worker_produced_results.append([order, results])
-    def thread_pool_finished(self, func):
-        order = np.argsort([order for order, args in self.worker_produced_results])
-        for i in order:
-            func(*self.worker_produced_results[i][1])
-
-def open_file(file_path):
+# lazy: for callers that only inspect the settings etc. (cli info). mz_set and inten_set are decompressed on first access,
+# and no decoded cache is saved. The GUI opens files eagerly, as it displays the data right away.
+def open_file(file_path, lazy=False):
     if file_path.suffix == ".rpd":
         # rpd, message = load_2_2(file_path)
-        rpd, message = load_2_3_1(file_path)
+        # rpd, message = load_2_3_1(file_path)
+        rpd = load_decoded_cache(file_path)
+        if rpd is not None:
+            message = rpd.source_message
+        elif lazy:
+            rpd, message = load_lazy(file_path)
+        else:
+            rpd, message = load_3_0(file_path)
+            save_decoded_cache(rpd)
     elif (file_path.suffix == ".xml") and (file_path.with_suffix("").suffix == ".mzdata"):
         raise Exception(f"Conversion to '.rpd' file is required to open '\n{file_path}'")
         rpd = mzdata2rpd(file_path, option="skip RAPID")
+    elif file_path.suffix.lower() == ".mzml":
+        raise Exception(f"Conversion to '.rpd' file is required to open '\n{file_path}'")
     else:
         raise Exception(f"unsupported file type\n{file_path}")
     return rpd, message
@@ -317,14 +1036,85 @@ class InfoNoSave():
         return 64               # fixed: sha256
 class Header():
     def __init__(self):
-        self.major_ver = 2
-        self.minor_ver = 3
+        self.major_ver = 3
+        self.minor_ver = 2
         # introduced in v2.2
         self.mz_set_bytes_info_len = 10
         self.inten_set_bytes_info_len = 10
         self.no_compression_data_bytes_info_len = 5
         # introduced in v2.3
         self.mz_set_info_for_chromatogram_extraction_bytes_info_len = 5
+        # introduced in v2.4
+        self.storage = "ndarray2d"  # or "ragged"
+        self.mz_set_encoding = "deep_diff"  # or "tof_model" (continuous ndarray2d only)
+        # introduced in v3.0
+        self.mz_dtype = "<f8"
+        self.inten_dtype = "<i4"
+        self.chunk_row_starts = None    # (N_chunk + 1, ): scans chunk_row_starts[k] <= i < chunk_row_starts[k + 1] are in k-th chunk
+        self.chunk_index = None         # (N_chunk, 4): mz offset, mz size, inten offset, inten size (offsets from the first chunk)
+        self.section_codec_dict = {}    # section ("mz_set", "inten_set", "mz_set_info_for_chromatogram_extraction", "scan_summary"): key of codec_dict
+        # introduced in v3.1
+        self.scan_summary_bytes_info_len = 5
+        # introduced in v3.2 (np.uint32, so that the pickled size does not depend on the values)
+        self.section_checksum_dict = {}  # section ("mz_set_info_for_chromatogram_extraction", "no_compression_data", "scan_summary"): crc32
+        self.chunk_checksums = None     # (N_chunk, 2): crc32 of mz chunk, inten chunk
+# Writes an rpd file section by section, so that sections are never concatenated in memory. data_hash (sha256 of all
+# bytes after it) is updated while writing, and written into its place at the end. Regions reserved for back-patching
+# (e.g. the header of v3.0, which contains the offsets of the chunks) are hashed again from the disk at the end.
+# The file is written under a temporary name and renamed when completed (an existing file is kept if writing fails).
+class RPDWriter():
+    read_size = 1 << 24
+    def __init__(self, rpd_path, major_ver, minor_ver):
+        self.rpd_path = Path(rpd_path)
+        self.tmp_path = self.rpd_path.with_name(f"{self.rpd_path.name}.tmp{os.getpid()}")
+        self.f = open(self.tmp_path, "w+b")
+        self.f.write(
+            InfoNoSave.magic_number + 
+            major_ver.to_bytes(InfoNoSave.major_ver_size(), byteorder=InfoNoSave.byteorder, signed=False) + 
+            minor_ver.to_bytes(InfoNoSave.minor_ver_size(), byteorder=InfoNoSave.byteorder, signed=False)
+        )
+        self.hash_pos = self.f.tell()
+        self.f.write(bytes(InfoNoSave.hash_size()))
+        self.data_hash = hashlib.sha256()
+        self.patched = False
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.f.close()
+            self.tmp_path.unlink()
+    def tell(self):
+        return self.f.tell()
+    def write(self, data_bytes):
+        self.f.write(data_bytes)
+        self.data_hash.update(data_bytes)
+    def write_section(self, section_bytes, info_len):
+        self.write(len(section_bytes).to_bytes(info_len, byteorder=InfoNoSave.byteorder, signed=False))
+        self.write(section_bytes)
+    def reserve(self, size):
+        pos = self.f.tell()
+        self.f.write(bytes(size))
+        self.patched = True
+        return pos
+    def patch(self, pos, data_bytes):
+        end_pos = self.f.tell()
+        self.f.seek(pos)
+        self.f.write(data_bytes)
+        self.f.seek(end_pos)
+    def close(self):
+        if self.patched:
+            self.data_hash = hashlib.sha256()
+            self.f.seek(self.hash_pos + InfoNoSave.hash_size())
+            data_bytes = self.f.read(self.read_size)
+            while len(data_bytes) > 0:
+                self.data_hash.update(data_bytes)
+                data_bytes = self.f.read(self.read_size)
+        self.f.seek(self.hash_pos)
+        self.f.write(self.data_hash.hexdigest().encode())
+        self.f.close()
+        os.replace(self.tmp_path, self.rpd_path)
 class NoCompressionData():
     def __init__(
         self, 
@@ -335,6 +1125,9 @@ class NoCompressionData():
         ionization_type, 
         analyzer_type, 
         mz_set_nan_start_locs, 
+        scan_lengths=None, 
+        source_data_hash=None, 
+        source_message=None, 
     ):
         self.spectrum_type = spectrum_type
         self.RT_list = RT_list
@@ -343,6 +1136,9 @@ class NoCompressionData():
         self.ionization_type = ionization_type
         self.analyzer_type = analyzer_type
         self.mz_set_nan_start_locs = mz_set_nan_start_locs  # [nan_start_rows, nan_start_cols]
+        self.scan_lengths = scan_lengths    # introduced in v3.0 (np.nan padding of each chunk)
+        self.source_data_hash = source_data_hash    # introduced in v3.2 (data_hash of the file upgraded from, see upgrade_file)
+        self.source_message = source_message        # message on opening the file upgraded from (see upgrade_file)
     # pickle時に呼ばれる
     def __getstate__(self):
         state = self.__dict__.copy()
@@ -352,7 +1148,14 @@ class NoCompressionData():
     def __setstate__(self, state):
         self.__dict__.update(state)
 
-def deep_diff(array2d, axis_list):
+def deep_diff(array2d, axis_list, num_threads=None):
+    # m/z (continuous): fused kernel
+    if (list(axis_list) == [1, 1, 0]) and (array2d.ndim == 2) and (array2d.dtype == np.float64) and (array2d.shape[0] >= 1) and (array2d.shape[1] >= 2):
+        N_row, N_col = array2d.shape
+        initial_arrays = [np.empty(N_row), np.empty(N_row), np.empty(N_col - 2)]
+        diff_array2d = np.empty((N_row - 1, N_col - 2))
+        rpd_calc.deep_diff_axis110_float64(array2d, *initial_arrays, diff_array2d, num_threads=num_threads or n_threads_deep_diff)
+        return initial_arrays, diff_array2d
     initial_arrays = []
     for axis in axis_list:
         initial_arrays.append(array2d.take(indices=0, axis=axis))
@@ -361,26 +1164,68 @@ def deep_diff(array2d, axis_list):
 
 from ..cython import rpd_calc
 
-def revert_deep_diff(array2d, initial_arrays, axis_list):
+# m/z axis of TOF data: sqrt(mz) of each scan is (almost) a polynomial of the column index, i.e. the calibration curve.
+# Coefficients of each scan are saved together with the residual, which is the difference of the bit patterns of mz and
+# the model (as integers), so that mz_set is restored exactly. The residual is only a few units in the last place.
+# Scans with the same length are fitted at once (one least squares with multiple right-hand sides).
+def encode_mz_set_tof_model(mz_set, scan_lengths, degree):
+    N_scan, N_col = mz_set.shape
+    x = np.arange(N_col) / max(N_col - 1, 1)
+    coefs = np.empty((N_scan, degree + 1), dtype=np.float64)
+    for length in np.unique(scan_lengths):
+        rows = np.nonzero(scan_lengths == length)[0]
+        vander = np.vander(x[:length], degree + 1, increasing=True)
+        coefs[rows] = np.linalg.lstsq(vander, np.sqrt(mz_set[rows, :length].astype(np.float64)).T, rcond=None)[0].T
+    if not np.isfinite(coefs).all():
+        raise Exception("m/z cannot be fitted by the calibration model")
+    mz_set_model = eval_mz_set_tof_model(coefs, N_col, mz_set.dtype)
+    int_dtype = np.dtype(f"i{mz_set.dtype.itemsize}")
+    residual = np.nan_to_num(mz_set, nan=0).view(int_dtype).astype(np.int64) - mz_set_model.view(int_dtype)
+    residual[np.arange(N_col) >= np.expand_dims(scan_lengths, 1)] = 0    # np.nan padding is restored by mz_set_nan_start_locs
+    for residual_dtype in (np.int8, np.int16, np.int32, np.int64):
+        if np.iinfo(residual_dtype).min <= residual.min() and residual.max() <= np.iinfo(residual_dtype).max:
+            return coefs, residual.astype(residual_dtype)
+# The calibration of some instruments is not well described by the model: both encodings are tried for a block of
+# consecutive scans, and the one with the smaller compressed size per scan is used.
+def choose_mz_set_encoding(mz_set, N_sample_scan=16):
+    if (mz_set <= 0).any():     # sqrt(mz) is fitted
+        return "deep_diff"
+    sample_mz_set = mz_set[len(mz_set) // 2:len(mz_set) // 2 + N_sample_scan]
+    if len(sample_mz_set) < 2:
+        return "deep_diff"
+    sample_scan_lengths = (~np.isnan(sample_mz_set)).sum(axis=1)
+    coefs, residual = encode_mz_set_tof_model(sample_mz_set, sample_scan_lengths, tof_model_degree)
+    (initial_array0, initial_array1, initial_array2), mz_set_diff = deep_diff(np.nan_to_num(sample_mz_set, nan=0).astype(np.float64, copy=False), axis_list=[1, 1, 0])
+    # initial_array2 (a single row) is negligible for the whole mz_set
+    tof_model_size_per_scan = (coefs.nbytes + len(zlib.compress(residual.tobytes()))) / len(residual)
+    deep_diff_size_per_scan = (initial_array0.nbytes + initial_array1.nbytes) / len(sample_mz_set) + len(zlib.compress(mz_set_diff.tobytes())) / len(mz_set_diff)
+    return "tof_model" if tof_model_size_per_scan < deep_diff_size_per_scan else "deep_diff"
+def eval_mz_set_tof_model(coefs, N_col, mz_dtype):
+    x = np.arange(N_col) / max(N_col - 1, 1)
+    sqrt_mz_set = np.repeat(coefs[:, -1:], N_col, axis=1)
+    for k in range(coefs.shape[1] - 2, -1, -1): # Horner's method
+        sqrt_mz_set *= x
+        sqrt_mz_set += coefs[:, k:k + 1]
+    return np.square(sqrt_mz_set, out=sqrt_mz_set).astype(mz_dtype, copy=False)
+def decode_mz_set_tof_model(coefs, residual, mz_dtype):
+    mz_set = eval_mz_set_tof_model(coefs, residual.shape[1], mz_dtype)
+    mz_set_int = mz_set.view(np.dtype(f"i{mz_set.dtype.itemsize}"))
+    mz_set_int += residual
+    return mz_set
+
+def revert_deep_diff(array2d, initial_arrays, axis_list, num_threads=None):
     if len(initial_arrays) != len(axis_list):
         raise Exception(f"invalid")
 
+    # m/z (continuous): fused kernel, written into a single output array
+    if (list(axis_list) == [1, 1, 0]) and (array2d.ndim == 2) and all(np.asarray(array).dtype == np.float64 for array in [array2d] + list(initial_arrays)):
+        output_array2d = np.empty((len(initial_arrays[0]), len(initial_arrays[2]) + 2))
+        rpd_calc.revert_deep_diff_axis110_float64(array2d, *initial_arrays, output_array2d, num_threads=num_threads or n_threads_deep_diff)
+        return output_array2d
+
     # import time
     # t0 = time.time()
     for initial_array, axis in zip(initial_arrays[::-1], axis_list[::-1]):
-        # if (array2d.dtype == np.float64) and (axis == 0):
-        #     array2d = rpd_calc.cumsum_2d_axis0_float64(np.vstack((np.expand_dims(initial_array, axis), array2d)))
-        #     continue
-        # elif (array2d.dtype == np.float64) and (axis == 1):
-        #     array2d = rpd_calc.cumsum_2d_axis1_float64(np.hstack((np.expand_dims(initial_array, axis), array2d)))
-        #     continue
-        # elif (array2d.dtype == np.int32) and (axis == 0):
-        #     array2d = rpd_calc.cumsum_2d_axis0_int32(np.vstack((np.expand_dims(initial_array, axis), array2d)))
-        #     continue
-        # elif (array2d.dtype == np.int32) and (axis == 1):
-        #     array2d = rpd_calc.cumsum_2d_axis1_int32(np.hstack((np.expand_dims(initial_array, axis), array2d)))
-        #     continue
-
         if axis == 0:
             array2d = np.cumsum(np.vstack((np.expand_dims(initial_array, axis), array2d)), axis=0, dtype=array2d.dtype)
         elif axis == 1:
@@ -416,6 +1261,7 @@ def dump_2_2(rpd: db.RPD, rpd_path):
     # header #
     ##########
     header = Header()
+    header.major_ver, header.minor_ver = 2, 2
     with BytesIO() as f:
         pickle.dump(header, f)
         f.seek(0)
@@ -617,6 +1463,109 @@ def dump_2_3(rpd: db.RPD, rpd_path):
             header_mz_set_inten_set_no_compression_data_bytes
         )
 
+def compress_inten_set(rpd: db.RPD):
+    print("compressing intensity data...")
+    with BytesIO() as f:
+        if rpd.storage == "ragged":
+            np.savez_compressed(
+                f, 
+                inten_values=rpd.inten_set.values
+            )
+        elif rpd.spectrum_type == "continuous":
+            (initial_inten_array0, ), inten_diff = deep_diff(rpd.inten_set, axis_list=[0]) # 88.5 MB
+            np.savez_compressed(
+                f, 
+                initial_inten_array0=initial_inten_array0, 
+                inten_set_diff=inten_diff
+            )
+        elif rpd.spectrum_type == "discrete":
+            np.savez_compressed(
+                f, 
+                inten_set_diff=rpd.inten_set
+            )
+        else:
+            raise Exception(f"unknown spectrum type: {rpd.spectrum_type}")
+        f.seek(0)
+        return f.read()
+def compress_mz_set(rpd: db.RPD, mz_set_encoding="deep_diff"):
+    print("compressing m/z data...")
+    with BytesIO() as f:
+        if rpd.storage == "ragged":
+            np.savez_compressed(
+                f, 
+                mz_values=rpd.mz_set.values, 
+                scan_lengths=rpd.mz_set.row_lengths()
+            )
+            f.seek(0)
+            return f.read()
+        if mz_set_encoding == "tof_model":
+            scan_lengths = np.full(rpd.N_scan, rpd.mz_set.shape[1])
+            nan_start_rows, nan_start_cols = rpd.get_mz_set_nan_start_locs()
+            scan_lengths[nan_start_rows] = nan_start_cols
+            coefs, residual = encode_mz_set_tof_model(rpd.mz_set, scan_lengths, tof_model_degree)
+            np.savez_compressed(
+                f, 
+                coefs=coefs, 
+                residual=residual, 
+                mz_dtype=rpd.mz_set.dtype.str
+            )
+            f.seek(0)
+            return f.read()
+        mz_set = np.nan_to_num(rpd.mz_set, nan=0)  # Without this line, deep_diff function will lost information.
+        if rpd.spectrum_type == "continuous":
+            # float32 is diffed (and cumsummed when loading) in float64, otherwise rounding errors accumulate
+            (initial_mz_array0, initial_mz_array1, initial_mz_array2), mz_set_diff = deep_diff(mz_set.astype(np.float64, copy=False), axis_list=[1, 1, 0])
+            np.savez_compressed(
+                f, 
+                initial_mz_array0=initial_mz_array0, 
+                initial_mz_array1=initial_mz_array1, 
+                initial_mz_array2=initial_mz_array2, 
+                mz_set_diff=mz_set_diff, 
+                **({} if mz_set.dtype == np.float64 else {"mz_dtype":mz_set.dtype.str})
+            )       # 35.6 MB
+        elif rpd.spectrum_type == "discrete":
+            np.savez_compressed(
+                f, 
+                mz_set_diff=mz_set
+            )
+        else:
+            raise Exception(f"unknown spectrum type: {rpd.spectrum_type}")
+        f.seek(0)
+        return f.read()
+# codec=None: deflate of np.savez_compressed (until v2.4)
+def compress_mz_set_info_for_chromatogram_extraction(rpd: db.RPD, codec=None):
+    print("compressing additional info...")
+    if rpd.spectrum_type == "continuous":
+        if rpd.mz_set_info_for_chromatogram_extraction is not None:    # collected during conversion
+            mz_set_info_for_chromatogram_extraction, ref_row = rpd.mz_set_info_for_chromatogram_extraction, rpd.ref_row
+        else:
+            mz_set_info_for_chromatogram_extraction, ref_row = rpd.get_mz_set_info_for_chromatogram_extraction()
+        if codec is not None:
+            return pack_arrays(dict(ref_row=ref_row, mz_set_info_for_chromatogram_extraction=mz_set_info_for_chromatogram_extraction), codec)
+        with BytesIO() as f:
+            np.savez_compressed(
+                f, 
+                ref_row=ref_row, 
+                mz_set_info_for_chromatogram_extraction=mz_set_info_for_chromatogram_extraction, 
+            )
+            f.seek(0)
+            return f.read()
+    elif rpd.spectrum_type == "discrete":
+        return b""
+    else:
+        raise Exception(f"unknown spectrum type: {rpd.spectrum_type}")
+
+# zlib and numpy release the GIL, so that the sections are compressed concurrently.
+def compress_sections(rpd: db.RPD, mz_set_encoding="deep_diff"):
+    timer = StageTimer()
+    with ThreadPoolExecutor(max_workers=n_workers_section_codec) as executor:
+        mz_set_future = executor.submit(timer.timed, "compress m/z", compress_mz_set, rpd, mz_set_encoding)
+        inten_set_future = executor.submit(timer.timed, "compress intensity", compress_inten_set, rpd)
+        mz_set_info_for_chromatogram_extraction_future = executor.submit(timer.timed, "compress additional info", compress_mz_set_info_for_chromatogram_extraction, rpd)
+        sections = mz_set_future.result(), inten_set_future.result(), mz_set_info_for_chromatogram_extraction_future.result()
+    print(timer.summary("compression", concurrent=True))
+    return sections
+
 def dump_2_3_1(rpd: db.RPD, rpd_path):
     """ 
     # KEYS TO SAVE
@@ -641,10 +1590,13 @@ def dump_2_3_1(rpd: db.RPD, rpd_path):
         self.file_path
         self.N_scan
     """
+    if rpd.storage != "ndarray2d":
+        raise Exception(f"unsupported storage for v2.3: {rpd.storage}")
     ##########
     # header #
     ##########
     header = Header()
+    header.major_ver, header.minor_ver = 2, 3
     with BytesIO() as f:
         pickle.dump(header, f)
         f.seek(0)
@@ -667,105 +1619,20 @@ def dump_2_3_1(rpd: db.RPD, rpd_path):
         f.seek(0)
         no_compression_data_bytes = f.read()
 
-    import time
-    t0 = time.time()
-
-    #############
-    # inten_set #
-    #############
-    print("compressing intensity data...")
-    with BytesIO() as f:
-        if rpd.spectrum_type == "continuous":
-            (initial_inten_array0, ), inten_diff = deep_diff(rpd.inten_set, axis_list=[0]) # 88.5 MB
-            np.savez_compressed(
-                f, 
-                initial_inten_array0=initial_inten_array0, 
-                inten_set_diff=inten_diff
-            )
-        elif rpd.spectrum_type == "discrete":
-            np.savez_compressed(
-                f, 
-                inten_set_diff=rpd.inten_set
-            )
-        else:
-            raise Exception(f"unknown spectrum type: {rpd.spectrum_type}")
-        f.seek(0)
-        inten_set_bytes = f.read()
-
-    ##########
-    # mz_set #
-    ##########
-    print("compressing m/z data...")
-    with BytesIO() as f:
-        mz_set = np.nan_to_num(rpd.mz_set, nan=0)  # Without this line, deep_diff function will lost information.
-        if rpd.spectrum_type == "continuous":
-            (initial_mz_array0, initial_mz_array1, initial_mz_array2), mz_set_diff = deep_diff(mz_set, axis_list=[1, 1, 0])
-            np.savez_compressed(
-                f, 
-                initial_mz_array0=initial_mz_array0, 
-                initial_mz_array1=initial_mz_array1, 
-                initial_mz_array2=initial_mz_array2, 
-                mz_set_diff=mz_set_diff
-            )       # 35.6 MB
-        elif rpd.spectrum_type == "discrete":
-            np.savez_compressed(
-                f, 
-                mz_set_diff=mz_set
-            )
-        else:
-            raise Exception(f"unknown spectrum type: {rpd.spectrum_type}")
-        f.seek(0)
-        mz_set_bytes = f.read()
-
-    ###########################################
-    # mz_set_info_for_chromatogram_extraction #
-    ###########################################
-    print("compressing additional info...")
-    if rpd.spectrum_type == "continuous":
-        mz_set_info_for_chromatogram_extraction, ref_row = rpd.get_mz_set_info_for_chromatogram_extraction()
-        with BytesIO() as f:
-            np.savez_compressed(
-                f, 
-                ref_row=ref_row, 
-                mz_set_info_for_chromatogram_extraction=mz_set_info_for_chromatogram_extraction, 
-            )
-            f.seek(0)
-            mz_set_info_for_chromatogram_extraction_bytes = f.read()
-    elif rpd.spectrum_type == "discrete":
-        mz_set_info_for_chromatogram_extraction_bytes = b""
-    else:
-        raise Exception(f"unknown spectrum type: {rpd.spectrum_type}")
+    ##############################################################
+    # inten_set, mz_set, mz_set_info_for_chromatogram_extraction #
+    ##############################################################
+    mz_set_bytes, inten_set_bytes, mz_set_info_for_chromatogram_extraction_bytes = compress_sections(rpd)
 
-    #################
-    # COMBINE BYTES #
-    #################
-    header_mz_set_inten_set_no_compression_data_bytes = (
-        len(header_bytes).to_bytes(InfoNoSave.header_info_len, byteorder=InfoNoSave.byteorder, signed=False) + 
-        header_bytes + 
-        len(mz_set_bytes).to_bytes(header.mz_set_bytes_info_len, byteorder=InfoNoSave.byteorder, signed=False) + 
-        mz_set_bytes + 
-        len(inten_set_bytes).to_bytes(header.inten_set_bytes_info_len, byteorder=InfoNoSave.byteorder, signed=False) + 
-        inten_set_bytes + 
-        len(mz_set_info_for_chromatogram_extraction_bytes).to_bytes(header.mz_set_info_for_chromatogram_extraction_bytes_info_len, byteorder=InfoNoSave.byteorder, signed=False) + 
-        mz_set_info_for_chromatogram_extraction_bytes + 
-        len(no_compression_data_bytes).to_bytes(header.no_compression_data_bytes_info_len, byteorder=InfoNoSave.byteorder, signed=False) + 
-        no_compression_data_bytes
-    )
     ########
     # SAVE #
     ########
-    with open(rpd_path, "wb") as f:
-        magic_number = InfoNoSave.magic_number
-        major_ver = (header.major_ver).to_bytes(1, byteorder=InfoNoSave.byteorder, signed=False)
-        minor_ver = (header.minor_ver).to_bytes(1, byteorder=InfoNoSave.byteorder, signed=False)
-        data_hash = InfoNoSave.generate_hash(header_mz_set_inten_set_no_compression_data_bytes).encode()
-        f.write(
-            magic_number + 
-            major_ver + 
-            minor_ver + 
-            data_hash + 
-            header_mz_set_inten_set_no_compression_data_bytes
-        )
+    with RPDWriter(rpd_path, header.major_ver, header.minor_ver) as writer:
+        writer.write_section(header_bytes, InfoNoSave.header_info_len)
+        writer.write_section(mz_set_bytes, header.mz_set_bytes_info_len)
+        writer.write_section(inten_set_bytes, header.inten_set_bytes_info_len)
+        writer.write_section(mz_set_info_for_chromatogram_extraction_bytes, header.mz_set_info_for_chromatogram_extraction_bytes_info_len)
+        writer.write_section(no_compression_data_bytes, header.no_compression_data_bytes_info_len)
     print("DONE")
     print()
 
@@ -1015,67 +1882,13 @@ def load_2_3_1(rpd_path):
             f_ncd.seek(0)
             no_compression_data = pickle.load(f_ncd)
 
-        ###############
-        # open mz_set #
-        ###############
-        with BytesIO() as f_mz:
-            f_mz.write(mz_set_bytes)
-            f_mz.seek(0)
-            compressed_mz_set = np.load(f_mz)
-            if no_compression_data.spectrum_type == "continuous":
-                initial_mz_array_list = [
-                    compressed_mz_set["initial_mz_array0"], 
-                    compressed_mz_set["initial_mz_array1"], 
-                    compressed_mz_set["initial_mz_array2"]
-                ]
-                mz_set_diff = compressed_mz_set["mz_set_diff"]
-                mz_set_loaded = revert_deep_diff(mz_set_diff, initial_mz_array_list, axis_list=[1, 1, 0])
-            elif no_compression_data.spectrum_type == "discrete":
-                mz_set_loaded = compressed_mz_set["mz_set_diff"]
-            else:
-                raise Exception(f"unknown spectrum type: {no_compression_data.spectrum_type}")
-
-        ##################
-        # open inten_set #
-        ##################
-        with BytesIO() as f_inten:
-            f_inten.write(inten_set_bytes)
-            f_inten.seek(0)
-            compressed_inten_set = np.load(f_inten)
-            if no_compression_data.spectrum_type == "continuous":
-                initial_inten_array_list = [
-                    compressed_inten_set["initial_inten_array0"], 
-                ]
-                inten_set_diff = compressed_inten_set["inten_set_diff"]
-                inten_set_loaded = revert_deep_diff(inten_set_diff, initial_inten_array_list, axis_list=[0])
-            elif no_compression_data.spectrum_type == "discrete":
-                inten_set_loaded = compressed_inten_set["inten_set_diff"]
-            else:
-                raise Exception(f"unknown spectrum type: {no_compression_data.spectrum_type}")
-
-        ######################################################
-        # open mz_set_info_for_chromatogram_extraction_bytes #
-        ######################################################
-        with BytesIO() as f_mz_set_info:
-            if no_compression_data.spectrum_type == "continuous":
-                f_mz_set_info.write(mz_set_info_for_chromatogram_extraction_bytes)
-                f_mz_set_info.seek(0)
-                compressed_mz_set_info_for_chromatogram_extraction = np.load(f_mz_set_info)
-                ref_row = compressed_mz_set_info_for_chromatogram_extraction["ref_row"]
-                mz_set_info_for_chromatogram_extraction = compressed_mz_set_info_for_chromatogram_extraction["mz_set_info_for_chromatogram_extraction"]
-            elif no_compression_data.spectrum_type == "discrete":
-                ref_row = 0
-                mz_set_info_for_chromatogram_extraction = None
-                assert len(mz_set_info_for_chromatogram_extraction_bytes) == 0
-            else:
-                raise Exception(f"unknown spectrum type: {no_compression_data.spectrum_type}")
-
-        #################################
-        # version specific process POST #
-        #################################
-        if major_ver + minor_ver/10 >= 2.3:
-            for nan_start_row, nan_start_col in zip(*no_compression_data.mz_set_nan_start_locs):
-                mz_set_loaded[nan_start_row, nan_start_col:] = np.nan
+        ##################################################################
+        # open mz_set, inten_set, mz_set_info_for_chromatogram_extraction #
+        ##################################################################
+        # v2.3 header has neither storage nor mz_set_encoding (defaults are used)
+        mz_set_loaded, inten_set_loaded, (ref_row, mz_set_info_for_chromatogram_extraction) = decompress_sections(
+            mz_set_bytes, inten_set_bytes, mz_set_info_for_chromatogram_extraction_bytes, header, no_compression_data
+        )
 
     # LOAD
     rpd = db.RPD(
@@ -1106,3 +1919,896 @@ def load_2_3_1(rpd_path):
 
 
 
+
+def decompress_mz_set(mz_set_bytes, header, no_compression_data):
+    with BytesIO() as f_mz:
+        f_mz.write(mz_set_bytes)
+        f_mz.seek(0)
+        compressed_mz_set = np.load(f_mz)
+        if getattr(header, "storage", "ndarray2d") == "ragged":
+            return db.RaggedArray.from_row_lengths(compressed_mz_set["mz_values"], compressed_mz_set["scan_lengths"])
+        elif getattr(header, "mz_set_encoding", "deep_diff") == "tof_model":
+            mz_set_loaded = decode_mz_set_tof_model(compressed_mz_set["coefs"], compressed_mz_set["residual"], str(compressed_mz_set["mz_dtype"]))
+        elif no_compression_data.spectrum_type == "continuous":
+            initial_mz_array_list = [
+                compressed_mz_set["initial_mz_array0"], 
+                compressed_mz_set["initial_mz_array1"], 
+                compressed_mz_set["initial_mz_array2"]
+            ]
+            mz_set_diff = compressed_mz_set["mz_set_diff"]
+            mz_set_loaded = revert_deep_diff(mz_set_diff, initial_mz_array_list, axis_list=[1, 1, 0])
+            if "mz_dtype" in compressed_mz_set:
+                mz_set_loaded = mz_set_loaded.astype(str(compressed_mz_set["mz_dtype"]))
+        elif no_compression_data.spectrum_type == "discrete":
+            mz_set_loaded = compressed_mz_set["mz_set_diff"]
+        else:
+            raise Exception(f"unknown spectrum type: {no_compression_data.spectrum_type}")
+    for nan_start_row, nan_start_col in zip(*no_compression_data.mz_set_nan_start_locs):
+        mz_set_loaded[nan_start_row, nan_start_col:] = np.nan
+    return mz_set_loaded
+# ragged: values only (offsets are those of mz_set, see decompress_sections)
+def decompress_inten_set(inten_set_bytes, header, no_compression_data):
+    with BytesIO() as f_inten:
+        f_inten.write(inten_set_bytes)
+        f_inten.seek(0)
+        compressed_inten_set = np.load(f_inten)
+        if getattr(header, "storage", "ndarray2d") == "ragged":
+            return compressed_inten_set["inten_values"]
+        elif no_compression_data.spectrum_type == "continuous":
+            initial_inten_array_list = [
+                compressed_inten_set["initial_inten_array0"], 
+            ]
+            inten_set_diff = compressed_inten_set["inten_set_diff"]
+            return revert_deep_diff(inten_set_diff, initial_inten_array_list, axis_list=[0])
+        elif no_compression_data.spectrum_type == "discrete":
+            return compressed_inten_set["inten_set_diff"]
+        else:
+            raise Exception(f"unknown spectrum type: {no_compression_data.spectrum_type}")
+def decompress_mz_set_info_for_chromatogram_extraction(mz_set_info_for_chromatogram_extraction_bytes, no_compression_data, codec="none"):
+    if no_compression_data.spectrum_type == "continuous":
+        compressed_mz_set_info_for_chromatogram_extraction = unpack_arrays(mz_set_info_for_chromatogram_extraction_bytes, codec)
+        ref_row = compressed_mz_set_info_for_chromatogram_extraction["ref_row"]
+        mz_set_info_for_chromatogram_extraction = compressed_mz_set_info_for_chromatogram_extraction["mz_set_info_for_chromatogram_extraction"]
+    elif no_compression_data.spectrum_type == "discrete":
+        ref_row = 0
+        mz_set_info_for_chromatogram_extraction = None
+        assert len(mz_set_info_for_chromatogram_extraction_bytes) == 0
+    else:
+        raise Exception(f"unknown spectrum type: {no_compression_data.spectrum_type}")
+    return ref_row, mz_set_info_for_chromatogram_extraction
+
+# sections are independent byte ranges: decompressed (and reverted) concurrently
+def decompress_sections(mz_set_bytes, inten_set_bytes, mz_set_info_for_chromatogram_extraction_bytes, header, no_compression_data):
+    timer = StageTimer()
+    with ThreadPoolExecutor(max_workers=n_workers_section_codec) as executor:
+        mz_set_future = executor.submit(timer.timed, "decompress m/z", decompress_mz_set, mz_set_bytes, header, no_compression_data)
+        inten_set_future = executor.submit(timer.timed, "decompress intensity", decompress_inten_set, inten_set_bytes, header, no_compression_data)
+        mz_set_info_for_chromatogram_extraction_future = executor.submit(
+            timer.timed, "decompress additional info", decompress_mz_set_info_for_chromatogram_extraction, mz_set_info_for_chromatogram_extraction_bytes, no_compression_data
+        )
+        mz_set, inten_set, mz_set_info = mz_set_future.result(), inten_set_future.result(), mz_set_info_for_chromatogram_extraction_future.result()
+    if getattr(header, "storage", "ndarray2d") == "ragged":
+        inten_set = db.RaggedArray(inten_set, mz_set.offsets)
+    print(timer.summary("decompression", concurrent=True))
+    return mz_set, inten_set, mz_set_info
+
+def dump_2_4(rpd: db.RPD, rpd_path):
+    """ 
+    # KEYS TO SAVE
+    # info
+    self.data_hash
+
+    # data
+    self.spectrum_type
+    self.mz_set     (ndarray2d or RaggedArray, see header.storage; saved as header.mz_set_encoding)
+    self.inten_set  (ndarray2d or RaggedArray, see header.storage)
+
+    # RT info and etc.
+    self.RT_list
+    self.RT_unit
+    self.spectrum_settings_dict
+
+    # general info
+    self.ionization_type = ionization_type
+    self.analyzer_type = analyzer_type
+
+    # KEYS NO SAVE
+        self.file_path
+        self.N_scan
+    """
+    ##########
+    # header #
+    ##########
+    header = Header()
+    header.major_ver, header.minor_ver = 2, 4
+    header.storage = rpd.storage
+    if (rpd.storage == "ndarray2d") and (rpd.spectrum_type == "continuous") and (mz_set_encoding_continuous == "tof_model"):
+        header.mz_set_encoding = choose_mz_set_encoding(rpd.mz_set)
+    with BytesIO() as f:
+        pickle.dump(header, f)
+        f.seek(0)
+        header_bytes = f.read()
+
+    #######################
+    # no_compression_data #
+    #######################
+    if rpd.storage == "ndarray2d":
+        mz_set_nan_start_locs = rpd.get_mz_set_nan_start_locs()
+    elif rpd.storage == "ragged":
+        mz_set_nan_start_locs = ([], [])    # scan lengths are saved together with mz_set
+    else:
+        raise Exception(f"unknown storage: {rpd.storage}")
+    no_compression_data = NoCompressionData(
+        spectrum_type = rpd.spectrum_type, 
+        RT_list = rpd.RT_list, 
+        RT_unit = rpd.RT_unit, 
+        spectrum_settings_dict = rpd.spectrum_settings_dict, 
+        ionization_type = rpd.ionization_type, 
+        analyzer_type = rpd.analyzer_type, 
+        mz_set_nan_start_locs = mz_set_nan_start_locs
+    )
+    with BytesIO() as f:
+        pickle.dump(no_compression_data, f)
+        f.seek(0)
+        no_compression_data_bytes = f.read()
+
+    ##############################################################
+    # inten_set, mz_set, mz_set_info_for_chromatogram_extraction #
+    ##############################################################
+    mz_set_bytes, inten_set_bytes, mz_set_info_for_chromatogram_extraction_bytes = compress_sections(rpd, header.mz_set_encoding)
+
+    ########
+    # SAVE #
+    ########
+    with RPDWriter(rpd_path, header.major_ver, header.minor_ver) as writer:
+        writer.write_section(header_bytes, InfoNoSave.header_info_len)
+        writer.write_section(mz_set_bytes, header.mz_set_bytes_info_len)
+        writer.write_section(inten_set_bytes, header.inten_set_bytes_info_len)
+        writer.write_section(mz_set_info_for_chromatogram_extraction_bytes, header.mz_set_info_for_chromatogram_extraction_bytes_info_len)
+        writer.write_section(no_compression_data_bytes, header.no_compression_data_bytes_info_len)
+    print("DONE")
+    print()
+
+def load_2_4(rpd_path):
+    with open(rpd_path, "rb") as f:
+        magic_number = f.read(InfoNoSave.magic_number_size())
+        if magic_number != InfoNoSave.magic_number:
+            raise Exception(f"file broken: {rpd_path}")
+        major_ver = int.from_bytes(f.read(InfoNoSave.major_ver_size()), byteorder=InfoNoSave.byteorder)
+        minor_ver = int.from_bytes(f.read(InfoNoSave.minor_ver_size()), byteorder=InfoNoSave.byteorder)
+        data_hash = f.read(InfoNoSave.hash_size())
+        header_size = int.from_bytes(f.read(InfoNoSave.header_info_len), byteorder=InfoNoSave.byteorder)
+        header_bytes = f.read(header_size)
+
+        ################################
+        # version specific process PRE #
+        ################################
+        version_int = major_ver + minor_ver/10
+        if version_int < 2.4:
+            return load_2_3_1(rpd_path)
+        message = None
+        print(f"file version: {major_ver}.{minor_ver}")
+
+        ###############
+        # open header #
+        ###############
+        with BytesIO() as f_h:
+            f_h.write(header_bytes)
+            f_h.seek(0)
+            header = pickle.load(f_h)
+
+        ##############
+        # load bytes #
+        ##############
+        mz_set_bytes_size = int.from_bytes(f.read(header.mz_set_bytes_info_len), byteorder=InfoNoSave.byteorder)
+        mz_set_bytes = f.read(mz_set_bytes_size)
+        inten_set_bytes_size = int.from_bytes(f.read(header.inten_set_bytes_info_len), byteorder=InfoNoSave.byteorder)
+        inten_set_bytes = f.read(inten_set_bytes_size)
+        mz_set_info_for_chromatogram_extraction_bytes_size = int.from_bytes(f.read(header.mz_set_info_for_chromatogram_extraction_bytes_info_len), byteorder=InfoNoSave.byteorder)
+        mz_set_info_for_chromatogram_extraction_bytes = f.read(mz_set_info_for_chromatogram_extraction_bytes_size)
+        no_compression_data_bytes_size = int.from_bytes(f.read(header.no_compression_data_bytes_info_len), byteorder=InfoNoSave.byteorder)
+        no_compression_data_bytes = f.read(no_compression_data_bytes_size)
+
+    ############################
+    # open no_compression_data #
+    ############################
+    with BytesIO() as f_ncd:
+        f_ncd.write(no_compression_data_bytes)
+        f_ncd.seek(0)
+        no_compression_data = pickle.load(f_ncd)
+
+    ###################################################################
+    # open mz_set, inten_set, mz_set_info_for_chromatogram_extraction #
+    ###################################################################
+    mz_set_loaded, inten_set_loaded, (ref_row, mz_set_info_for_chromatogram_extraction) = decompress_sections(
+        mz_set_bytes, inten_set_bytes, mz_set_info_for_chromatogram_extraction_bytes, header, no_compression_data
+    )
+
+    # LOAD
+    rpd = db.RPD(
+        data_hash = data_hash, 
+        file_path = rpd_path, 
+        spectrum_type = no_compression_data.spectrum_type, 
+        mz_set = mz_set_loaded, 
+        inten_set = inten_set_loaded, 
+        RT_list = no_compression_data.RT_list, 
+        RT_unit = no_compression_data.RT_unit, 
+        spectrum_settings_dict = no_compression_data.spectrum_settings_dict, 
+        # general_info
+        ionization_type = no_compression_data.ionization_type, 
+        analyzer_type = no_compression_data.analyzer_type, 
+        # Info that is not set during the file conversion
+        ref_row=ref_row, 
+        mz_set_info_for_chromatogram_extraction=mz_set_info_for_chromatogram_extraction
+    )
+    return rpd, message
+
+# v3.0: mz_set and inten_set are saved in chunks of consecutive scans (RT blocks), each compressed separately, and the
+# offsets of the chunks are saved in the header (chunk_index). load_3_0 only reads the header and the small sections, and
+# chunks are decompressed when extraction touches them (db.ChunkedArray).
+# v3.1: db.ScanSummary (TIC, BPC etc.) is saved as a section before the chunks, so that TIC is shown without any chunk.
+def get_chunk_row_starts(N_scan):
+    N_scan_per_chunk = max(scans_per_chunk, -(-N_scan // max_chunks))
+    return np.append(np.arange(0, N_scan, N_scan_per_chunk), N_scan).astype(np.int64)
+def get_scan_lengths(rpd: db.RPD, mz_set):
+    if rpd.storage == "ragged":
+        return mz_set.row_lengths()
+    scan_lengths = np.full(rpd.N_scan, mz_set.shape[1], dtype=np.int64)
+    nan_start_rows, nan_start_cols = rpd.get_mz_set_nan_start_locs()
+    scan_lengths[nan_start_rows] = nan_start_cols
+    return scan_lengths
+# Arrays of a section are saved as an npz archive (not compressed by numpy) compressed by the codec as a whole.
+# With byte_shuffle, integer arrays are saved as their bytes grouped by significance (all lowest bytes, then the next ...).
+# Small deltas then become long runs of zeros, which compress better (the keys are listed in "shuffled_keys").
+def pack_arrays(array_dict, codec):
+    shuffled_key_list = []
+    for key, array in list(array_dict.items()):
+        array = np.asarray(array)
+        if byte_shuffle and (array.dtype.kind in "iu") and (array.dtype.itemsize > 1) and (array.ndim > 0):
+            array_dict[key] = np.ascontiguousarray(np.moveaxis(np.ascontiguousarray(array).view(np.uint8).reshape(*array.shape, array.dtype.itemsize), -1, 0))
+            shuffled_key_list.append(f"{key}:{array.dtype.str}")
+    with BytesIO() as f:
+        np.savez(f, shuffled_keys=np.array(shuffled_key_list, dtype=str), **array_dict)
+        return codec_dict[codec][0](f.getvalue())
+# also reads sections saved by np.savez_compressed (codec="none")
+def unpack_arrays(section_bytes, codec):
+    with BytesIO(codec_dict[codec][1](section_bytes)) as f:
+        npz = np.load(f)
+        array_dict = {key:npz[key] for key in npz.files}
+    for shuffled_key in array_dict.pop("shuffled_keys", []):
+        key, dtype = shuffled_key.rsplit(":", 1)
+        array_dict[key] = np.ascontiguousarray(np.moveaxis(array_dict[key], 0, -1)).view(dtype)[..., 0]
+    return array_dict
+def compress_scan_summary(rpd: db.RPD, codec):
+    return pack_arrays(rpd.get_scan_summary().to_dict(), codec)
+def decompress_scan_summary(scan_summary_bytes, codec):
+    return db.ScanSummary(**unpack_arrays(scan_summary_bytes, codec))
+def get_section_codec(header, section):
+    return getattr(header, "section_codec_dict", {}).get(section, "none")
+def compress_mz_chunk(mz_chunk, header, spectrum_type, scan_lengths):
+    if header.storage == "ragged":
+        array_dict = dict(
+            mz_values=mz_chunk.values
+        )
+    elif header.mz_set_encoding == "tof_model":
+        coefs, residual = encode_mz_set_tof_model(mz_chunk, scan_lengths, tof_model_degree)
+        array_dict = dict(
+            coefs=coefs, 
+            residual=residual
+        )
+    elif spectrum_type == "continuous":
+        (initial_mz_array0, initial_mz_array1, initial_mz_array2), mz_chunk_diff = deep_diff(np.nan_to_num(mz_chunk, nan=0).astype(np.float64, copy=False), axis_list=[1, 1, 0], num_threads=1)
+        array_dict = dict(
+            initial_mz_array0=initial_mz_array0, 
+            initial_mz_array1=initial_mz_array1, 
+            initial_mz_array2=initial_mz_array2, 
+            mz_set_diff=mz_chunk_diff
+        )
+    elif spectrum_type == "discrete":
+        array_dict = dict(
+            mz_set_diff=np.nan_to_num(mz_chunk, nan=0)
+        )
+    else:
+        raise Exception(f"unknown spectrum type: {spectrum_type}")
+    return pack_arrays(array_dict, get_section_codec(header, "mz_set"))
+def compress_inten_chunk(inten_chunk, header, spectrum_type):
+    if header.storage == "ragged":
+        array_dict = dict(
+            inten_values=inten_chunk.values
+        )
+    elif spectrum_type == "continuous":
+        (initial_inten_array0, ), inten_chunk_diff = deep_diff(inten_chunk, axis_list=[0])
+        array_dict = dict(
+            initial_inten_array0=initial_inten_array0, 
+            inten_set_diff=inten_chunk_diff
+        )
+    elif spectrum_type == "discrete":
+        array_dict = dict(
+            inten_set_diff=inten_chunk
+        )
+    else:
+        raise Exception(f"unknown spectrum type: {spectrum_type}")
+    return pack_arrays(array_dict, get_section_codec(header, "inten_set"))
+def decompress_mz_chunk(mz_chunk_bytes, header, spectrum_type, scan_lengths):
+    compressed_mz_chunk = unpack_arrays(mz_chunk_bytes, get_section_codec(header, "mz_set"))
+    if header.storage == "ragged":
+        return db.RaggedArray.from_row_lengths(compressed_mz_chunk["mz_values"], scan_lengths)
+    elif header.mz_set_encoding == "tof_model":
+        mz_chunk = decode_mz_set_tof_model(compressed_mz_chunk["coefs"], compressed_mz_chunk["residual"], header.mz_dtype)
+    elif spectrum_type == "continuous":
+        initial_mz_array_list = [
+            compressed_mz_chunk["initial_mz_array0"], 
+            compressed_mz_chunk["initial_mz_array1"], 
+            compressed_mz_chunk["initial_mz_array2"]
+        ]
+        mz_chunk = revert_deep_diff(compressed_mz_chunk["mz_set_diff"], initial_mz_array_list, axis_list=[1, 1, 0], num_threads=1).astype(header.mz_dtype, copy=False)
+    elif spectrum_type == "discrete":
+        mz_chunk = compressed_mz_chunk["mz_set_diff"]
+    else:
+        raise Exception(f"unknown spectrum type: {spectrum_type}")
+    mz_chunk[np.arange(mz_chunk.shape[1]) >= np.expand_dims(scan_lengths, 1)] = np.nan
+    return mz_chunk
+def decompress_inten_chunk(inten_chunk_bytes, header, spectrum_type, scan_lengths):
+    compressed_inten_chunk = unpack_arrays(inten_chunk_bytes, get_section_codec(header, "inten_set"))
+    if header.storage == "ragged":
+        return db.RaggedArray.from_row_lengths(compressed_inten_chunk["inten_values"], scan_lengths)
+    elif spectrum_type == "continuous":
+        initial_inten_array_list = [
+            compressed_inten_chunk["initial_inten_array0"], 
+        ]
+        return revert_deep_diff(compressed_inten_chunk["inten_set_diff"], initial_inten_array_list, axis_list=[0])
+    elif spectrum_type == "discrete":
+        return compressed_inten_chunk["inten_set_diff"]
+    else:
+        raise Exception(f"unknown spectrum type: {spectrum_type}")
+
+def dump_3_0(rpd: db.RPD, rpd_path):
+    """ 
+    # KEYS TO SAVE
+    # info
+    self.data_hash
+
+    # data
+    self.spectrum_type
+    self.mz_set     (ndarray2d or RaggedArray, see header.storage; saved in chunks as header.mz_set_encoding)
+    self.inten_set  (ndarray2d or RaggedArray, see header.storage; saved in chunks)
+
+    # RT info and etc.
+    self.RT_list
+    self.RT_unit
+    self.spectrum_settings_dict
+
+    # general info
+    self.ionization_type = ionization_type
+    self.analyzer_type = analyzer_type
+
+    # summary of each scan
+    self.scan_summary   (calculated here if not yet)
+
+    # KEYS NO SAVE
+        self.file_path
+        self.N_scan
+    """
+    # rpd loaded from v3.0 file
+    if isinstance(rpd.mz_set, db.ChunkedArray):
+        mz_set, inten_set = rpd.mz_set[:], rpd.inten_set[:]
+    else:
+        mz_set, inten_set = rpd.mz_set, rpd.inten_set
+    scan_lengths = get_scan_lengths(rpd, mz_set)
+
+    ##########
+    # header #
+    ##########
+    header = Header()
+    header.storage = rpd.storage
+    header.mz_dtype = mz_set.dtype.str
+    header.inten_dtype = inten_set.dtype.str
+    if (rpd.storage == "ndarray2d") and (rpd.spectrum_type == "continuous") and (mz_set_encoding_continuous == "tof_model"):
+        header.mz_set_encoding = choose_mz_set_encoding(mz_set)
+    header.chunk_row_starts = get_chunk_row_starts(rpd.N_scan)
+    header.section_codec_dict = {section:section_codec for section in ("mz_set", "inten_set", "mz_set_info_for_chromatogram_extraction", "scan_summary")}
+
+    #######################
+    # no_compression_data #
+    #######################
+    no_compression_data = NoCompressionData(
+        spectrum_type = rpd.spectrum_type, 
+        RT_list = rpd.RT_list, 
+        RT_unit = rpd.RT_unit, 
+        spectrum_settings_dict = rpd.spectrum_settings_dict, 
+        ionization_type = rpd.ionization_type, 
+        analyzer_type = rpd.analyzer_type, 
+        mz_set_nan_start_locs = ([], []),   # scan_lengths is used instead
+        scan_lengths = scan_lengths, 
+        source_data_hash = rpd.source_data_hash, 
+        source_message = rpd.source_message
+    )
+    with BytesIO() as f:
+        pickle.dump(no_compression_data, f)
+        f.seek(0)
+        no_compression_data_bytes = f.read()
+
+    #######################################################################
+    # mz_set, inten_set (in chunks), mz_set_info_for_chromatogram_extraction #
+    #######################################################################
+    def compress_chunk(chunk_idx):
+        row_btm, row_top = header.chunk_row_starts[chunk_idx:chunk_idx + 2]
+        return (
+            compress_mz_chunk(mz_set[row_btm:row_top], header, rpd.spectrum_type, scan_lengths[row_btm:row_top]), 
+            compress_inten_chunk(inten_set[row_btm:row_top], header, rpd.spectrum_type)
+        )
+    # chunk_index is back-patched when all chunks are written (pickled size only depends on the number of chunks)
+    N_chunk = len(header.chunk_row_starts) - 1
+    header.chunk_index = np.zeros((N_chunk, 4), dtype=np.int64)
+    header.chunk_checksums = np.zeros((N_chunk, 2), dtype=np.uint32)
+    header.section_checksum_dict = {section:np.uint32(0) for section in ("mz_set_info_for_chromatogram_extraction", "no_compression_data", "scan_summary")}
+    with BytesIO() as f:
+        pickle.dump(header, f)
+        header_size = len(f.getvalue())
+    if header_size >= 1 << (8 * InfoNoSave.header_info_len):
+        raise Exception(f"header is too large: {header_size} bytes")
+    print("compressing m/z and intensity data...")
+    # zlib and numpy release the GIL, so that the chunks are compressed concurrently. Chunks are written in order as soon
+    # as they are compressed, and at most 2 * n_workers_section_codec compressed chunks are kept in memory.
+    timer = StageTimer()
+    with ThreadPoolExecutor(max_workers=n_workers_section_codec) as executor, RPDWriter(rpd_path, header.major_ver, header.minor_ver) as writer:
+        header_pos = writer.reserve(InfoNoSave.header_info_len + header_size)
+        mz_set_info_for_chromatogram_extraction_future = executor.submit(
+            timer.timed, "compress additional info", compress_mz_set_info_for_chromatogram_extraction, rpd, get_section_codec(header, "mz_set_info_for_chromatogram_extraction")
+        )
+        scan_summary_future = executor.submit(timer.timed, "calculate scan summary", compress_scan_summary, rpd, get_section_codec(header, "scan_summary"))
+        N_chunk_in_flight = 2 * n_workers_section_codec
+        chunk_future_deque = deque(executor.submit(timer.timed, "compress chunks", compress_chunk, chunk_idx) for chunk_idx in range(min(N_chunk, N_chunk_in_flight)))
+        section_bytes_dict = {
+            "mz_set_info_for_chromatogram_extraction":mz_set_info_for_chromatogram_extraction_future.result(), 
+            "no_compression_data":no_compression_data_bytes, 
+            "scan_summary":scan_summary_future.result(), 
+        }
+        for section, section_bytes in section_bytes_dict.items():
+            header.section_checksum_dict[section] = np.uint32(zlib.crc32(section_bytes))
+            writer.write_section(section_bytes, getattr(header, f"{section}_bytes_info_len"))
+        chunk_start = writer.tell()
+        for chunk_idx in range(N_chunk):
+            if chunk_idx + N_chunk_in_flight < N_chunk:
+                chunk_future_deque.append(executor.submit(timer.timed, "compress chunks", compress_chunk, chunk_idx + N_chunk_in_flight))
+            mz_chunk_bytes, inten_chunk_bytes = chunk_future_deque.popleft().result()
+            header.chunk_index[chunk_idx] = writer.tell() - chunk_start, len(mz_chunk_bytes), writer.tell() - chunk_start + len(mz_chunk_bytes), len(inten_chunk_bytes)
+            header.chunk_checksums[chunk_idx] = zlib.crc32(mz_chunk_bytes), zlib.crc32(inten_chunk_bytes)
+            writer.write(mz_chunk_bytes)
+            writer.write(inten_chunk_bytes)
+        with BytesIO() as f:
+            pickle.dump(header, f)
+            header_bytes = f.getvalue()
+        if len(header_bytes) != header_size:
+            raise Exception(f"header size changed: {header_size} -> {len(header_bytes)} bytes")
+        writer.patch(header_pos, header_size.to_bytes(InfoNoSave.header_info_len, byteorder=InfoNoSave.byteorder, signed=False) + header_bytes)
+    print(timer.summary("compression", concurrent=True))
+    print("DONE")
+    print()
+
+def load_3_0(rpd_path):
+    with open(rpd_path, "rb") as f:
+        magic_number = f.read(InfoNoSave.magic_number_size())
+        if magic_number != InfoNoSave.magic_number:
+            raise Exception(f"file broken: {rpd_path}")
+        major_ver = int.from_bytes(f.read(InfoNoSave.major_ver_size()), byteorder=InfoNoSave.byteorder)
+        minor_ver = int.from_bytes(f.read(InfoNoSave.minor_ver_size()), byteorder=InfoNoSave.byteorder)
+        data_hash = f.read(InfoNoSave.hash_size())
+        header_size = int.from_bytes(f.read(InfoNoSave.header_info_len), byteorder=InfoNoSave.byteorder)
+        header_bytes = f.read(header_size)
+
+        ################################
+        # version specific process PRE #
+        ################################
+        version_int = major_ver + minor_ver/10
+        if version_int < 3.0:
+            return load_2_4(rpd_path)
+        print(f"file version: {major_ver}.{minor_ver}")
+
+        ###############
+        # open header #
+        ###############
+        with BytesIO() as f_h:
+            f_h.write(header_bytes)
+            f_h.seek(0)
+            header = pickle.load(f_h)
+
+        ##############
+        # load bytes #
+        ##############
+        mz_set_info_for_chromatogram_extraction_bytes_size = int.from_bytes(f.read(header.mz_set_info_for_chromatogram_extraction_bytes_info_len), byteorder=InfoNoSave.byteorder)
+        mz_set_info_for_chromatogram_extraction_bytes = f.read(mz_set_info_for_chromatogram_extraction_bytes_size)
+        no_compression_data_bytes_size = int.from_bytes(f.read(header.no_compression_data_bytes_info_len), byteorder=InfoNoSave.byteorder)
+        no_compression_data_bytes = f.read(no_compression_data_bytes_size)
+        if version_int >= 3.1:
+            scan_summary_bytes_size = int.from_bytes(f.read(header.scan_summary_bytes_info_len), byteorder=InfoNoSave.byteorder)
+            scan_summary_bytes = f.read(scan_summary_bytes_size)
+        else:
+            scan_summary_bytes = None   # calculated on first use
+        chunk_start = f.tell()
+
+    ############################
+    # open no_compression_data #
+    ############################
+    if verify_checksums and (version_int >= 3.2):
+        check_checksum(mz_set_info_for_chromatogram_extraction_bytes, header.section_checksum_dict["mz_set_info_for_chromatogram_extraction"], rpd_path, "additional info")
+        check_checksum(no_compression_data_bytes, header.section_checksum_dict["no_compression_data"], rpd_path, "no compression data")
+        check_checksum(scan_summary_bytes, header.section_checksum_dict["scan_summary"], rpd_path, "scan summary")
+    with BytesIO() as f_ncd:
+        f_ncd.write(no_compression_data_bytes)
+        f_ncd.seek(0)
+        no_compression_data = pickle.load(f_ncd)
+    # message of the file upgraded from (e.g. v2.2) is shown as if the original file was opened
+    message = getattr(no_compression_data, "source_message", None)
+    scan_lengths = no_compression_data.scan_lengths
+    ref_row, mz_set_info_for_chromatogram_extraction = decompress_mz_set_info_for_chromatogram_extraction(
+        mz_set_info_for_chromatogram_extraction_bytes, no_compression_data, get_section_codec(header, "mz_set_info_for_chromatogram_extraction")
+    )
+    if scan_summary_bytes is not None:
+        scan_summary = decompress_scan_summary(scan_summary_bytes, get_section_codec(header, "scan_summary"))
+    else:
+        scan_summary = None
+
+    #########################################
+    # mz_set, inten_set (decoded on demand) #
+    #########################################
+    # chunks are verified when they are decoded (in the threads of db.ChunkedArray)
+    verify_chunks = verify_checksums and (version_int >= 3.2)
+    def read_chunk_bytes(chunk_idx, index_col):
+        offset, size = header.chunk_index[chunk_idx, index_col:index_col + 2]
+        with open(rpd_path, "rb") as f:
+            f.seek(chunk_start + offset)
+            chunk_bytes = f.read(size)
+        if verify_chunks:
+            check_checksum(chunk_bytes, header.chunk_checksums[chunk_idx, index_col // 2], rpd_path, f"chunk {chunk_idx}")
+        return chunk_bytes
+    def load_mz_chunk(chunk_idx):
+        row_btm, row_top = header.chunk_row_starts[chunk_idx:chunk_idx + 2]
+        return decompress_mz_chunk(read_chunk_bytes(chunk_idx, 0), header, no_compression_data.spectrum_type, scan_lengths[row_btm:row_top])
+    def load_inten_chunk(chunk_idx):
+        row_btm, row_top = header.chunk_row_starts[chunk_idx:chunk_idx + 2]
+        return decompress_inten_chunk(read_chunk_bytes(chunk_idx, 2), header, no_compression_data.spectrum_type, scan_lengths[row_btm:row_top])
+    mz_set_loaded = db.ChunkedArray(header.storage, header.mz_dtype, scan_lengths, header.chunk_row_starts, load_mz_chunk, chunk_cache_bytes, n_workers_section_codec)
+    inten_set_loaded = db.ChunkedArray(header.storage, header.inten_dtype, scan_lengths, header.chunk_row_starts, load_inten_chunk, chunk_cache_bytes, n_workers_section_codec)
+
+    # LOAD
+    rpd = db.RPD(
+        data_hash = data_hash, 
+        file_path = rpd_path, 
+        spectrum_type = no_compression_data.spectrum_type, 
+        mz_set = mz_set_loaded, 
+        inten_set = inten_set_loaded, 
+        RT_list = no_compression_data.RT_list, 
+        RT_unit = no_compression_data.RT_unit, 
+        spectrum_settings_dict = no_compression_data.spectrum_settings_dict, 
+        # general_info
+        ionization_type = no_compression_data.ionization_type, 
+        analyzer_type = no_compression_data.analyzer_type, 
+        # Info that is not set during the file conversion
+        ref_row=ref_row, 
+        mz_set_info_for_chromatogram_extraction=mz_set_info_for_chromatogram_extraction, 
+        scan_lengths=scan_lengths, 
+        scan_summary=scan_summary, 
+        source_data_hash=getattr(no_compression_data, "source_data_hash", None), 
+        source_message=message
+    )
+    return rpd, message
+
+###########
+# upgrade #
+###########
+# Rewrites an rpd file of an older version in the current format (upgraded_rpd_path may be rpd_path: the file is replaced
+# when the new one is completely written). For v2.2 files, mz_set_info_for_chromatogram_extraction is calculated here
+# once instead of on every open. data_hash of the original file is kept as source_data_hash (the first one, if upgraded repeatedly),
+# and the message on opening it (e.g. possible loss of information of v2.2) as source_message, which load_3_0 returns.
+def upgrade_file(rpd_path, upgraded_rpd_path):
+    rpd, message = load_3_0(rpd_path)
+    if rpd.source_data_hash is None:
+        rpd.source_data_hash = rpd.data_hash
+        rpd.source_message = message
+    dump_3_0(rpd, upgraded_rpd_path)
+    verify_file(upgraded_rpd_path)
+    return rpd.source_data_hash, read_data_hash(upgraded_rpd_path), message
+
+###################
+# verify checksum #
+###################
+def check_checksum(data_bytes, checksum, rpd_path, name):
+    if zlib.crc32(data_bytes) != checksum:
+        raise Exception(f"checksum mismatch ({name}): {rpd_path}\nThe file may be broken (e.g. incomplete copy). Please copy or re-generate it.")
+# Verifies the whole file: checksums of all sections and chunks of v3.2 files (chunks in parallel threads; zlib releases
+# the GIL), or data_hash (sha256 of all bytes after it) of older files. Raises an exception if the file is broken.
+def verify_file(rpd_path):
+    with open(rpd_path, "rb") as f:
+        magic_number = f.read(InfoNoSave.magic_number_size())
+        if magic_number != InfoNoSave.magic_number:
+            raise Exception(f"file broken: {rpd_path}")
+        major_ver = int.from_bytes(f.read(InfoNoSave.major_ver_size()), byteorder=InfoNoSave.byteorder)
+        minor_ver = int.from_bytes(f.read(InfoNoSave.minor_ver_size()), byteorder=InfoNoSave.byteorder)
+        data_hash = f.read(InfoNoSave.hash_size())
+        version_int = major_ver + minor_ver/10
+        if version_int < 3.2:
+            sha256 = hashlib.sha256()
+            data_bytes = f.read(RPDWriter.read_size)
+            while len(data_bytes) > 0:
+                sha256.update(data_bytes)
+                data_bytes = f.read(RPDWriter.read_size)
+            if sha256.hexdigest().encode() != data_hash:
+                raise Exception(f"data hash mismatch: {rpd_path}\nThe file may be broken (e.g. incomplete copy). Please copy or re-generate it.")
+            return
+        header_size = int.from_bytes(f.read(InfoNoSave.header_info_len), byteorder=InfoNoSave.byteorder)
+        with BytesIO(f.read(header_size)) as f_h:
+            header = pickle.load(f_h)
+        for section, name in (("mz_set_info_for_chromatogram_extraction", "additional info"), ("no_compression_data", "no compression data"), ("scan_summary", "scan summary")):
+            section_bytes_size = int.from_bytes(f.read(getattr(header, f"{section}_bytes_info_len")), byteorder=InfoNoSave.byteorder)
+            check_checksum(f.read(section_bytes_size), header.section_checksum_dict[section], rpd_path, name)
+        chunk_start = f.tell()
+    def check_chunk(chunk_idx):
+        with open(rpd_path, "rb") as f:
+            for index_col in (0, 2):
+                offset, size = header.chunk_index[chunk_idx, index_col:index_col + 2]
+                f.seek(chunk_start + offset)
+                check_checksum(f.read(size), header.chunk_checksums[chunk_idx, index_col // 2], rpd_path, f"chunk {chunk_idx}")
+    with ThreadPoolExecutor(max_workers=n_workers_section_codec) as executor:
+        list(executor.map(check_chunk, range(len(header.chunk_index))))
+
+#############
+# lazy open #
+#############
+# Only the header and the small sections are read: offsets of mz_set and inten_set are kept, and they are read and
+# decompressed on first access (db.LazyRPD). v3.0 files are opened by load_3_0 (chunks are decoded on demand anyway),
+# and v2.2 files are loaded at once (ref_row etc. are calculated from mz_set).
+def load_lazy(rpd_path):
+    with open(rpd_path, "rb") as f:
+        magic_number = f.read(InfoNoSave.magic_number_size())
+        if magic_number != InfoNoSave.magic_number:
+            raise Exception(f"file broken: {rpd_path}")
+        major_ver = int.from_bytes(f.read(InfoNoSave.major_ver_size()), byteorder=InfoNoSave.byteorder)
+        minor_ver = int.from_bytes(f.read(InfoNoSave.minor_ver_size()), byteorder=InfoNoSave.byteorder)
+        data_hash = f.read(InfoNoSave.hash_size())
+        header_size = int.from_bytes(f.read(InfoNoSave.header_info_len), byteorder=InfoNoSave.byteorder)
+        header_bytes = f.read(header_size)
+
+        ################################
+        # version specific process PRE #
+        ################################
+        version_int = major_ver + minor_ver/10
+        if (version_int < 2.3) or (version_int >= 3.0):
+            return load_3_0(rpd_path)
+        message = None
+        print(f"file version: {major_ver}.{minor_ver}")
+
+        ###############
+        # open header #
+        ###############
+        with BytesIO() as f_h:
+            f_h.write(header_bytes)
+            f_h.seek(0)
+            header = pickle.load(f_h)
+
+        ##########################################
+        # skip mz_set and inten_set, load others #
+        ##########################################
+        mz_set_bytes_size = int.from_bytes(f.read(header.mz_set_bytes_info_len), byteorder=InfoNoSave.byteorder)
+        mz_set_bytes_pos = f.tell()
+        f.seek(mz_set_bytes_size, 1)
+        inten_set_bytes_size = int.from_bytes(f.read(header.inten_set_bytes_info_len), byteorder=InfoNoSave.byteorder)
+        inten_set_bytes_pos = f.tell()
+        f.seek(inten_set_bytes_size, 1)
+        mz_set_info_for_chromatogram_extraction_bytes_size = int.from_bytes(f.read(header.mz_set_info_for_chromatogram_extraction_bytes_info_len), byteorder=InfoNoSave.byteorder)
+        mz_set_info_for_chromatogram_extraction_bytes = f.read(mz_set_info_for_chromatogram_extraction_bytes_size)
+        no_compression_data_bytes_size = int.from_bytes(f.read(header.no_compression_data_bytes_info_len), byteorder=InfoNoSave.byteorder)
+        no_compression_data_bytes = f.read(no_compression_data_bytes_size)
+        if len(no_compression_data_bytes) != no_compression_data_bytes_size:
+            raise Exception(f"file broken: {rpd_path}")
+
+    ############################
+    # open no_compression_data #
+    ############################
+    with BytesIO() as f_ncd:
+        f_ncd.write(no_compression_data_bytes)
+        f_ncd.seek(0)
+        no_compression_data = pickle.load(f_ncd)
+    ref_row, mz_set_info_for_chromatogram_extraction = decompress_mz_set_info_for_chromatogram_extraction(
+        mz_set_info_for_chromatogram_extraction_bytes, no_compression_data, get_section_codec(header, "mz_set_info_for_chromatogram_extraction")
+    )
+
+    ########################################
+    # mz_set, inten_set (loaded on demand) #
+    ########################################
+    def load_arrays():
+        with open(rpd_path, "rb") as f:
+            f.seek(mz_set_bytes_pos)
+            mz_set_bytes = f.read(mz_set_bytes_size)
+            f.seek(inten_set_bytes_pos)
+            inten_set_bytes = f.read(inten_set_bytes_size)
+        mz_set_loaded, inten_set_loaded, _ = decompress_sections(
+            mz_set_bytes, inten_set_bytes, mz_set_info_for_chromatogram_extraction_bytes, header, no_compression_data
+        )
+        return mz_set_loaded, inten_set_loaded
+
+    # LOAD
+    rpd = db.LazyRPD(
+        load_arrays = load_arrays, 
+        storage = getattr(header, "storage", "ndarray2d"), 
+        data_hash = data_hash, 
+        file_path = rpd_path, 
+        spectrum_type = no_compression_data.spectrum_type, 
+        RT_list = no_compression_data.RT_list, 
+        RT_unit = no_compression_data.RT_unit, 
+        spectrum_settings_dict = no_compression_data.spectrum_settings_dict, 
+        # general_info
+        ionization_type = no_compression_data.ionization_type, 
+        analyzer_type = no_compression_data.analyzer_type, 
+        # Info that is not set during the file conversion
+        ref_row=ref_row, 
+        mz_set_info_for_chromatogram_extraction=mz_set_info_for_chromatogram_extraction
+    )
+    return rpd, message
+
+######################
+# decoded data cache #
+######################
+# Decoded arrays of an opened rpd file are saved as raw *.npy files in decoded_cache_dir/<data_hash>/. When a file with the
+# same data_hash is opened again, they are mapped into memory (copy-on-write, as deisotoping modifies inten_set in place),
+# so that nothing is decompressed. A re-converted file has a different data_hash, and its old entry is removed as unused.
+def read_version(rpd_path):
+    with open(rpd_path, "rb") as f:
+        if f.read(InfoNoSave.magic_number_size()) != InfoNoSave.magic_number:
+            raise Exception(f"file broken: {rpd_path}")
+        major_ver = int.from_bytes(f.read(InfoNoSave.major_ver_size()), byteorder=InfoNoSave.byteorder)
+        minor_ver = int.from_bytes(f.read(InfoNoSave.minor_ver_size()), byteorder=InfoNoSave.byteorder)
+        return major_ver, minor_ver
+def read_data_hash(rpd_path):
+    with open(rpd_path, "rb") as f:
+        if f.read(InfoNoSave.magic_number_size()) != InfoNoSave.magic_number:
+            raise Exception(f"file broken: {rpd_path}")
+        f.seek(InfoNoSave.major_ver_size() + InfoNoSave.minor_ver_size(), 1)
+        return f.read(InfoNoSave.hash_size())
+def get_decoded_cache_path(data_hash):
+    return Path(decoded_cache_dir) / data_hash.decode()
+def load_decoded_cache(rpd_path):
+    if not decoded_cache:
+        return None
+    data_hash = read_data_hash(rpd_path)
+    cache_path = get_decoded_cache_path(data_hash)
+    if not (cache_path / "info.pickle").exists():
+        return None
+    try:
+        with open(cache_path / "info.pickle", "rb") as f:
+            info = pickle.load(f)
+        if info["data_hash"] != data_hash:
+            raise Exception(f"data hash does not match: {cache_path}")
+        array_dict = {npy_path.stem:np.load(npy_path, mmap_mode="c") for npy_path in cache_path.glob("*.npy")}
+        if info["storage"] == "ndarray2d":
+            mz_set, inten_set = array_dict["mz_set"], array_dict["inten_set"]
+        elif info["storage"] == "ragged":
+            mz_set = db.RaggedArray(array_dict["mz_values"], array_dict["offsets"])
+            inten_set = db.RaggedArray(array_dict["inten_values"], array_dict["offsets"])
+        else:
+            raise Exception(f"unknown storage: {info['storage']}")
+        rpd = db.RPD(
+            data_hash = data_hash, 
+            file_path = rpd_path, 
+            spectrum_type = info["spectrum_type"], 
+            mz_set = mz_set, 
+            inten_set = inten_set, 
+            RT_list = np.asarray(array_dict["RT_list"]), 
+            RT_unit = info["RT_unit"], 
+            spectrum_settings_dict = info["spectrum_settings_dict"], 
+            # general_info
+            ionization_type = info["ionization_type"], 
+            analyzer_type = info["analyzer_type"], 
+            # Info that is not set during the file conversion
+            ref_row = info["ref_row"], 
+            mz_set_info_for_chromatogram_extraction = array_dict.get("mz_set_info_for_chromatogram_extraction"), 
+            scan_lengths = info["scan_lengths"], 
+            scan_summary = db.ScanSummary(**{key:array_dict[f"scan_summary_{key}"] for key in db.ScanSummary.keys}) if "scan_summary_TIC" in array_dict else None, 
+            source_data_hash = info.get("source_data_hash"), 
+            source_message = info.get("source_message")
+        )
+    except Exception:
+        # broken entry (e.g. interrupted writing): rebuilt by save_decoded_cache
+        print(f"decoded cache ignored:\n{traceback.format_exc()}")
+        shutil.rmtree(cache_path, ignore_errors=True)
+        return None
+    os.utime(cache_path / "info.pickle")    # last use (see evict_decoded_cache)
+    print(f"decoded cache: {cache_path}")
+    return rpd
+# v3 files (db.ChunkedArray) are written in the background, chunk by chunk, so that the whole matrix is never decoded at once.
+# The chunks are decoded from the file again (not those in db.ChunkedArray.cache, as deisotoping modifies inten_set in place).
+decoded_cache_executor = ThreadPoolExecutor(max_workers=1)
+def save_decoded_cache(rpd: db.RPD):
+    if not decoded_cache:
+        return
+    array_dict = {"RT_list":np.asarray(rpd.RT_list)}
+    if rpd.mz_set_info_for_chromatogram_extraction is not None:
+        array_dict["mz_set_info_for_chromatogram_extraction"] = rpd.mz_set_info_for_chromatogram_extraction
+    if rpd.scan_summary is not None:
+        array_dict.update({f"scan_summary_{key}":array for key, array in rpd.scan_summary.to_dict().items()})
+    info = dict(
+        data_hash = rpd.data_hash, 
+        storage = rpd.storage, 
+        spectrum_type = rpd.spectrum_type, 
+        RT_unit = rpd.RT_unit, 
+        spectrum_settings_dict = rpd.spectrum_settings_dict, 
+        ionization_type = rpd.ionization_type, 
+        analyzer_type = rpd.analyzer_type, 
+        ref_row = rpd.ref_row, 
+        scan_lengths = rpd.scan_lengths, 
+        source_data_hash = rpd.source_data_hash, 
+        source_message = rpd.source_message, 
+    )
+    if isinstance(rpd.mz_set, db.ChunkedArray):
+        decoded_cache_executor.submit(write_decoded_cache, rpd.data_hash, array_dict, info, {"mz":rpd.mz_set, "inten":rpd.inten_set})
+        return
+    if rpd.storage == "ndarray2d":
+        array_dict.update({"mz_set":rpd.mz_set, "inten_set":rpd.inten_set})
+    elif rpd.storage == "ragged":
+        array_dict.update({"mz_values":rpd.mz_set.values, "inten_values":rpd.inten_set.values, "offsets":rpd.mz_set.offsets})
+    else:
+        raise Exception(f"unknown storage: {rpd.storage}")
+    write_decoded_cache(rpd.data_hash, array_dict, info, {})
+def write_decoded_cache(data_hash, array_dict, info, chunked_array_dict):
+    cache_path = get_decoded_cache_path(data_hash)
+    if chunked_array_dict and (cache_path / "info.pickle").exists():   # saved in the meantime (the same file opened again)
+        return
+    # written in a temporary directory first, so that a half-written entry is never loaded
+    # (unique in each thread, as files are opened in parallel)
+    tmp_path = cache_path.with_name(f"{cache_path.name}.tmp{os.getpid()}_{threading.get_ident()}")
+    try:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        tmp_path.mkdir(parents=True)
+        for key, array in array_dict.items():
+            np.save(tmp_path / f"{key}.npy", array)
+        for key, chunked_array in chunked_array_dict.items():
+            save_chunked_array(tmp_path, key, chunked_array)
+        with open(tmp_path / "info.pickle", "wb") as f:
+            pickle.dump(info, f)
+        shutil.rmtree(cache_path, ignore_errors=True)
+        try:
+            tmp_path.rename(cache_path)
+        except OSError:     # saved by another process in the meantime
+            shutil.rmtree(tmp_path, ignore_errors=True)
+    except Exception:
+        print(f"decoded cache not saved:\n{traceback.format_exc()}")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        return
+    evict_decoded_cache()
+# same files as np.save of the whole array, filled chunk by chunk (memory-mapped)
+def save_chunked_array(tmp_path, key, chunked_array):
+    if chunked_array.storage == "ndarray2d":
+        array = np.lib.format.open_memmap(tmp_path / f"{key}_set.npy", mode="w+", dtype=chunked_array.dtype, shape=chunked_array.shape)
+    elif chunked_array.storage == "ragged":
+        offsets = np.zeros(len(chunked_array) + 1, dtype=np.int64)
+        np.cumsum(chunked_array.scan_lengths, out=offsets[1:])
+        array = np.lib.format.open_memmap(tmp_path / f"{key}_values.npy", mode="w+", dtype=chunked_array.dtype, shape=(int(offsets[-1]), ))
+        np.save(tmp_path / "offsets.npy", offsets)
+    else:
+        raise Exception(f"unknown storage: {chunked_array.storage}")
+    for chunk_idx in range(chunked_array.N_chunk):
+        row_btm, row_top = chunked_array.chunk_row_starts[chunk_idx:chunk_idx + 2]
+        chunk = chunked_array.load_chunk(chunk_idx)
+        if chunked_array.storage == "ndarray2d":
+            array[row_btm:row_top] = chunk
+        else:
+            array[offsets[row_btm]:offsets[row_top]] = chunk.values
+    array.flush()
+    del array
+# least recently used entries are removed until the total size is below decoded_cache_max_bytes (the latest one is kept)
+def evict_decoded_cache():
+    entry_list = []
+    for cache_path in Path(decoded_cache_dir).iterdir():
+        if ".tmp" in cache_path.name:   # being written
+            continue
+        try:
+            entry_list.append(((cache_path / "info.pickle").stat().st_mtime, sum(p.stat().st_size for p in cache_path.iterdir()), cache_path))
+        except FileNotFoundError:       # being written or removed by another thread/process
+            continue
+    entry_list.sort(key=lambda entry: entry[0])
+    total_size = sum(size for last_used, size, cache_path in entry_list)
+    for last_used, size, cache_path in entry_list[:-1]:
+        if total_size <= decoded_cache_max_bytes:
+            break
+        shutil.rmtree(cache_path, ignore_errors=True)
+        total_size -= size
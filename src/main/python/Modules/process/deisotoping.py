@@ -40,9 +40,9 @@ def deisotope_core(target_mz_list, target_inten_list, relative_atomic_mass_list,
     if isotopic_composition_list[0] != 1:
         isotopic_composition_list /= isotopic_composition_list[0]
     # get index
-    mz_between_idx_list = [
-        rpd_calc.index_greater_than(threshold=mz_between, array1d=target_mz_list) for mz_between in (relative_atomic_mass_list[1:] + relative_atomic_mass_list[:-1]) / 2
-    ] + [-1]
+    mz_between_idx_list = rpd_calc.index_greater_than_array(
+        threshold_list=(relative_atomic_mass_list[1:] + relative_atomic_mass_list[:-1]) / 2, array1d=target_mz_list
+    ).tolist() + [-1]
     # get reference (M+0) spectrum
     ref_mz_list = target_mz_list[:mz_between_idx_list[0]]
     ref_inten_list = target_inten_list[:mz_between_idx_list[0]]
@@ -60,8 +60,9 @@ def deisotope_core(target_mz_list, target_inten_list, relative_atomic_mass_list,
         mz_top_idx = mz_between_idx_list[i + 1]
         mz_list_to_be_corrected = target_mz_list[mz_btm_idx:mz_top_idx]
         # interpolation
-        inten_list_to_subtract = np.interp(mz_list_to_be_corrected, ref_mz_list_mod, ref_inten_list_mod, left=0, right=0).astype(target_inten_list.dtype)
-        target_inten_list[mz_btm_idx:mz_top_idx] -= inten_list_to_subtract
+        inten_list_to_subtract = np.interp(mz_list_to_be_corrected, ref_mz_list_mod, ref_inten_list_mod, left=0, right=0).astype(np.int64)
+        # subtracted in int64 and clipped at zero, since intensity may be unsigned (e.g. uint16)
+        target_inten_list[mz_btm_idx:mz_top_idx] = np.maximum(target_inten_list[mz_btm_idx:mz_top_idx] - inten_list_to_subtract, 0)
     # Values below zero are not allowed.
     target_inten_list[target_inten_list < 0] = 0
     return original_target_inten_list - target_inten_list
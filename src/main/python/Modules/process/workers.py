@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import traceback
+import numpy as np
+
+from PyQt6.QtCore import (
+    QRunnable, 
+    pyqtSignal, 
+    pyqtSlot, 
+    QObject, 
+)
+
+class WorkerSignals(QObject):
+    finished = pyqtSignal()
+    error = pyqtSignal(tuple)
+    result = pyqtSignal(object)
+    progress = pyqtSignal(int)
+class Worker(QRunnable):
+    def __init__(self, fn, *args, **kwargs):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+    @pyqtSlot()
+    def run(self):
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except:
+            traceback.print_exc()
+            exctype, value = sys.exc_info()[:2]
+            self.signals.error.emit((exctype, value, traceback.format_exc()))
+        else:
+            self.signals.result.emit(result)  # Return the result of the processing
+        finally:
+            self.signals.finished.emit()  # Done
+# use this class when the order of Worker, QThreadpook is important.
+class WorkerResultsProcessor():
+    def __init__(self):
+        self.worker_produced_results = []
+    def append_worker_produced_results(self, order, results):
+        self.worker_produced_results.append([order, results])
+    def thread_pool_finished(self, func):
+        order = np.argsort([order for order, args in self.worker_produced_results])
+        for i in order:
+            func(*self.worker_produced_results[i][1])
@@ -89,10 +89,16 @@ class WarningPopup(QMessageBox):
                         grand_child.setFont(font)
 
 class Preferences(QDialog):
-    def __init__(self, cvParam_assertion):
+    def __init__(self, cvParam_assertion, split_segments, decoded_cache, verify_checksums):
         super().__init__()
         self.cvParam_assertion = QCheckBox("cvParam assertion (not recommended to uncheck)")
         self.cvParam_assertion.setChecked(cvParam_assertion)
+        self.split_segments = QCheckBox("split scans with different settings (e.g. polarity) into separate files")
+        self.split_segments.setChecked(split_segments)
+        self.decoded_cache = QCheckBox("cache decoded data on disk for faster re-opening of files")
+        self.decoded_cache.setChecked(decoded_cache)
+        self.verify_checksums = QCheckBox("verify checksums of opened files (whole files are verified in background)")
+        self.verify_checksums.setChecked(verify_checksums)
         self.btn_ok = QPushButton("Ok")
         self.btn_cancel = QPushButton("Cancel")
         # レイアウト
@@ -103,6 +109,9 @@ class Preferences(QDialog):
         btn_layout.setContentsMargins(0,0,0,0)
         layout = QVBoxLayout()
         layout.addWidget(self.cvParam_assertion)
+        layout.addWidget(self.split_segments)
+        layout.addWidget(self.decoded_cache)
+        layout.addWidget(self.verify_checksums)
         layout.addLayout(btn_layout)
         self.setLayout(layout)
         self.setFixedSize(self.sizeHint())
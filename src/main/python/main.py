@@ -2,6 +2,7 @@
 
 import os, sys
 import traceback
+import multiprocessing
 from pathlib import Path
 
 from PyQt6.QtWidgets import (
@@ -120,12 +121,15 @@ class MainWindow(QMainWindow):
         about_popup = popups.About()
         about_popup.exec()
     def show_preferences(self):
-        preferencess_popup = popups.Preferences(cvParam_assertion=co.cvParam_assertion)
+        preferencess_popup = popups.Preferences(cvParam_assertion=co.cvParam_assertion, split_segments=co.split_segments, decoded_cache=co.decoded_cache, verify_checksums=co.verify_checksums)
         preferencess_popup.exec()
         if preferencess_popup.pressed_button is None:
             return
         elif preferencess_popup.pressed_button == "ok":
             co.cvParam_assertion = preferencess_popup.cvParam_assertion.isChecked()
+            co.split_segments = preferencess_popup.split_segments.isChecked()
+            co.decoded_cache = preferencess_popup.decoded_cache.isChecked()
+            co.verify_checksums = preferencess_popup.verify_checksums.isChecked()
     def show_atomic_ratio_window(self):
         self.atomic_ratio_calculator = arw.AtomicRatioCalculator()
         self.atomic_ratio_calculator.show()
@@ -169,6 +173,7 @@ class MainWindow(QMainWindow):
 
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()    # worker processes used during file conversion
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# tests import the application modules as "Modules.*" (cf. main.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+from pathlib import Path
+import numpy as np
+import pytest
+
+from Modules.MVP import database as db
+
+def open_rpd(spectrum_type, nan_tail=False):
+    RT_list = np.linspace(0, 2, 41)
+    rng = np.random.default_rng(0)
+    if spectrum_type == "continuous":
+        mz_list = np.arange(495, 510, 0.01)
+        mz_set = np.tile(mz_list, (len(RT_list), 1))
+        if nan_tail:    # slightly different m/z in each scan
+            mz_set += rng.normal(0, 0.002, (len(RT_list), 1))
+    elif spectrum_type == "discrete":
+        # centroid data: m/z slightly different in each scan
+        mz_list = np.array([300.0, 500.0, 500.3, 501.0, 700.0, 900.0])
+        mz_set = mz_list[None, :] + rng.normal(0, 0.001, (len(RT_list), len(mz_list)))
+    else:
+        raise Exception(f"unknown spectrum type: {spectrum_type}")
+    peak = np.exp(-((mz_list - 500) / 0.02) ** 2) + 0.4 * np.exp(-((mz_list - 501) / 0.02) ** 2) + 0.7 * np.exp(-((mz_list - 509.95) / 0.02) ** 2) + (mz_list > 800)
+    inten_set = (1000 + 1e5 * np.exp(-((RT_list[:, None] - 1.0) / 0.2) ** 2) * peak[None, :]).astype(np.int32)
+    if nan_tail:
+        # rows padded with np.nan (mz) and 0 (inten) on the right side, as in ndarray2d converted from ragged data
+        if spectrum_type == "continuous":
+            row_lengths = mz_set.shape[1] - 7 * (np.arange(len(RT_list)) % 4)
+        elif spectrum_type == "discrete":
+            # odd rows only have the point at m/z 500
+            row_lengths = np.where(np.arange(len(RT_list)) % 2, 1, mz_set.shape[1])
+            mz_set[1::2, 0] = mz_set[1::2, 1]
+            inten_set[1::2, 0] = inten_set[1::2, 1]
+        is_padded = np.arange(mz_set.shape[1])[None, :] >= row_lengths[:, None]
+        mz_set[is_padded] = np.nan
+        inten_set[is_padded] = 0
+    rpd = db.RPD(
+        data_hash=b"0" * 64,
+        file_path=Path("sample.rpd"),
+        spectrum_type=spectrum_type,
+        mz_set=mz_set,
+        inten_set=inten_set,
+        RT_list=RT_list,
+        RT_unit="min",
+        spectrum_settings_dict={},
+        ionization_type="",
+        analyzer_type="",
+    )
+    rpd.mz_set_info_for_chromatogram_extraction, rpd.ref_row = rpd.get_mz_set_info_for_chromatogram_extraction()
+    return rpd
+
+window_list = [
+    (499.9, 500.1, 0.5, 1.5),
+    (499.5, 501.5, 0.0, 2.0),
+    (500.9, 501.1, 0.8, 1.2),
+    (600.0, 601.0, 0.5, 1.5),   # no data point
+    (499.9, 500.1, 1.0, 1.02),  # less than 2 RT points
+    (509.9, 511.0, 0.5, 1.5),   # reaches the np.nan padded columns (continuous)
+    (509.0, 511.0, 0.0, 2.0),
+]
+
+# plain numpy implementation of RPD.calc_chromatogram_auc
+def calc_chromatogram_auc_reference(rpd, mz_btm, mz_top, RT_btm, RT_top, calc_minimum_info):
+    RT_idx_btm, RT_idx_top = np.searchsorted(rpd.RT_list, [RT_btm, RT_top], side="right")
+    if RT_idx_top - RT_idx_btm < 2:
+        return None
+    RT_list = rpd.RT_list[RT_idx_btm:RT_idx_top]
+    mz_set = rpd.mz_set[RT_idx_btm:RT_idx_top]
+    inten_set = rpd.inten_set[RT_idx_btm:RT_idx_top]
+    is_in = (mz_btm <= mz_set) & (mz_set <= mz_top)
+    xic = np.where(is_in, inten_set, 0).sum(axis=1).astype(float)
+    xic[~is_in.any(axis=1)] = np.nan
+    area = ((xic[1:] + xic[:-1]) * np.diff(RT_list)).sum() / 2
+    r = {"area":area}
+    if calc_minimum_info:
+        return r
+    if rpd.spectrum_type == "continuous":
+        # average m/z of the most intense column among those covering the window
+        ref_mz_list = rpd.mz_set[rpd.ref_row]
+        mz_btm_idx_on_ref_row = max(np.searchsorted(ref_mz_list, mz_btm, side="right") - 1, 0)
+        mz_top_idx_on_ref_row = min(np.searchsorted(ref_mz_list, mz_top, side="right"), rpd.mz_set.shape[1] - 1)
+        mz_btm_idx = rpd.mz_set_info_for_chromatogram_extraction[0, mz_btm_idx_on_ref_row]
+        mz_top_idx = rpd.mz_set_info_for_chromatogram_extraction[1, mz_top_idx_on_ref_row]
+        mz_columns = mz_set[:, mz_btm_idx:mz_top_idx + 1]
+        j = inten_set[:, mz_btm_idx:mz_top_idx + 1].sum(axis=0).argmax()
+        peaktop_mz = np.nanmean(mz_columns[:, j]) if (~np.isnan(mz_columns[:, j])).any() else np.nan
+    elif rpd.spectrum_type == "discrete":
+        # m/z of the most intense point in the window
+        peaktop_mz = mz_set[is_in][inten_set[is_in].argmax()] if is_in.any() else np.nan
+    r["area (baseline adjusted)"] = area - xic.min() * (RT_list[-1] - RT_list[0])
+    r["height"] = xic[xic.argmax()]
+    r["baseline_height"] = xic.min()
+    r["RT_btm (value used for calculation)"] = RT_list[0]
+    r["RT_top (value used for calculation)"] = RT_list[-1]
+    r["RT peaktop"] = RT_list[xic.argmax()]
+    r["mz peaktop"] = peaktop_mz
+    r["is deisotoped"] = False
+    return r
+
+# original implementation (rpd_calc.extract_chromatogram_core_float64int32 + RPD.calc_mz_inten_list_average)
+def custom_searchsorted_btm_original(array1d, threshold, ssi):
+    if threshold <= array1d[ssi]:
+        while True:
+            if ssi == 0:
+                return ssi
+            elif array1d[ssi - 1] < threshold:
+                return ssi
+            else:
+                ssi -= 1
+    else:
+        while True:
+            if len(array1d) - 1 <= ssi:
+                return len(array1d)
+            elif threshold <= array1d[ssi + 1]:
+                return ssi + 1
+            else:
+                ssi += 1
+
+def custom_searchsorted_top_original(array1d, threshold, ssi):
+    if not threshold >= array1d[ssi]:
+        while True:
+            if ssi == 0:
+                return ssi
+            elif array1d[ssi - 1] <= threshold:
+                return ssi
+            else:
+                ssi -= 1
+    else:
+        while True:
+            if len(array1d) - 1 <= ssi:
+                return len(array1d)
+            elif threshold < array1d[ssi + 1]:
+                return ssi + 1
+            else:
+                ssi += 1
+
+def extract_chromatogram_core_original(mz_btm, mz_top, mz_set, inten_set):
+    # thresholds were passed as C float
+    mz_btm, mz_top = float(np.float32(mz_btm)), float(np.float32(mz_top))
+    result_inten_list = np.zeros(mz_set.shape[0], dtype=np.float64)
+    left_idx = 0
+    right_idx = mz_set.shape[1] - 1
+    i_max = mz_set.shape[0] - 1
+    for i in range(mz_set.shape[0]):
+        left_idx = custom_searchsorted_btm_original(mz_set[i, :], mz_btm, left_idx)
+        right_idx = custom_searchsorted_top_original(mz_set[i, :], mz_top, right_idx)
+        if not left_idx < right_idx:
+            result_inten_list[i] = np.nan
+        else:
+            result_inten_list[i] = inten_set[i, left_idx:right_idx].sum()
+        right_idx = min(right_idx, i_max)
+        left_idx = min(left_idx, i_max)
+    return result_inten_list
+
+def calc_peaktop_mz_original(rpd, mz_btm, mz_top, RT_btm, RT_top):
+    RT_idx_btm, RT_idx_top = np.searchsorted(rpd.RT_list, [RT_btm, RT_top], side="right")
+    mz_btm_idx, mz_top_idx = (i[0] for i in rpd.get_mz_idx_range_list([mz_btm], [mz_top]))
+    mz_list = rpd.mz_set[RT_idx_btm:RT_idx_top, mz_btm_idx:mz_top_idx + 1].flatten(order="F")
+    inten_list = rpd.inten_set[RT_idx_btm:RT_idx_top, mz_btm_idx:mz_top_idx + 1].flatten(order="F")
+    mz_list, inten_list = db.RPD.calc_mz_inten_list_average(mz_list, inten_list, RT_idx_top - RT_idx_btm)
+    return mz_list[np.argmax(inten_list)]
+
+@pytest.mark.parametrize("spectrum_type", ["continuous", "discrete"])
+@pytest.mark.parametrize("nan_tail", [False, True])
+@pytest.mark.parametrize("calc_minimum_info", [True, False])
+@pytest.mark.parametrize("num_threads", [1, 4])
+def test_same_as_reference(spectrum_type, nan_tail, calc_minimum_info, num_threads):
+    rpd = open_rpd(spectrum_type, nan_tail)
+    for window, r in zip(window_list, rpd.calc_chromatogram_auc_list(window_list, calc_minimum_info, num_threads)):
+        expected = calc_chromatogram_auc_reference(rpd, *window, calc_minimum_info)
+        if expected is None:
+            assert r is None
+            continue
+        assert r.keys() == expected.keys()
+        for k in r.keys():
+            assert r[k] == pytest.approx(expected[k], rel=1e-12, nan_ok=True), (window, k)
+
+def test_discrete_xic_where_original_search_failed():
+    # The original kernel kept the search position of the previous row, which lies in the np.nan padding of the odd rows
+    # (they only have the point at m/z 500), and returned np.nan for them. Those rows are now extracted.
+    # (The RT range is narrow: with more rows than columns, the original read past the end of the row in the next row.)
+    rpd = open_rpd("discrete", nan_tail=True)
+    mz_btm, mz_top, RT_btm, RT_top = 499.9, 500.1, 0.9, 1.1
+    RT_idx_btm, RT_idx_top = np.searchsorted(rpd.RT_list, [RT_btm, RT_top], side="right")
+    mz_set, inten_set = rpd.mz_set[RT_idx_btm:RT_idx_top], rpd.inten_set[RT_idx_btm:RT_idx_top]
+    assert mz_set.shape[0] < mz_set.shape[1]
+    xic_original = extract_chromatogram_core_original(mz_btm, mz_top, mz_set, inten_set)
+    xic = rpd.extract_chromatograms_core_in_windows([mz_btm], [mz_top], [RT_idx_btm], [RT_idx_top], [0], [-1])[0]
+    expected = np.where((mz_btm <= mz_set) & (mz_set <= mz_top), inten_set, 0).sum(axis=1)
+    np.testing.assert_array_equal(xic, expected)
+    # odd rows following a full row
+    is_nan_original = (np.arange(RT_idx_btm, RT_idx_top) % 2 == 1) & (np.arange(mz_set.shape[0]) > 0)
+    assert is_nan_original.any()
+    assert np.isnan(xic_original[is_nan_original]).all()
+    np.testing.assert_array_equal(xic_original[~is_nan_original], expected[~is_nan_original])
+    r = rpd.calc_chromatogram_auc(mz_btm, mz_top, RT_btm, RT_top, calc_minimum_info=False)
+    assert r["area"] == pytest.approx(calc_chromatogram_auc_reference(rpd, mz_btm, mz_top, RT_btm, RT_top, False)["area"], rel=1e-12)
+    assert np.isfinite(r["baseline_height"])
+
+def test_continuous_peaktop_mz_near_nan_tail():
+    # The original "mz peaktop" averaged the sorted m/z values in groups of len(RT) (np.nan sorted last),
+    # so the groups near the np.nan padded columns mixed neighbouring columns. It is now the average of the column.
+    rpd = open_rpd("continuous", nan_tail=True)
+    window = window_list[5]
+    r = rpd.calc_chromatogram_auc(*window, calc_minimum_info=False)
+    expected = calc_chromatogram_auc_reference(rpd, *window, calc_minimum_info=False)
+    assert r["mz peaktop"] == pytest.approx(expected["mz peaktop"], rel=1e-12)
+    assert r["mz peaktop"] == pytest.approx(509.95, abs=0.005)
+    # shifted by up to one column (0.01) from the original
+    assert 0 < abs(r["mz peaktop"] - calc_peaktop_mz_original(rpd, *window)) < 0.01
+    # without np.nan padding, both are the average of the same column
+    rpd = open_rpd("continuous")
+    r = rpd.calc_chromatogram_auc(*window_list[1], calc_minimum_info=False)
+    assert r["mz peaktop"] == pytest.approx(calc_peaktop_mz_original(rpd, *window_list[1]), rel=1e-12)
+
+@pytest.mark.parametrize("storage", ["ndarray2d", "ragged"])
+def test_chromatogram_equals_extract_chromatogram(storage):
+    rpd = open_rpd("discrete")
+    if storage == "ragged":
+        row_lengths = np.full(rpd.mz_set.shape[0], rpd.mz_set.shape[1])
+        rpd.mz_set = db.RaggedArray.from_row_lengths(rpd.mz_set.flatten(), row_lengths)
+        rpd.inten_set = db.RaggedArray.from_row_lengths(rpd.inten_set.flatten(), row_lengths)
+        rpd.storage = "ragged"
+    for window, r in zip(window_list[:3], rpd.calc_chromatogram_auc_list(window_list[:3], False)):
+        (RT_list, xic), _ = rpd.extract_chromatogram(*window[:2])
+        is_in = (r["RT_btm (value used for calculation)"] <= RT_list) & (RT_list <= r["RT_top (value used for calculation)"])
+        assert r["height"] == xic[is_in].max()
+        assert r["baseline_height"] == xic[is_in].min()
+
+def test_discrete_peaktop_mz_is_in_window():
+    rpd = open_rpd("discrete")
+    for (mz_btm, mz_top, RT_btm, RT_top), r in zip(window_list[:3], rpd.calc_chromatogram_auc_list(window_list[:3], False)):
+        # m/z of the most intense point in the window (not affected by the intense peaks outside of it)
+        RT_idx_btm, RT_idx_top = np.searchsorted(rpd.RT_list, [RT_btm, RT_top], side="left")[0], np.searchsorted(rpd.RT_list, RT_top, side="right")
+        mz_set = rpd.mz_set[RT_idx_btm:RT_idx_top]
+        inten_set = np.where((mz_btm <= mz_set) & (mz_set <= mz_top), rpd.inten_set[RT_idx_btm:RT_idx_top], -1)
+        assert mz_btm <= r["mz peaktop"] <= mz_top
+        assert r["mz peaktop"] == mz_set.flatten()[inten_set.argmax()]
+
+def test_continuous_peaktop_mz():
+    rpd = open_rpd("continuous")
+    r = rpd.calc_chromatogram_auc_list([window_list[1]], False)[0]
+    assert r["mz peaktop"] == pytest.approx(500.0, abs=0.005)
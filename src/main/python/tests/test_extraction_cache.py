@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+import types
+from pathlib import Path
+import numpy as np
+import pytest
+
+pytest.importorskip("PyQt6")
+from Modules.MVP import database as db
+from Modules.MVP import model
+
+class Deisotoping():    # single target (cf. deisotoping.Deisotoping)
+    def __init__(self, mz, RT):
+        self.mz = mz
+        self.RT = RT
+    def count(self):
+        return 1
+    def get_deisotoping_info(self, i):
+        relative_atomic_mass_list = np.array([self.mz, self.mz + 1.00335, self.mz + 2.0067])
+        isotopic_composition_list = np.array([1.0, 0.3, 0.05])
+        return relative_atomic_mass_list, isotopic_composition_list, types.SimpleNamespace(RT=self.RT, RT_range=0.5, mz_range=0.2)
+
+def open_rpd():
+    # profile data with the isotope pattern of m/z 500 around RT 1.0 (same values every time, as if the same file is opened again)
+    RT_list = np.linspace(0, 2, 41)
+    mz_list = np.arange(495, 510, 0.01)
+    mz_set = np.tile(mz_list, (len(RT_list), 1))
+    peak = sum(h * np.exp(-((mz_list - 500 - 1.00335 * k) / 0.02) ** 2) for k, h in enumerate([1.0, 0.5, 0.05]))
+    inten_set = (1000 + 1e5 * np.exp(-((RT_list[:, None] - 1.0) / 0.2) ** 2) * peak[None, :]).astype(np.int32)
+    rpd = db.RPD(
+        data_hash=b"0" * 64, 
+        file_path=Path("sample.rpd"), 
+        spectrum_type="continuous", 
+        mz_set=mz_set, 
+        inten_set=inten_set, 
+        RT_list=RT_list, 
+        RT_unit="min", 
+        spectrum_settings_dict={}, 
+        ionization_type="", 
+        analyzer_type="", 
+    )
+    rpd.mz_set_info_for_chromatogram_extraction, rpd.ref_row = rpd.get_mz_set_info_for_chromatogram_extraction()
+    return rpd
+
+def new_model(rpd_list):
+    m = model.Model(main_window=None, fast_display=False)
+    m.rpd_list = rpd_list
+    m.data_hash_list = [rpd.data_hash for rpd in rpd_list]
+    return m
+
+def test_hit_returns_cached_value():
+    m = new_model([open_rpd()])
+    chromatogram = m.extract_chromatogram(500.5, 501.5, index=0)
+    assert m.extract_chromatogram(500.5, 501.5, index=0) is chromatogram
+    spectrum = m.extract_spectrum(0.8, 1.2, index=0)
+    assert m.extract_spectrum(0.8, 1.2, index=0) is spectrum
+    assert m.extraction_cache.stats()["N_hit"] == 2
+    assert m.extraction_cache.stats()["N_miss"] == 2
+
+def test_deisotoping_invalidates_cached_value():
+    rpd = open_rpd()
+    m = new_model([rpd])
+    chromatogram_before = m.extract_chromatogram(500.5, 501.5, index=0)
+    rpd.set_deisotoping(Deisotoping(500.0, 1.0))
+    chromatogram_after = m.extract_chromatogram(500.5, 501.5, index=0)
+    assert chromatogram_after is not chromatogram_before
+    np.testing.assert_array_equal(chromatogram_after[0][1], rpd.extract_chromatogram(500.5, 501.5)[0][1])
+    assert np.nansum(chromatogram_after[0][1]) < np.nansum(chromatogram_before[0][1])
+
+def test_reopened_file_does_not_share_deisotoped_value():
+    rpd_deisotoped = open_rpd()
+    m = new_model([rpd_deisotoped])
+    rpd_deisotoped.set_deisotoping(Deisotoping(500.0, 1.0))
+    chromatogram_deisotoped = m.extract_chromatogram(500.5, 501.5, index=0)
+    spectrum_deisotoped = m.extract_spectrum(0.8, 1.2, index=0)
+    # the same file opened again (same data_hash) is not deisotoped
+    rpd_reopened = open_rpd()
+    m.rpd_list.append(rpd_reopened)
+    m.data_hash_list.append(rpd_reopened.data_hash)
+    chromatogram = m.extract_chromatogram(500.5, 501.5, index=1)
+    spectrum = m.extract_spectrum(0.8, 1.2, index=1)
+    assert chromatogram is not chromatogram_deisotoped
+    assert spectrum is not spectrum_deisotoped
+    np.testing.assert_array_equal(chromatogram[0][1], rpd_reopened.extract_chromatogram(500.5, 501.5)[0][1])
+    np.testing.assert_array_equal(spectrum[0][1], rpd_reopened.extract_spectrum(0.8, 1.2)[0][1])
+    assert np.nansum(chromatogram[0][1]) > np.nansum(chromatogram_deisotoped[0][1])
+
+def test_lru_eviction_within_byte_budget():
+    cache = model.ExtractionCache(max_bytes=3 * 8000)
+    for key in range(5):
+        cache.get(key, lambda: (np.zeros(500), np.zeros(500)))
+    assert list(cache.cache) == [2, 3, 4]
+    assert cache.nbytes == 3 * 8000
+    cache.get(2, lambda: None)
+    cache.get(5, lambda: np.zeros(1000))
+    assert list(cache.cache) == [4, 2, 5]
+    # larger than the budget: returned, but not kept
+    value = cache.get(6, lambda: np.zeros(10000))
+    assert len(value) == 10000
+    assert 6 not in cache.cache
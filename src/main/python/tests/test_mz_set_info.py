@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from Modules.MVP import database as db
+
+# original implementation of RPD.get_mz_set_info_for_chromatogram_extraction_core
+def get_mz_set_info_for_chromatogram_extraction_core_original(mz_set, ref_row):
+    mz_set_info_for_chromatogram_extraction = np.empty((2, mz_set.shape[1]), dtype=int)
+    for i in range(mz_set.shape[1]):
+        # btm
+        j = 1
+        while True:
+            idx_btm = i - j
+            if idx_btm < 0:
+                mz_set_info_for_chromatogram_extraction[0, i] = 0
+                break
+            if (mz_set[:, idx_btm] < mz_set[ref_row, i]).all():
+                mz_set_info_for_chromatogram_extraction[0, i] = idx_btm + 1
+                break
+            else:
+                j += 1
+        # top
+        j = 1
+        while True:
+            idx_top = i + j
+            if idx_top > mz_set.shape[1] - 1:
+                mz_set_info_for_chromatogram_extraction[1, i] = mz_set.shape[1] - 1
+                break
+            if (mz_set[ref_row, i] < mz_set[:, idx_top]).all():
+                mz_set_info_for_chromatogram_extraction[1, i] = idx_top - 1
+                break
+            else:
+                j += 1
+    return mz_set_info_for_chromatogram_extraction
+
+def random_mz_set(rng, trial):
+    N_scan = rng.integers(1, 8)
+    N_col = rng.integers(1, 60)
+    if trial % 3 == 0:  # many ties
+        base = np.sort(rng.choice(rng.integers(1, 40), N_col) * 1.0)
+    else:
+        base = np.sort(rng.uniform(100, 110, N_col))
+    mz_set = base[None, :] + rng.normal(0, rng.choice([0, 0.01, 0.3, 2]), (N_scan, N_col))
+    if trial % 5 == 0:  # ties after rounding
+        mz_set = np.round(mz_set, 1)
+    mz_set.sort(axis=1)
+    # np.nan padding (except for ref_row)
+    ref_row = rng.integers(N_scan)
+    for r in range(N_scan):
+        if (r != ref_row) and (rng.random() < 0.4):
+            mz_set[r, rng.integers(0, N_col + 1):] = np.nan
+    return mz_set, ref_row
+
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_same_as_original(dtype):
+    rng = np.random.default_rng(0)
+    for trial in range(1000):
+        mz_set, ref_row = random_mz_set(rng, trial)
+        mz_set = mz_set.astype(dtype)
+        expected = get_mz_set_info_for_chromatogram_extraction_core_original(mz_set, ref_row)
+        result = db.RPD.get_mz_set_info_for_chromatogram_extraction_core(mz_set, ref_row)
+        assert result.dtype == expected.dtype
+        np.testing.assert_array_equal(result, expected, err_msg=f"trial {trial}")
+
+def test_same_as_loop():
+    rng = np.random.default_rng(1)
+    for trial in range(1000):
+        mz_set, ref_row = random_mz_set(rng, trial)
+        args = (mz_set[ref_row], mz_set.min(axis=0), mz_set.max(axis=0))
+        np.testing.assert_array_equal(
+            db.RPD.get_mz_set_info_for_chromatogram_extraction_from_column_range(*args),
+            db.RPD.get_mz_set_info_for_chromatogram_extraction_from_column_range_loop(*args),
+            err_msg=f"trial {trial}",
+        )
+
+def test_unsorted_ref_row():
+    # searchsorted does not apply (falls back to the loop)
+    rng = np.random.default_rng(2)
+    for trial in range(200):
+        mz_set, ref_row = random_mz_set(rng, trial)
+        rng.shuffle(mz_set[ref_row])
+        np.testing.assert_array_equal(
+            db.RPD.get_mz_set_info_for_chromatogram_extraction_core(mz_set, ref_row),
+            get_mz_set_info_for_chromatogram_extraction_core_original(mz_set, ref_row),
+            err_msg=f"trial {trial}",
+        )